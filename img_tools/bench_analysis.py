@@ -0,0 +1,106 @@
+"""
+Micro-benchmark for img_exif.analyze_image.
+
+Compares the single-pass region-means kernel (single image and batched)
+against the previous implementation, which built BGR and grayscale copies
+and reduced each region separately, on 4K and 12 MP inputs.
+
+Usage:
+    python bench_analysis.py --repeat 5 --batch 8
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from img_exif import analyze_image, analyze_images_batch
+
+SIZES = {
+    "4K (3840x2160)": (3840, 2160),
+    "12MP (4032x3024)": (4032, 3024),
+}
+
+
+def analyze_image_reference(img):
+    """The original implementation, kept for comparison."""
+    img_cv = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+    height, width = img_cv.shape[:2]
+    gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
+    avg_brightness = np.mean(gray)
+    avg_color = np.mean(img_cv, axis=(0, 1))
+    center_region = gray[
+        height // 3 : 2 * height // 3, width // 3 : 2 * width // 3
+    ]
+    edge_brightness = np.mean(
+        [
+            np.mean(gray[0 : height // 4, :]),
+            np.mean(gray[3 * height // 4 :, :]),
+            np.mean(gray[:, 0 : width // 4]),
+            np.mean(gray[:, 3 * width // 4 :]),
+        ]
+    )
+    center_brightness = np.mean(center_region)
+    return avg_brightness, avg_color, center_brightness, edge_brightness
+
+
+def make_image(size, seed):
+    rng = np.random.default_rng(seed)
+    width, height = size
+    # Smooth gradient plus noise, closer to a photo than pure noise
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = (x + y) / 2
+    rgb = np.stack([base, base * 0.8, 255 - base], axis=-1)
+    rgb += rng.normal(0, 12, rgb.shape).astype(np.float32)
+    return Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8))
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark analyze_image")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=8)
+    args = parser.parse_args()
+
+    for label, size in SIZES.items():
+        img = make_image(size, seed=0)
+        batch = np.stack(
+            [np.asarray(make_image(size, seed=i)) for i in range(args.batch)]
+        )
+
+        # analyze_image prints a summary line per call, keep output readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            reference = best_of(
+                lambda: analyze_image_reference(img), args.repeat
+            )
+            single = best_of(lambda: analyze_image(img), args.repeat)
+        batched = best_of(lambda: analyze_images_batch(batch), args.repeat)
+        per_image = batched / args.batch
+
+        print(f"{label}")
+        print(f"  reference        {reference * 1000:8.1f} ms/img")
+        print(
+            f"  single-pass      {single * 1000:8.1f} ms/img "
+            f"({reference / single:.1f}x)"
+        )
+        print(
+            f"  batched (n={args.batch:<2})   {per_image * 1000:8.1f} ms/img "
+            f"({reference / per_image:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Benchmark captioning backends.
+
+Runs the captioning pipeline (img_desc.caption_image_dataset) over a
+synthetic image set against the offline stub backend and against the
+Ollama backend pointed at a local HTTP stand-in server, and reports
+throughput, latency and tokens per image for each. Every backend is run
+once with single-image requests and once in batched multi-image mode.
+
+Usage:
+    python bench_caption.py --images 200 --latency 0.05 --batch-size 8
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+from caption_backends import create_model, get_backend
+from caption_manifest import MANIFEST_NAME
+from img_desc import caption_image_dataset
+from img_preprocess import PreprocessOptions
+from metrics import METRICS
+from prompt_templates import DEFAULT_PROMPT_PATH, PromptTemplate, render_prompt
+
+# Stand-in for prompts/LORA.md when it isn't there. Batching pays off by
+# sending the prompt once per request, so it has to be about as long as
+# the real instructions for the token numbers to mean anything.
+BENCH_PROMPT = """You are captioning images for a LoRA training dataset.
+The subject of the dataset is referred to by the trigger word
+"{trigger_word}". Write one caption per image following these rules.
+
+Start the caption with the trigger word, followed by a comma. Never
+describe the fixed identity of the subject: its face, eye colour, hair
+colour, skin tone, body shape, age or ethnicity are learned by the LoRA
+and must not appear in the caption. Do describe everything that changes
+from image to image, so the model learns to separate it from the subject.
+
+Describe, in this order and as comma separated phrases:
+1. The shot type and camera angle, e.g. close-up, medium shot, full body,
+   from below, from above, over the shoulder.
+2. The pose and what the subject is doing, e.g. sitting on a bench,
+   looking away, holding a cup with both hands, mid-stride.
+3. Clothing and accessories with colours and materials, e.g. red wool
+   scarf, denim jacket, silver hoop earrings, no glasses.
+4. The facial expression, e.g. smiling with closed lips, neutral,
+   laughing, frowning slightly.
+5. The setting and background, e.g. city street at night, plain white
+   studio backdrop, kitchen with wooden cabinets, blurred park.
+6. The lighting, e.g. soft window light from the left, harsh midday sun,
+   neon rim light, low key studio lighting.
+7. The medium and style when it isn't a photograph, e.g. pencil sketch,
+   3d render, watercolor painting, anime screenshot.
+
+Use plain, concrete words and avoid subjective ones such as beautiful,
+stunning or amazing. Do not guess at things that are not visible, do not
+mention the image quality, watermarks or text unless they are prominent,
+and do not use full sentences. Keep the caption under 60 words.
+
+Example: {trigger_word}, medium shot from slightly below, standing on a
+rooftop with arms crossed, black leather jacket over a white t-shirt,
+faint smile, city skyline at dusk behind, warm backlight from the setting
+sun, photograph.
+
+Respond with the caption only."""
+
+
+def make_images(directory, count, size=(1024, 768)):
+    for i in range(count):
+        color = (i * 37 % 256, i * 91 % 256, i * 53 % 256)
+        Image.new("RGB", size, color).save(
+            os.path.join(directory, f"img_{i:05d}.jpg"), quality=90
+        )
+
+
+def clear_captions(directory):
+    """Remove the captions and job manifest of a previous run."""
+    for file in os.listdir(directory):
+        if file.endswith(".txt") or file == MANIFEST_NAME:
+            os.remove(os.path.join(directory, file))
+
+
+def start_ollama_stand_in(latency):
+    """
+    Serve a minimal Ollama `/api/chat` endpoint on a random local port.
+
+    Returns:
+        tuple: (server, base_url)
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            request = json.loads(body)
+            time.sleep(latency)
+            images = sum(
+                len(m.get("images") or []) for m in request["messages"]
+            )
+            words = sum(len(m["content"].split()) for m in request["messages"])
+            content = f"a photo with {images} image(s)"
+            if images > 1:
+                content = json.dumps([content] * images)
+            payload = json.dumps(
+                {
+                    "model": request["model"],
+                    "created_at": "2025-01-01T00:00:00Z",
+                    "message": {
+                        "role": "assistant",
+                        "content": content,
+                    },
+                    "done": True,
+                    # About one token per prompt word, as the stub counts
+                    "prompt_eval_count": words + 258 * images,
+                    "eval_count": 8 * max(images, 1),
+                }
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+class UsageTracker:
+    """
+    Wraps a chat model and sums the token usage of its responses.
+
+    `prompt_tokens` estimates the text part of the input tokens, one token
+    per word of the request's text, the way the stub backend counts.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.tokens = 0
+        self.prompt_tokens = 0
+
+    async def ainvoke(self, messages):
+        response = await self.model.ainvoke(messages)
+        usage = getattr(response, "usage_metadata", None) or {}
+        self.tokens += usage.get("total_tokens", 0)
+        self.prompt_tokens += sum(
+            len(part["text"].split())
+            for message in messages
+            for part in message.content
+            if part["type"] == "text"
+        )
+        return response
+
+
+def bench_backend(
+    label,
+    backend_name,
+    image_dir,
+    model_kwargs,
+    concurrency,
+    batch_size,
+    prompt,
+    baseline=None,
+):
+    """
+    Caption `image_dir` once and print a result line.
+
+    Args:
+        baseline: Prompt tokens per image of the single-image run, to
+            report what batching saves
+
+    Returns:
+        float: Prompt tokens per image
+    """
+    backend = get_backend(backend_name)
+    model = UsageTracker(create_model(backend_name, **model_kwargs))
+    concurrency = concurrency or backend.max_concurrency
+    batch_size = min(batch_size, backend.max_batch_size)
+
+    clear_captions(image_dir)
+    METRICS.reset()
+    # The pipeline reports every image, keep the table readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = caption_image_dataset(
+            model,
+            image_dir,
+            prompt=prompt,
+            concurrency=concurrency,
+            preprocess=PreprocessOptions(),
+            batch_size=batch_size,
+        )
+    completed = stats.completed or 1
+    tokens_per_image = model.tokens / completed
+    prompt_per_image = model.prompt_tokens / completed
+    saving = ""
+    if baseline:
+        saved = baseline - prompt_per_image
+        saving = f" (saves {saved:.1f}, {saved / baseline:.0%})"
+    print(
+        f"{label:<24} batch={batch_size:<3} concurrency={concurrency:<3} "
+        f"tokens/img={tokens_per_image:.1f} "
+        f"prompt tokens/img={prompt_per_image:.1f}{saving}"
+    )
+    print(f"{'':<24} {stats.summary()}")
+    return prompt_per_image
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark caption backends")
+    parser.add_argument("--images", type=int, default=100)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="Simulated model latency per request in seconds",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="Override each backend's concurrency limit",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=8,
+        help="Images per request in batched mode (capped per backend)",
+    )
+    parser.add_argument(
+        "--prompt",
+        default=DEFAULT_PROMPT_PATH,
+        help="Prompt template (a built-in LoRA prompt if it doesn't exist)",
+    )
+    args = parser.parse_args()
+
+    if os.path.exists(args.prompt):
+        prompt = render_prompt(args.prompt, trigger_word="ohmyra")
+    else:
+        print(f"{args.prompt} not found, using the built-in LoRA prompt")
+        prompt = PromptTemplate("<bench>", BENCH_PROMPT).render(
+            trigger_word="ohmyra"
+        )
+    print(f"Prompt: {len(prompt.split())} words")
+
+    with tempfile.TemporaryDirectory() as image_dir:
+        make_images(image_dir, args.images)
+
+        baseline = None
+        for batch_size in (1, args.batch_size):
+            prompt_tokens = bench_backend(
+                "stub",
+                "stub",
+                image_dir,
+                {"latency": args.latency},
+                args.concurrency,
+                batch_size,
+                prompt,
+                baseline,
+            )
+            baseline = baseline or prompt_tokens
+
+        server, url = start_ollama_stand_in(args.latency)
+        try:
+            baseline = None
+            for batch_size in (1, args.batch_size):
+                prompt_tokens = bench_backend(
+                    "ollama (local stand-in)",
+                    "ollama",
+                    image_dir,
+                    {"host": url},
+                    args.concurrency,
+                    batch_size,
+                    prompt,
+                    baseline,
+                )
+                baseline = baseline or prompt_tokens
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Benchmark the EXIF write paths of img_exif.
+
+For a sample set of synthetic JPEG and PNG photos it times:
+
+  decode full   load_image(FULL), what the re-encode path needs
+  decode stats  load_image(STATS), enough for analysis and detection
+  re-encode     flatten and save as PNG with EXIF (the default path)
+  inject        metadata-only EXIF insertion into a copy of the file
+
+Subject detection is the same for both paths and is left out.
+
+It then times generating the EXIF itself for `--exif-count` images, with
+create_exif_data + piexif.dump (the single-image path) and with an
+ExifBatch, which the folder mode uses to patch a shared template.
+
+Usage:
+    python bench_exif.py --count 4 --repeat 3
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+
+import piexif
+
+from bench_analysis import SIZES, make_image
+from exif_inject import inject_exif
+from img_exif import DEFAULT_IMAGE_ANALYSIS, ExifBatch, create_exif_data
+from img_load import FULL, STATS, load_image
+
+
+def make_samples(folder, count):
+    """Write `count` JPEGs and PNGs per benchmark size into `folder`."""
+    samples = {}
+    for label, size in SIZES.items():
+        for ext, save_kwargs in ((".jpg", {"quality": 90}), (".png", {})):
+            paths = []
+            for i in range(count):
+                path = os.path.join(folder, f"{size[0]}x{size[1]}_{i}{ext}")
+                make_image(size, seed=i).save(path, **save_kwargs)
+                paths.append(path)
+            samples[f"{label} {ext[1:].upper()}"] = paths
+    return samples
+
+
+def sample_exif():
+    return piexif.dump(
+        {
+            "0th": {piexif.ImageIFD.Make: b"Apple"},
+            "Exif": {piexif.ExifIFD.ISOSpeedRatings: 100},
+        }
+    )
+
+
+def reencode(path, output_path, exif_bytes):
+    with load_image(path, FULL).image as img:
+        img.convert("RGB").save(output_path, "PNG", exif=exif_bytes)
+
+
+def decode(path, resolution):
+    load_image(path, resolution).image.close()
+
+
+def time_paths(fn, paths, repeat):
+    """Best-of-`repeat` mean seconds per file."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in paths:
+            fn(path)
+        elapsed = (time.perf_counter() - start) / len(paths)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def time_exif_generation(count):
+    """
+    Seconds per image to generate EXIF with piexif and with an ExifBatch.
+
+    Returns:
+        tuple: (piexif seconds, template seconds)
+    """
+    rng = random.Random(0)
+    # create_exif_data prints the camera settings of every image
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(count):
+            piexif.dump(
+                create_exif_data(image_analysis=DEFAULT_IMAGE_ANALYSIS, rng=rng)
+            )
+        dump = (time.perf_counter() - start) / count
+
+    batch = ExifBatch()
+    start = time.perf_counter()
+    for _ in range(count):
+        batch.generate(DEFAULT_IMAGE_ANALYSIS, rng=rng)
+    template = (time.perf_counter() - start) / count
+    return dump, template
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark EXIF write paths")
+    parser.add_argument("--count", type=int, default=4, help="Files per set")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--exif-count",
+        type=int,
+        default=2000,
+        help="Images to generate EXIF for",
+    )
+    args = parser.parse_args()
+
+    exif_bytes = sample_exif()
+    with tempfile.TemporaryDirectory() as folder:
+        samples = make_samples(folder, args.count)
+        out_png = os.path.join(folder, "out.png")
+
+        for label, paths in samples.items():
+            out_same = os.path.join(
+                folder, "out" + os.path.splitext(paths[0])[1]
+            )
+            full = time_paths(lambda p: decode(p, FULL), paths, args.repeat)
+            stats = time_paths(lambda p: decode(p, STATS), paths, args.repeat)
+            encode = time_paths(
+                lambda p: reencode(p, out_png, exif_bytes), paths, args.repeat
+            )
+            inject = time_paths(
+                lambda p: inject_exif(exif_bytes, p, out_same),
+                paths,
+                args.repeat,
+            )
+
+            print(label)
+            print(f"  decode full    {full * 1000:8.1f} ms/img")
+            print(f"  decode stats   {stats * 1000:8.1f} ms/img")
+            print(f"  re-encode      {encode * 1000:8.1f} ms/img")
+            print(
+                f"  inject         {inject * 1000:8.1f} ms/img "
+                f"({encode / inject:.0f}x faster than re-encode)"
+            )
+
+    dump, template = time_exif_generation(args.exif_count)
+    print(f"EXIF generation ({args.exif_count} images)")
+    print(f"  piexif.dump    {dump * 1e6:8.1f} us/img")
+    print(
+        f"  ExifBatch      {template * 1e6:8.1f} us/img "
+        f"({dump / template:.1f}x faster)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Registry of captioning backends.
+
+Each backend declares how many images it accepts per request and how many
+requests it can serve concurrently, and provides a factory returning a
+chat model exposing `invoke` / `ainvoke` over a list of HumanMessages.
+"""
+
+import asyncio
+import getpass
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from dotenv import load_dotenv
+from langchain_core.messages import AIMessage
+
+
+@dataclass(frozen=True)
+class Backend:
+    name: str
+    factory: Callable
+    max_batch_size: int = 1
+    max_concurrency: int = 4
+
+
+BACKENDS = {}
+
+
+def register_backend(name, max_batch_size=1, max_concurrency=4):
+    def decorator(factory):
+        BACKENDS[name] = Backend(name, factory, max_batch_size, max_concurrency)
+        return factory
+
+    return decorator
+
+
+def get_backend(name) -> Backend:
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown backend {name}, expected one of {sorted(BACKENDS)}"
+        )
+    return BACKENDS[name]
+
+
+def create_model(name, **kwargs):
+    return get_backend(name).factory(**kwargs)
+
+
+def _set_env(var: str):
+    load_dotenv()
+    if not os.environ.get(var):
+        os.environ[var] = getpass.getpass(f"{var}: ")
+
+
+def _split_message_content(messages):
+    """
+    Flatten HumanMessage content parts into (text, [base64 images]).
+    """
+    texts, images = [], []
+    for message in messages:
+        content = message.content
+        if isinstance(content, str):
+            texts.append(content)
+            continue
+        for part in content:
+            if part["type"] == "text":
+                texts.append(part["text"])
+            elif part["type"] == "image_url":
+                url = part["image_url"]["url"]
+                images.append(url.split(",", 1)[1] if "," in url else url)
+    return "\n".join(texts), images
+
+
+@register_backend("gemini", max_batch_size=8, max_concurrency=8)
+def get_chat_gemini(model="gemini-2.5-flash"):
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    _set_env("GOOGLE_API_KEY")
+    return ChatGoogleGenerativeAI(
+        model=model, api_key=os.getenv("GOOGLE_API_KEY")
+    )
+
+
+class OllamaChatModel:
+    """
+    Minimal chat model adapter over the `ollama` client.
+
+    Args:
+        model: Ollama model name (must support images)
+        host: Ollama server URL (defaults to OLLAMA_HOST / localhost)
+    """
+
+    def __init__(self, model="llava", host=None):
+        import ollama
+
+        self.model = model
+        self._client = ollama.Client(host=host)
+        self._async_client = ollama.AsyncClient(host=host)
+
+    def _request(self, messages):
+        text, images = _split_message_content(messages)
+        return [{"role": "user", "content": text, "images": images}]
+
+    @staticmethod
+    def _to_message(response):
+        input_tokens = response.get("prompt_eval_count") or 0
+        output_tokens = response.get("eval_count") or 0
+        return AIMessage(
+            content=response["message"]["content"],
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        )
+
+    def invoke(self, messages):
+        response = self._client.chat(
+            model=self.model, messages=self._request(messages)
+        )
+        return self._to_message(response)
+
+    async def ainvoke(self, messages):
+        response = await self._async_client.chat(
+            model=self.model, messages=self._request(messages)
+        )
+        return self._to_message(response)
+
+
+@register_backend("ollama", max_batch_size=4, max_concurrency=2)
+def get_chat_ollama(model="llava", host=None):
+    return OllamaChatModel(model=model, host=host)
+
+
+class StubChatModel:
+    """
+    Offline deterministic chat model.
+
+    Each caption is derived from a hash of the image, so the same image
+    always gets the same caption. Requests with several images are answered
+    with a JSON array, one caption per image.
+
+    Args:
+        model: Identifier reported to the caption cache
+        latency: Simulated request latency in seconds
+    """
+
+    def __init__(self, model="stub", latency=0.0):
+        self.model = model
+        self.latency = latency
+
+    def _respond(self, messages):
+        text, images = _split_message_content(messages)
+        captions = []
+        for image in images or [""]:
+            digest = hashlib.sha256(image.encode("ascii"))
+            captions.append(f"a photo, stub caption {digest.hexdigest()[:12]}")
+        content = json.dumps(captions) if len(images) > 1 else captions[0]
+        input_tokens = len(text.split()) + 258 * len(images)
+        output_tokens = 6 * len(captions)
+        return AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        )
+
+    def invoke(self, messages):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(messages)
+
+    async def ainvoke(self, messages):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(messages)
+
+
+@register_backend("stub", max_batch_size=16, max_concurrency=32)
+def get_chat_stub(model="stub", latency=0.0):
+    return StubChatModel(model=model, latency=latency)
@@ -0,0 +1,78 @@
+"""
+Helpers for batched multi-image captioning.
+
+Several images are packed into a single request that repeats the prompt
+only once and asks for a JSON array with one caption per image. Responses
+that cannot be split back into exactly one caption per image are
+rejected so the caller can fall back to single-image requests.
+"""
+
+import json
+import re
+from itertools import islice
+
+from langchain_core.messages import HumanMessage
+
+BATCH_INSTRUCTIONS = (
+    "\n\nYou will receive {count} images, labelled Image 1 to Image {count}. "
+    "Apply the instructions above to each image independently. Respond "
+    "with only a JSON array of {count} strings, where element i is the "
+    "caption for Image i. Do not add any other text."
+)
+
+_CODE_FENCE_RE = re.compile(r"^```(?:json)?\s*(.*?)\s*```$", re.DOTALL)
+
+
+def chunked(iterable, size):
+    """Yield lists of up to `size` items from `iterable`."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def build_batch_message(image_urls, prompt):
+    """
+    Args:
+        image_urls: Data URLs of the images, see
+            img_preprocess.get_image_data_url
+    """
+    content = [
+        {
+            "type": "text",
+            "text": prompt + BATCH_INSTRUCTIONS.format(count=len(image_urls)),
+        }
+    ]
+    for i, image_url in enumerate(image_urls, 1):
+        content.append({"type": "text", "text": f"Image {i}:"})
+        content.append({"type": "image_url", "image_url": {"url": image_url}})
+    return HumanMessage(content=content)
+
+
+def parse_batch_response(content, count):
+    """
+    Split a batched response into `count` captions.
+
+    Returns:
+        list: Captions in image order, or None if the response is malformed
+    """
+    if not isinstance(content, str):
+        return None
+    text = content.strip()
+    fenced = _CODE_FENCE_RE.match(text)
+    if fenced:
+        text = fenced.group(1)
+
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+
+    if isinstance(data, dict):
+        data = data.get("captions")
+    if not isinstance(data, list) or len(data) != count:
+        return None
+    if not all(
+        isinstance(caption, str) and caption.strip() for caption in data
+    ):
+        return None
+    return [caption.strip() for caption in data]
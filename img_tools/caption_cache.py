@@ -0,0 +1,255 @@
+"""
+Content-addressed caption cache.
+
+Captions are stored in SQLite keyed by the SHA-256 of the image bytes, the
+SHA-256 of the rendered prompt and the model id, so renamed, moved or
+duplicated images are captioned only once per prompt/model combination.
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from prompt_templates import render_prompt
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(BASE_DIR), "data", "caption_cache.sqlite"
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS captions (
+    image_hash TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    model_id TEXT NOT NULL,
+    caption TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (image_hash, prompt_hash, model_id)
+);
+CREATE INDEX IF NOT EXISTS captions_last_used ON captions (last_used);
+"""
+
+# The cache may grow this fraction past max_entries before it is trimmed,
+# so eviction runs once per batch of inserts instead of after every put
+EVICT_MARGIN = 0.1
+
+
+class CacheKey(NamedTuple):
+    image_hash: str
+    prompt_hash: str
+    model_id: str
+
+
+def hash_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_text(text: str):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def get_model_id(model):
+    """Best-effort identifier for a chat model instance."""
+    for attr in ("model", "model_name"):
+        value = getattr(model, attr, None)
+        if isinstance(value, str) and value:
+            return value
+    return type(model).__name__
+
+
+class CaptionCache:
+    """
+    SQLite-backed caption cache with LRU eviction.
+
+    Entries are evicted in batches: once the cache holds more than
+    `max_entries` plus EVICT_MARGIN, it is trimmed back to `max_entries`.
+
+    Args:
+        path: Database file path
+        max_entries: Keep about this many entries (None for unbounded)
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=None):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._evict_at = None
+        if max_entries is not None:
+            self._evict_at = max_entries + max(
+                1, int(max_entries * EVICT_MARGIN)
+            )
+            # Upper bound of the entry count, replaced entries count twice
+            self._count = len(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def make_key(self, image_path, prompt, model_id, image_hash=None):
+        """`image_hash` skips hashing the file when it is already known."""
+        return CacheKey(
+            image_hash or hash_file(image_path), hash_text(prompt), model_id
+        )
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT caption FROM captions WHERE image_hash = ? "
+                "AND prompt_hash = ? AND model_id = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE captions SET last_used = ? WHERE image_hash = ? "
+                "AND prompt_hash = ? AND model_id = ?",
+                (time.time(), *key),
+            )
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: CacheKey, caption: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO captions VALUES (?, ?, ?, ?, ?, ?)",
+                (*key, caption, now, now),
+            )
+            self._conn.commit()
+            if self._evict_at is None:
+                return
+            self._count += 1
+            if self._count <= self._evict_at:
+                return
+        self.evict(self.max_entries)
+
+    def evict(self, max_entries: int) -> int:
+        """Drop least recently used entries beyond `max_entries`."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM captions WHERE rowid IN (SELECT rowid FROM "
+                "captions ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (max_entries,),
+            )
+            self._conn.commit()
+            if self._evict_at is not None:
+                self._count = self._conn.execute(
+                    "SELECT COUNT(*) FROM captions"
+                ).fetchone()[0]
+            return cursor.rowcount
+
+    def invalidate(self, model_id=None, prompt_hash=None, image_hash=None):
+        """
+        Delete entries matching all given filters (everything if none).
+
+        Returns:
+            int: Number of deleted entries
+        """
+        filters = {
+            "model_id": model_id,
+            "prompt_hash": prompt_hash,
+            "image_hash": image_hash,
+        }
+        clauses = [f"{k} = ?" for k, v in filters.items() if v is not None]
+        params = [v for v in filters.values() if v is not None]
+        query = "DELETE FROM captions"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+            self._conn.commit()
+            return cursor.rowcount
+
+    def count_stale(self, prompt_hash, model_id) -> int:
+        """Number of entries for `model_id` captioned with another prompt."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM captions WHERE model_id = ? "
+                "AND prompt_hash != ?",
+                (model_id, prompt_hash),
+            ).fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM captions"
+            ).fetchone()[0]
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups * 100 if lookups else 0.0
+        return (
+            f"entries={len(self)} hits={self.hits} misses={self.misses} "
+            f"hit_rate={hit_rate:.1f}%"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the caption cache")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("stats", help="Show the number of cached entries")
+
+    invalidate = subparsers.add_parser(
+        "invalidate", help="Delete cached captions"
+    )
+    invalidate.add_argument("--model", help="Only entries for this model id")
+    invalidate.add_argument(
+        "--prompt", help="Only entries for this prompt template"
+    )
+    invalidate.add_argument(
+        "--trigger-word",
+        default="ohmyra",
+        help="Trigger word the prompt template was rendered with",
+    )
+    invalidate.add_argument("--image", help="Only entries for this image")
+
+    evict = subparsers.add_parser("evict", help="Apply LRU eviction")
+    evict.add_argument("max_entries", type=int)
+
+    args = parser.parse_args()
+
+    with CaptionCache(args.cache) as cache:
+        if args.command == "stats":
+            print(f"{len(cache)} cached captions in {args.cache}")
+        elif args.command == "invalidate":
+            prompt_hash = None
+            if args.prompt:
+                prompt_hash = hash_text(
+                    render_prompt(args.prompt, trigger_word=args.trigger_word)
+                )
+            removed = cache.invalidate(
+                model_id=args.model,
+                prompt_hash=prompt_hash,
+                image_hash=hash_file(args.image) if args.image else None,
+            )
+            print(f"Removed {removed} cached captions")
+        elif args.command == "evict":
+            print(f"Evicted {cache.evict(args.max_entries)} cached captions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Request throttling and run statistics for the captioning pipeline.
+
+Provides the token-bucket rate limiter the request stage awaits before
+each model call and the throughput/latency stats reported for a run.
+"""
+
+import asyncio
+import math
+import time
+from dataclasses import dataclass, field
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter for asyncio tasks.
+
+    Args:
+        rate: Tokens added per second
+        burst: Maximum number of tokens that can be held at once
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a token is available and consume it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of `values` (0 when empty)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+@dataclass
+class EngineStats:
+    completed: int = 0
+    skipped: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+    # Seconds per model call, a batch of images counts once
+    latencies: list = field(default_factory=list)
+
+    @property
+    def images_per_sec(self):
+        return self.completed / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self):
+        return (
+            f"completed={self.completed} skipped={self.skipped} "
+            f"failed={self.failed} elapsed={self.elapsed:.2f}s "
+            f"throughput={self.images_per_sec:.2f} img/s "
+            f"p50={percentile(self.latencies, 50):.3f}s "
+            f"p95={percentile(self.latencies, 95):.3f}s"
+        )
@@ -0,0 +1,121 @@
+"""
+Resumable job manifest for dataset captioning.
+
+The manifest is an append-only JSONL log next to the dataset. Every state
+change of an image (pending, done, failed) appends one line; on load the
+log is replayed and the last line per image wins. Restarting a job then
+only needs the outstanding entries instead of re-scanning every file.
+"""
+
+import json
+import os
+import threading
+import time
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+MANIFEST_NAME = ".caption_manifest.jsonl"
+
+
+def get_manifest_path(image_dir):
+    return os.path.join(image_dir, MANIFEST_NAME)
+
+
+class CaptionManifest:
+    """
+    Per-image state log for a captioning job.
+
+    Image paths are stored relative to the manifest's directory.
+
+    Args:
+        path: Manifest file path
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.base_dir = os.path.dirname(os.path.abspath(path))
+        self.entries = {}
+        # record() is called from several pipeline stages at once
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._replay()
+        self._file = open(path, "a")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def _replay(self):
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn last line from a killed process
+                    continue
+                self.entries[entry["path"]] = entry
+
+    def _key(self, image_path):
+        return os.path.relpath(os.path.abspath(image_path), self.base_dir)
+
+    def record(
+        self, image_path, state, latency=None, error=None, attempted=True
+    ):
+        """
+        Append the new state of an image.
+
+        Args:
+            attempted: Whether the image was sent to the model; `attempts`
+                only counts those, not images skipped or served from a
+                cache. Ignored for PENDING
+        """
+        key = self._key(image_path)
+        with self._lock:
+            previous = self.entries.get(key, {})
+            attempts = previous.get("attempts", 0)
+            if state != PENDING and attempted:
+                attempts += 1
+            entry = {
+                "path": key,
+                "state": state,
+                "attempts": attempts,
+                "latency": latency,
+                "error": error[:200] if error else None,
+                "updated_at": time.time(),
+            }
+            self.entries[key] = entry
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+
+    def add_pending(self, image_paths):
+        """Register new images; images already in the manifest are kept."""
+        for image_path in image_paths:
+            if self._key(image_path) not in self.entries:
+                self.record(image_path, PENDING)
+
+    def outstanding(self, pending=True, failed=False):
+        """
+        Returns:
+            list: Absolute paths of images in the requested states
+        """
+        states = {PENDING} if pending else set()
+        if failed:
+            states.add(FAILED)
+        return [
+            os.path.join(self.base_dir, key)
+            for key, entry in self.entries.items()
+            if entry["state"] in states
+        ]
+
+    def counts(self):
+        counts = {PENDING: 0, DONE: 0, FAILED: 0}
+        for entry in self.entries.values():
+            counts[entry["state"]] += 1
+        return counts
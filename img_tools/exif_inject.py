@@ -0,0 +1,102 @@
+"""
+Attach EXIF to an image file without touching its pixel data.
+
+JPEG and WebP files get their EXIF segment replaced with `piexif.insert`.
+For PNG the file is copied chunk by chunk and an eXIf chunk is written
+before the first IDAT. Both keep the original compressed image data
+byte-for-byte, so they cost a file copy rather than a decode and encode.
+"""
+
+import os
+import struct
+import zlib
+
+import piexif
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+EXIF_HEADER = b"Exif\x00\x00"
+
+# Source extension -> container whose EXIF can be replaced in place
+INJECTABLE_FORMATS = {
+    ".jpg": "JPEG",
+    ".jpeg": "JPEG",
+    ".png": "PNG",
+    ".webp": "WEBP",
+}
+
+
+def injectable_format(path):
+    """Container format of `path` if EXIF can be injected, else None."""
+    return INJECTABLE_FORMATS.get(os.path.splitext(path)[1].lower())
+
+
+def _png_chunk(chunk_type, data):
+    crc = zlib.crc32(chunk_type + data)
+    return (
+        struct.pack(">I", len(data))
+        + chunk_type
+        + data
+        + struct.pack(">I", crc)
+    )
+
+
+def insert_png_exif(exif_bytes, input_path, output_path):
+    """
+    Copy a PNG, replacing any eXIf chunk with `exif_bytes`.
+
+    Args:
+        exif_bytes: EXIF as returned by piexif.dump (with the Exif header)
+        input_path: Source PNG
+        output_path: Destination, may equal `input_path`
+    """
+    if exif_bytes.startswith(EXIF_HEADER):
+        # eXIf holds the bare TIFF structure
+        exif_bytes = exif_bytes[len(EXIF_HEADER) :]
+
+    with open(input_path, "rb") as f:
+        data = f.read()
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError(f"Not a PNG file: {input_path}")
+
+    parts = [PNG_SIGNATURE]
+    pos = len(PNG_SIGNATURE)
+    inserted = False
+    while pos < len(data):
+        (length,) = struct.unpack(">I", data[pos : pos + 4])
+        chunk_type = data[pos + 4 : pos + 8]
+        end = pos + 12 + length
+        if chunk_type == b"eXIf":
+            pos = end
+            continue
+        if not inserted and chunk_type in (b"IDAT", b"IEND"):
+            parts.append(_png_chunk(b"eXIf", exif_bytes))
+            inserted = True
+        parts.append(data[pos:end])
+        pos = end
+        if chunk_type == b"IEND":
+            break
+
+    with open(output_path, "wb") as f:
+        f.write(b"".join(parts))
+
+
+def inject_exif(exif_bytes, input_path, output_path):
+    """
+    Write `input_path` to `output_path` with new EXIF, without re-encoding.
+
+    Args:
+        exif_bytes: EXIF as returned by piexif.dump
+        input_path: Source image (JPEG, PNG or WebP)
+        output_path: Destination, should keep the source extension
+
+    Returns:
+        str: The container format that was written
+    """
+    source_format = injectable_format(input_path)
+    if source_format is None:
+        raise ValueError(f"Cannot inject EXIF into {input_path}")
+    if source_format == "PNG":
+        insert_png_exif(exif_bytes, input_path, output_path)
+    else:
+        piexif.insert(exif_bytes, input_path, output_path)
+    return source_format
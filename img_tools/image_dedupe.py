@@ -0,0 +1,411 @@
+"""
+Near-duplicate detection with perceptual hashes.
+
+Every image gets a 64-bit difference hash (dHash). The image is decoded at
+a tiny size, shrunk to a 9x8 grayscale grid, and each bit records whether
+a pixel is brighter than its right neighbour. Re-encodes, resizes and
+near-identical video frames end up within a few bits of each other. The
+thumbnails are hashed together with one vectorized NumPy pass.
+
+HashIndex finds every pair of hashes within a Hamming radius without
+comparing all pairs. It uses multi-index hashing: the hash is split into
+radius + 1 chunks, and by the pigeonhole principle two hashes within the
+radius agree exactly on at least one chunk. For each chunk the hashes are
+sorted by that chunk's value. Only hashes with equal values are compared,
+so the cost grows with the number of candidate pairs rather than n².
+
+The CLI writes a JSON report of the duplicate groups. It can also move
+the duplicates out of the dataset. img_desc and img_exif take the report
+with --skip-duplicates.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import threading
+from typing import NamedTuple
+
+import numpy as np
+from PIL import Image
+
+from image_index import DEFAULT_INDEX_PATH, ImageIndex
+from img_load import STATS, load_image
+from img_walk import iter_image_entries
+from pipeline import Pipeline, Stage
+
+# Hash grid; the thumbnail is one column wider to take horizontal differences
+DHASH_SIZE = 8
+# Longest edge decoded before shrinking to the grid (JPEG draft makes
+# this a 1/8 scale DCT decode for large photos)
+DHASH_DECODE_EDGE = 64
+
+DEFAULT_RADIUS = 3
+
+REPORT_NAME = ".duplicates.json"
+DUPLICATES_DIR = ".duplicates"
+
+
+def dhash_thumbnail(path):
+    """
+    Decode `path` into the grayscale grid dHash is computed from.
+
+    Returns:
+        tuple: (uint8 array of shape (8, 9), original (width, height))
+    """
+    loaded = load_image(path, STATS, max_edge=DHASH_DECODE_EDGE)
+    with loaded.image as img:
+        grid = img.convert("L").resize(
+            (DHASH_SIZE + 1, DHASH_SIZE), Image.Resampling.BOX
+        )
+    return np.asarray(grid), loaded.original_size
+
+
+def dhash_thumbnails(thumbnails):
+    """
+    dHash of a stack of thumbnails.
+
+    Args:
+        thumbnails: uint8 array of shape (N, 8, 9)
+
+    Returns:
+        np.ndarray: uint64 hash per thumbnail
+    """
+    thumbnails = np.asarray(thumbnails)
+    bits = thumbnails[:, :, 1:] > thumbnails[:, :, :-1]
+    packed = np.packbits(bits.reshape(len(bits), -1), axis=1)
+    return packed.view(">u8").ravel().astype(np.uint64)
+
+
+def hamming_distance(a, b):
+    """Bitwise Hamming distance of uint64 hashes (arrays or scalars)."""
+    return np.bitwise_count(np.bitwise_xor(a, b, dtype=np.uint64))
+
+
+class HashIndex:
+    """
+    Multi-index hash table for Hamming-radius queries on 64-bit hashes.
+
+    Args:
+        hashes: uint64 hashes
+        radius: Largest Hamming distance counted as a match
+    """
+
+    def __init__(self, hashes, radius=DEFAULT_RADIUS):
+        if not 0 <= radius < 64:
+            raise ValueError(f"Radius must be in [0, 64), got {radius}")
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.radius = radius
+        # radius + 1 chunks of (nearly) equal width covering all 64 bits
+        bounds = np.linspace(0, 64, radius + 2).astype(int)
+        self.chunks = []
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            mask = np.uint64((1 << (hi - lo)) - 1)
+            keys = (self.hashes >> np.uint64(lo)) & mask
+            order = np.argsort(keys, kind="stable")
+            self.chunks.append((np.uint64(lo), mask, keys[order], order))
+
+    def query(self, value):
+        """Indices of the hashes within the radius of `value`."""
+        value = np.uint64(value)
+        found = []
+        for shift, mask, keys, order in self.chunks:
+            key = (value >> shift) & mask
+            lo, hi = np.searchsorted(keys, [key, key + np.uint64(1)])
+            candidates = order[lo:hi]
+            near = hamming_distance(self.hashes[candidates], value)
+            found.append(candidates[near <= self.radius])
+        if not found:
+            return np.empty(0, dtype=np.intp)
+        return np.unique(np.concatenate(found))
+
+    def pairs(self):
+        """
+        Yield (left, right) index arrays of the hash pairs within the
+        radius. A pair can be reported once per chunk it agrees on.
+        """
+        for _, _, keys, order in self.chunks:
+            hashes = self.hashes[order]
+            left = np.arange(len(keys) - 1)
+            offset = 1
+            # Equal keys are adjacent after sorting: compare every position
+            # with the one `offset` further on for as long as keys match
+            while left.size:
+                right = left + offset
+                inside = right < len(keys)
+                left, right = left[inside], right[inside]
+                same = keys[left] == keys[right]
+                left, right = left[same], right[same]
+                near = hamming_distance(hashes[left], hashes[right])
+                close = near <= self.radius
+                if close.any():
+                    yield order[left[close]], order[right[close]]
+                offset += 1
+
+
+def connected_labels(count, pairs):
+    """
+    Component label (smallest member index) of each of `count` items.
+
+    Args:
+        pairs: Iterable of (left, right) index arrays
+    """
+    labels = np.arange(count)
+    edges = [(np.asarray(left), np.asarray(right)) for left, right in pairs]
+    if not edges:
+        return labels
+    left = np.concatenate([e[0] for e in edges])
+    right = np.concatenate([e[1] for e in edges])
+    while True:
+        low = np.minimum(labels[left], labels[right])
+        previous = labels.copy()
+        np.minimum.at(labels, left, low)
+        np.minimum.at(labels, right, low)
+        # Pointer jumping until every label is a root
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+        if np.array_equal(labels, previous):
+            return labels
+
+
+class HashedImage(NamedTuple):
+    path: str
+    dhash: int
+    # (width, height) in the file
+    size: tuple
+
+
+class DuplicateGroup(NamedTuple):
+    keep: str
+    duplicates: list
+
+
+def hash_images(paths, workers=None, index=None):
+    """
+    dHash every image with a decode pipeline.
+
+    Args:
+        paths: Image paths
+        workers: Decode workers (defaults to the CPU count)
+        index: Optional ImageIndex; unchanged images reuse their stored
+            hash and new hashes are recorded
+
+    Returns:
+        list: HashedImage per readable image, in input order
+    """
+    paths = list(paths)
+    hashes = {}
+    thumbnails = {}
+    lock = threading.Lock()
+
+    def decode(path):
+        st = os.stat(path)
+        entry = index.lookup(path, st) if index is not None else None
+        if entry is not None and entry.dhash is not None and entry.width:
+            with lock:
+                hashes[path] = (entry.dhash, (entry.width, entry.height))
+            return path
+        thumbnail, size = dhash_thumbnail(path)
+        with lock:
+            thumbnails[path] = (thumbnail, size, st)
+        return path
+
+    def on_error(path, e):
+        print(f"Unable to hash {path}: {e}")
+
+    pipeline = Pipeline(
+        [
+            Stage(
+                "decode", decode, workers or os.cpu_count() or 1, None, on_error
+            )
+        ]
+    )
+    stats = pipeline.run(paths)
+    print("Pipeline:")
+    print(stats.summary())
+
+    if thumbnails:
+        fresh = list(thumbnails)
+        values = dhash_thumbnails([thumbnails[p][0] for p in fresh])
+        for path, value in zip(fresh, values):
+            _, size, st = thumbnails[path]
+            hashes[path] = (int(value), size)
+            if index is not None:
+                index.record_dhash(path, int(value), size, st)
+
+    return [HashedImage(p, *hashes[p]) for p in paths if p in hashes]
+
+
+def find_duplicates(images, radius=DEFAULT_RADIUS):
+    """
+    Group images whose hashes are within `radius` bits of each other.
+
+    Groups are transitive: if A matches B and B matches C, all three end up
+    in one group. Each group keeps its largest image (by pixel count, then
+    path order) and lists the others as duplicates.
+
+    Args:
+        images: HashedImage list, e.g. from hash_images
+        radius: Largest Hamming distance counted as a duplicate
+
+    Returns:
+        list: DuplicateGroup per group with at least one duplicate
+    """
+    if not images:
+        return []
+    hashes = np.array([image.dhash for image in images], dtype=np.uint64)
+    # Identical hashes are the common case for copies; search each once
+    unique, inverse = np.unique(hashes, return_inverse=True)
+    labels = connected_labels(len(unique), HashIndex(unique, radius).pairs())[
+        inverse
+    ]
+
+    members = {}
+    for i in np.argsort(labels, kind="stable"):
+        members.setdefault(labels[i], []).append(images[i])
+
+    groups = []
+    for group in members.values():
+        if len(group) < 2:
+            continue
+        group.sort(
+            key=lambda image: (-image.size[0] * image.size[1], image.path)
+        )
+        groups.append(
+            DuplicateGroup(group[0].path, [image.path for image in group[1:]])
+        )
+    groups.sort(key=lambda group: group.keep)
+    return groups
+
+
+def get_report_path(root):
+    return os.path.join(root, REPORT_NAME)
+
+
+def write_report(path, groups, radius):
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "radius": radius,
+                "groups": [group._asdict() for group in groups],
+            },
+            f,
+            indent=2,
+        )
+
+
+def load_duplicates(report_path):
+    """
+    Absolute paths of the duplicates listed in a report, for the tools to
+    skip.
+    """
+    with open(report_path, "r") as f:
+        report = json.load(f)
+    return {
+        os.path.abspath(path)
+        for group in report["groups"]
+        for path in group["duplicates"]
+    }
+
+
+def drop_duplicates(groups, root):
+    """
+    Move the duplicates under `root`'s hidden duplicates folder, keeping
+    their relative paths, so they drop out of every dataset scan.
+
+    Returns:
+        int: Number of moved files
+    """
+    moved = 0
+    for group in groups:
+        for path in group.duplicates:
+            target = os.path.join(
+                root, DUPLICATES_DIR, os.path.relpath(path, root)
+            )
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(path, target)
+            moved += 1
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Find near-duplicate images with perceptual hashes"
+    )
+    parser.add_argument("root", help="Dataset folder")
+    parser.add_argument(
+        "--radius",
+        type=int,
+        default=DEFAULT_RADIUS,
+        help="Largest dHash Hamming distance counted as a duplicate (of 64)",
+    )
+    parser.add_argument(
+        "--report",
+        default=None,
+        help=f"Where to write the JSON report (defaults to {REPORT_NAME} "
+        "in the dataset)",
+    )
+    parser.add_argument(
+        "--drop",
+        action="store_true",
+        help=f"Move duplicates into {DUPLICATES_DIR}/ in the dataset",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Decode workers (defaults to the CPU count)",
+    )
+    parser.add_argument(
+        "--no-recursive",
+        action="store_true",
+        help="Do not include images in subdirectories",
+    )
+    parser.add_argument(
+        "--index",
+        default=DEFAULT_INDEX_PATH,
+        help="Path to the image index database",
+    )
+    parser.add_argument(
+        "--no-index",
+        action="store_true",
+        help="Hash every image, ignoring the image index",
+    )
+    args = parser.parse_args()
+
+    root = os.path.abspath(args.root)
+    paths = [
+        entry.path
+        for entry in iter_image_entries(root, recursive=not args.no_recursive)
+    ]
+    print(f"Hashing {len(paths)} images in {root}")
+
+    index = None if args.no_index else ImageIndex(args.index)
+    try:
+        images = hash_images(paths, args.workers, index)
+        if index is not None:
+            print("Image index:", index.summary())
+    finally:
+        if index is not None:
+            index.close()
+
+    groups = find_duplicates(images, args.radius)
+    duplicates = sum(len(group.duplicates) for group in groups)
+    print(
+        f"Found {duplicates} duplicates of {len(groups)} images "
+        f"(radius {args.radius})"
+    )
+
+    report_path = args.report or get_report_path(root)
+    write_report(report_path, groups, args.radius)
+    print(f"Report written to {report_path}")
+
+    if args.drop:
+        print(f"Moved {drop_duplicates(groups, root)} duplicates")
+
+
+if __name__ == "__main__":
+    main()
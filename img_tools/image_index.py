@@ -0,0 +1,465 @@
+"""
+Persistent per-image index shared by the img_tools scripts.
+
+Each row describes one image file, keyed by its absolute path. It holds
+the file's dimensions, content hash and perceptual hash, the
+`analyze_image` result, the subject boxes found for each detection preset,
+and the caption state.
+A row only counts while the file's size and mtime match the stat it was
+recorded with. If the stat changed but a content hash was stored, the
+file is re-hashed. The row is kept when the bytes are the same (a copy
+or a `touch`) and dropped otherwise. On a re-run over a mostly unchanged
+dataset each image then costs a `stat` and an indexed lookup, not a
+decode.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from PIL import Image
+
+from caption_cache import hash_file
+from img_walk import iter_image_entries
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+DEFAULT_INDEX_PATH = os.path.join(
+    os.path.dirname(BASE_DIR), "data", "image_index.sqlite"
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    content_hash TEXT,
+    width INTEGER,
+    height INTEGER,
+    analysis TEXT,
+    subjects TEXT,
+    caption_state TEXT,
+    dhash TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_caption_state ON images (caption_state);
+"""
+
+_COLUMNS = (
+    "path, size, mtime_ns, content_hash, width, height, analysis, subjects, "
+    "caption_state, dhash"
+)
+
+# Columns added after the first release, with their types
+_ADDED_COLUMNS = {"dhash": "TEXT"}
+
+
+class IndexEntry(NamedTuple):
+    path: str
+    size: int
+    mtime_ns: int
+    content_hash: Optional[str]
+    width: Optional[int]
+    height: Optional[int]
+    # analyze_image output, None until the image has been analyzed
+    analysis: Optional[dict]
+    # Detection preset key -> (center_x, center_y, width, height)
+    subjects: dict
+    caption_state: Optional[str]
+    # 64-bit difference hash, see image_dedupe
+    dhash: Optional[int]
+
+    @classmethod
+    def from_row(cls, row):
+        analysis, subjects = row[6], row[7]
+        return cls(
+            *row[:6],
+            json.loads(analysis) if analysis else None,
+            {
+                key: tuple(box)
+                for key, box in json.loads(subjects or "{}").items()
+            },
+            row[8],
+            int(row[9], 16) if row[9] else None,
+        )
+
+    def matches(self, st):
+        return (self.size, self.mtime_ns) == (st.st_size, st.st_mtime_ns)
+
+
+def _prefix_range(root):
+    """Bounds of the paths under `root` as a range on the primary key."""
+    prefix = os.path.join(os.path.abspath(root), "")
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+def read_dimensions(path):
+    """(width, height) from the image header, None if it can't be read."""
+    try:
+        with Image.open(path) as img:
+            return img.size
+    except (OSError, ValueError):
+        return None
+
+
+class ImageIndex:
+    """
+    SQLite-backed index of per-image analysis results.
+
+    Args:
+        path: Database file path
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # Every pipeline worker writes here; WAL keeps commits cheap
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        existing = {
+            row[1] for row in self._conn.execute("PRAGMA table_info(images)")
+        }
+        for column, column_type in _ADDED_COLUMNS.items():
+            if column not in existing:
+                self._conn.execute(
+                    f"ALTER TABLE images ADD COLUMN {column} {column_type}"
+                )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def lookup(self, image_path, st=None) -> Optional[IndexEntry]:
+        """
+        Return the entry of `image_path` if it is still valid, else None.
+
+        Args:
+            image_path: Image file path
+            st: os.stat result of the file, taken now if not given
+        """
+        path = os.path.abspath(image_path)
+        st = st or os.stat(path)
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM images WHERE path = ?", (path,)
+            ).fetchone()
+        entry = IndexEntry.from_row(row) if row is not None else None
+
+        if entry is not None and not entry.matches(st):
+            if (
+                entry.content_hash is not None
+                and hash_file(path) == entry.content_hash
+            ):
+                entry = entry._replace(size=st.st_size, mtime_ns=st.st_mtime_ns)
+                self._execute(
+                    "UPDATE images SET size = ?, mtime_ns = ? WHERE path = ?",
+                    (st.st_size, st.st_mtime_ns, path),
+                )
+            else:
+                self._execute("DELETE FROM images WHERE path = ?", (path,))
+                entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def _execute(self, query, params=()):
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+            self._conn.commit()
+            return cursor.rowcount
+
+    def _write(self, image_path, st, fields, subject=None):
+        """
+        Upsert `fields` for an image. Anything recorded for an older
+        version of the file is dropped first.
+        """
+        path = os.path.abspath(image_path)
+        st = st or os.stat(path)
+        fields = dict(fields)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, subjects FROM images WHERE path = ?",
+                (path,),
+            ).fetchone()
+            if row is not None and row[:2] != (st.st_size, st.st_mtime_ns):
+                self._conn.execute("DELETE FROM images WHERE path = ?", (path,))
+                row = None
+            if subject is not None:
+                subjects = json.loads(row[2] or "{}") if row else {}
+                preset_key, box = subject
+                subjects[preset_key] = [int(v) for v in box]
+                fields["subjects"] = json.dumps(subjects)
+
+            columns = ["path", "size", "mtime_ns", "updated_at", *fields]
+            updates = ", ".join(f"{c} = excluded.{c}" for c in columns[1:])
+            self._conn.execute(
+                f"INSERT INTO images ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT (path) DO UPDATE SET {updates}",
+                (
+                    path,
+                    st.st_size,
+                    st.st_mtime_ns,
+                    time.time(),
+                    *fields.values(),
+                ),
+            )
+            self._conn.commit()
+
+    def record_analysis(
+        self, image_path, analysis, subject_area=None, preset_key=None, st=None
+    ):
+        """
+        Store the `analyze_image` result and, with `preset_key`, the
+        subject box detected with that preset.
+
+        Args:
+            st: os.stat result taken before the image was decoded, so a
+                file changed in the meantime isn't recorded as analyzed
+        """
+        subject = None
+        if subject_area is not None and preset_key is not None:
+            subject = (preset_key, subject_area)
+        self._write(
+            image_path,
+            st,
+            {
+                "width": analysis["width"],
+                "height": analysis["height"],
+                "analysis": json.dumps(analysis),
+            },
+            subject,
+        )
+
+    def record_caption_state(self, image_path, state, st=None):
+        self._write(image_path, st, {"caption_state": state})
+
+    def record_dhash(self, image_path, dhash, dimensions, st=None):
+        """Store a perceptual hash and the (width, height) it was read at."""
+        width, height = dimensions
+        self._write(
+            image_path,
+            st,
+            {"dhash": f"{dhash:016x}", "width": width, "height": height},
+        )
+
+    def content_hash(self, image_path, st=None):
+        """SHA-256 of the file, read from the index while it is unchanged."""
+        st = st or os.stat(image_path)
+        entry = self.lookup(image_path, st)
+        if entry is not None and entry.content_hash is not None:
+            return entry.content_hash
+        digest = hash_file(image_path)
+        self._write(image_path, st, {"content_hash": digest})
+        return digest
+
+    def entries(self, root=None, caption_state=None, analyzed=None):
+        """
+        Yield the recorded entries, without checking them against the files.
+
+        Args:
+            root: Only entries under this directory
+            caption_state: Only entries with this caption state
+            analyzed: Only entries with (True) or without (False) analysis
+        """
+        clauses, params = [], []
+        if root is not None:
+            clauses.append("path >= ? AND path < ?")
+            params.extend(_prefix_range(root))
+        if caption_state is not None:
+            clauses.append("caption_state = ?")
+            params.append(caption_state)
+        if analyzed is not None:
+            clauses.append(f"analysis IS {'NOT ' if analyzed else ''}NULL")
+        query = f"SELECT {_COLUMNS} FROM images"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        with self._lock:
+            rows = self._conn.execute(
+                query + " ORDER BY path", params
+            ).fetchall()
+        for row in rows:
+            yield IndexEntry.from_row(row)
+
+    def refresh(self, root, recursive=True, hash_contents=False):
+        """
+        Bring the entries under `root` up to date with the files on disk.
+
+        New and changed images get a fresh row with their stat and header
+        dimensions; their analysis and caption state are cleared. Rows of
+        deleted images are removed. Unchanged images are not opened.
+
+        Args:
+            root: Dataset directory
+            recursive: Include images in subdirectories
+            hash_contents: Hash images that have no content hash yet, so
+                later changes that keep the bytes (copies, touch) don't
+                invalidate them
+
+        Returns:
+            dict: Counts of new, changed, unchanged and removed images
+        """
+        root = os.path.abspath(root)
+        with self._lock:
+            known = {
+                row[0]: row[1:]
+                for row in self._conn.execute(
+                    "SELECT path, size, mtime_ns, content_hash FROM images "
+                    "WHERE path >= ? AND path < ?",
+                    _prefix_range(root),
+                )
+            }
+
+        counts = {"new": 0, "changed": 0, "unchanged": 0, "removed": 0}
+        reset, touched, seen = [], [], set()
+        now = time.time()
+        for dir_entry in iter_image_entries(root, recursive=recursive):
+            path = os.path.abspath(dir_entry.path)
+            seen.add(path)
+            st = dir_entry.stat()
+            stat_key = (st.st_size, st.st_mtime_ns)
+            previous = known.get(path)
+            if previous is not None and previous[:2] == stat_key:
+                counts["unchanged"] += 1
+                if hash_contents and not previous[2]:
+                    touched.append((*stat_key, hash_file(path), path))
+                continue
+
+            digest = None
+            if hash_contents or (previous is not None and previous[2]):
+                digest = hash_file(path)
+            if previous is not None and digest and digest == previous[2]:
+                counts["unchanged"] += 1
+                touched.append((*stat_key, digest, path))
+                continue
+
+            counts["new" if previous is None else "changed"] += 1
+            width, height = read_dimensions(path) or (None, None)
+            reset.append((path, *stat_key, digest, width, height, now))
+
+        removed = [
+            (path,)
+            for path in known
+            if path not in seen and (recursive or os.path.dirname(path) == root)
+        ]
+        counts["removed"] = len(removed)
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO images (path, size, mtime_ns, "
+                "content_hash, width, height, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                reset,
+            )
+            self._conn.executemany(
+                "UPDATE images SET size = ?, mtime_ns = ?, content_hash = ? "
+                "WHERE path = ?",
+                touched,
+            )
+            self._conn.executemany("DELETE FROM images WHERE path = ?", removed)
+            self._conn.commit()
+        return counts
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM images").fetchone()[
+                0
+            ]
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups * 100 if lookups else 0.0
+        return (
+            f"entries={len(self)} hits={self.hits} misses={self.misses} "
+            f"hit_rate={hit_rate:.1f}%"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the image index")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    stats = subparsers.add_parser("stats", help="Summarize the indexed images")
+    stats.add_argument("root", nargs="?", help="Only images under this folder")
+
+    refresh = subparsers.add_parser(
+        "refresh", help="Update the index for a dataset folder"
+    )
+    refresh.add_argument("root")
+    refresh.add_argument(
+        "--no-recursive",
+        action="store_true",
+        help="Do not index images in subdirectories",
+    )
+    refresh.add_argument(
+        "--hash",
+        action="store_true",
+        help="Hash images so copies and touched files keep their entries",
+    )
+
+    query = subparsers.add_parser("query", help="List indexed images")
+    query.add_argument("root", nargs="?", help="Only images under this folder")
+    query.add_argument("--caption-state", help="e.g. done or failed")
+    analysis_filter = query.add_mutually_exclusive_group()
+    analysis_filter.add_argument(
+        "--analyzed", action="store_true", help="Only analyzed images"
+    )
+    analysis_filter.add_argument(
+        "--unanalyzed", action="store_true", help="Only unanalyzed images"
+    )
+    query.add_argument(
+        "--json", action="store_true", help="Print full entries as JSON lines"
+    )
+
+    args = parser.parse_args()
+
+    with ImageIndex(args.index) as index:
+        if args.command == "stats":
+            entries = list(index.entries(args.root))
+            analyzed_count = sum(e.analysis is not None for e in entries)
+            states = {}
+            for e in entries:
+                states[e.caption_state] = states.get(e.caption_state, 0) + 1
+            print(f"{len(entries)} indexed images, {analyzed_count} analyzed")
+            for state, count in sorted(states.items(), key=str):
+                print(f"  caption {state or 'unknown'}: {count}")
+        elif args.command == "refresh":
+            start = time.perf_counter()
+            counts = index.refresh(
+                args.root,
+                recursive=not args.no_recursive,
+                hash_contents=args.hash,
+            )
+            print(
+                ", ".join(f"{count} {name}" for name, count in counts.items()),
+                f"in {time.perf_counter() - start:.2f}s",
+            )
+        elif args.command == "query":
+            analyzed = (
+                True if args.analyzed else False if args.unanalyzed else None
+            )
+            for entry in index.entries(args.root, args.caption_state, analyzed):
+                print(json.dumps(entry._asdict()) if args.json else entry.path)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,141 @@
-from PIL import Image
+import argparse
 import os
 
+from PIL import Image
+
+# Importing img_load registers the HEIF opener
+from img_load import FULL, load_image
+from pipeline import Pipeline, Stage, parse_stage_workers
+
+INPUT_FORMATS = {
+    ".webp": "WEBP",
+    ".png": "PNG",
+    ".jpg": "JPEG",
+    ".jpeg": "JPEG",
+    ".heic": "HEIF",
+    ".heif": "HEIF",
+}
+
+OUTPUT_EXTENSIONS = {
+    "WEBP": ".webp",
+    "PNG": ".png",
+    "JPEG": ".jpg",
+    "HEIF": ".heic",
+}
+
+DEFAULT_ENCODER_OPTIONS = {
+    "PNG": {"compress_level": 6},
+    "JPEG": {"quality": 92, "optimize": True},
+    "WEBP": {"quality": 90, "method": 4},
+    "HEIF": {"quality": 90},
+}
+
+
+def _prepare_mode(img, output_format):
+    """Convert `img` to a mode the output encoder accepts."""
+    if output_format == "JPEG":
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.split()[-1])
+            return background
+        if img.mode not in ("RGB", "L"):
+            return img.convert("RGB")
+    elif img.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+        return img.convert("RGBA" if "A" in img.getbands() else "RGB")
+    return img
+
+
+def decode_for_conversion(input_path, output_format, max_edge=None):
+    """
+    Load an image and get it ready for the `output_format` encoder.
+
+    Args:
+        input_path (str): The path to the input image file.
+        output_format (str): One of PNG, JPEG, WEBP or HEIF.
+        max_edge (int): Optional longest edge of the output. Uses reduced
+            decoding, so large JPEGs are never decoded at full resolution.
+
+    Returns:
+        tuple: (image, metadata) where metadata holds the EXIF and ICC
+            profile to carry over to the output
+    """
+    img = load_image(input_path, FULL, max_edge).image
+    try:
+        metadata = {
+            key: img.info[key]
+            for key in ("exif", "icc_profile")
+            if img.info.get(key)
+        }
+        if max_edge and max(img.size) > max_edge:
+            img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        converted = _prepare_mode(img, output_format)
+    except Exception:
+        img.close()
+        raise
+    if converted is not img:
+        img.close()
+    return converted, metadata
+
+
+def encode_conversion(
+    img, output_path, output_format, encoder_options, metadata=None
+):
+    """Save a decoded image and close it."""
+    try:
+        img.save(
+            output_path, output_format, **encoder_options, **(metadata or {})
+        )
+    finally:
+        img.close()
+
+
+def convert_image(
+    input_path, output_path, output_format, encoder_options=None, max_edge=None
+):
+    """
+    Converts an image to `output_format`.
+
+    Args:
+        input_path (str): The path to the input image file.
+        output_path (str): The path where the converted image will be saved.
+        output_format (str): One of PNG, JPEG, WEBP or HEIF.
+        encoder_options (dict): Options passed to the encoder, defaults to
+            DEFAULT_ENCODER_OPTIONS for the format.
+        max_edge (int): Optional longest edge of the output. Uses reduced
+            decoding, so large JPEGs are never decoded at full resolution.
+
+    Returns:
+        bool: True if the image was converted.
+    """
+    output_format = output_format.upper()
+    if encoder_options is None:
+        encoder_options = DEFAULT_ENCODER_OPTIONS.get(output_format, {})
+
+    try:
+        img, metadata = decode_for_conversion(
+            input_path, output_format, max_edge
+        )
+        encode_conversion(
+            img, output_path, output_format, encoder_options, metadata
+        )
+        return True
+    except FileNotFoundError:
+        print(f"Error: Input file '{input_path}' not found.")
+    except Exception as e:
+        print(f"An error occurred converting '{input_path}': {e}")
+    return False
+
+
+def _convert_job(job):
+    """Decode and encode one image in a pool process."""
+    input_path, output_path, output_format, encoder_options, max_edge = job
+    img, metadata = decode_for_conversion(input_path, output_format, max_edge)
+    encode_conversion(
+        img, output_path, output_format, encoder_options, metadata
+    )
+    return output_path
+
 
 def convert_webp_to_png(input_path, output_path):
     """
@@ -10,34 +145,235 @@ def convert_webp_to_png(input_path, output_path):
         input_path (str): The path to the input WebP image file.
         output_path (str): The path where the output PNG image will be saved.
     """
-    try:
-        # Open the WebP image
-        img = Image.open(input_path)
-
-        # Save the image as PNG. Pillow automatically handles the conversion
-        # and preserves transparency if present in the WebP.
-        img.save(output_path, "PNG")
+    if convert_image(input_path, output_path, "PNG"):
         print(f"Successfully converted '{input_path}' to '{output_path}'")
+
+
+def is_up_to_date(input_path, output_path):
+    """True if `output_path` exists and is not older than `input_path`."""
+    try:
+        return (
+            os.stat(output_path).st_mtime_ns >= os.stat(input_path).st_mtime_ns
+        )
     except FileNotFoundError:
-        print(f"Error: Input file '{input_path}' not found.")
-    except Exception as e:
-        print(f"An error occurred during conversion: {e}")
+        return False
 
 
-def convert_webp_to_png_bulk(input_folder, output_folder):
-    for img in os.listdir(input_folder):
-        name, ext = os.path.splitext(img)
-        ext = ext.lower()
+def plan_conversions(
+    input_folder, output_folder, output_format, input_formats=None, force=False
+):
+    """
+    List the (input_path, output_path) pairs that need converting.
+
+    Files already in the output format, files with unknown extensions and
+    (unless `force`) outputs newer than their input are skipped.
+
+    Returns:
+        tuple: (jobs, skipped_count)
+    """
+    output_format = output_format.upper()
+    output_ext = OUTPUT_EXTENSIONS[output_format]
+    input_formats = {f.upper() for f in input_formats or INPUT_FORMATS.values()}
 
-        if ext not in [".webp"]:
-            print(f"Skipping {img}")
+    jobs = []
+    skipped = 0
+    with os.scandir(input_folder) as it:
+        entries = sorted((e for e in it if e.is_file()), key=lambda e: e.name)
+    for entry in entries:
+        name, ext = os.path.splitext(entry.name)
+        source_format = INPUT_FORMATS.get(ext.lower())
+        if source_format is None or source_format not in input_formats:
+            continue
+        if source_format == output_format:
+            skipped += 1
+            continue
+        output_path = os.path.join(output_folder, name + output_ext)
+        if not force and is_up_to_date(entry.path, output_path):
+            skipped += 1
             continue
+        jobs.append((entry.path, output_path))
+    return jobs, skipped
 
-        image = Image.open(os.path.join(input_folder, img))
-        image.save(os.path.join(output_folder, name + ".png"))
 
+def convert_bulk(
+    input_folder,
+    output_folder,
+    output_format="PNG",
+    input_formats=None,
+    encoder_options=None,
+    workers=None,
+    force=False,
+    max_edge=None,
+    stage_workers=None,
+    processes=True,
+):
+    """
+    Convert every matching image in `input_folder` with a single convert
+    stage in worker processes, or with a threaded decode -> encode pipeline.
 
-if __name__ == "__main__":
-    input_webp_file = "testing"
+    Args:
+        input_folder: Folder containing the source images
+        output_folder: Folder the converted images are written to
+        output_format: One of PNG, JPEG, WEBP or HEIF
+        input_formats: Source formats to convert (all known formats if None)
+        encoder_options: Encoder options overriding the format defaults
+        workers: Workers per stage (defaults to the CPU count)
+        force: Re-convert even when the output is up to date
+        max_edge: Optional longest edge of the converted images
+        stage_workers: Optional {"convert": n} override ({"decode": n,
+            "encode": n} without `processes`)
+        processes: Decode and encode in a pool of `workers` processes, so
+            encoders that hold the GIL scale with the cores. False runs
+            the decode and encode stages in threads instead
+
+    Returns:
+        dict: Counts of converted, skipped and failed images
+    """
+    output_format = output_format.upper()
+    if output_format not in OUTPUT_EXTENSIONS:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    os.makedirs(output_folder, exist_ok=True)
+
+    options = dict(DEFAULT_ENCODER_OPTIONS.get(output_format, {}))
+    options.update(encoder_options or {})
 
-    convert_webp_to_png_bulk(input_webp_file, input_webp_file)
+    jobs, skipped = plan_conversions(
+        input_folder, output_folder, output_format, input_formats, force
+    )
+    counts = {"converted": 0, "skipped": skipped, "failed": 0}
+    if not jobs:
+        return counts
+
+    def decode(job):
+        input_path, output_path = job
+        img, metadata = decode_for_conversion(
+            input_path, output_format, max_edge
+        )
+        return input_path, output_path, img, metadata
+
+    def encode(decoded):
+        input_path, output_path, img, metadata = decoded
+        encode_conversion(img, output_path, output_format, options, metadata)
+        return output_path
+
+    def on_error(item, e):
+        print(f"An error occurred converting '{item[0]}': {e}")
+
+    workers = workers or os.cpu_count() or 1
+    if processes:
+        # Each process decodes and encodes its image, the pixels never
+        # cross a process boundary
+        stages = [
+            Stage(
+                "convert",
+                _convert_job,
+                workers,
+                on_error=on_error,
+                processes=True,
+            )
+        ]
+        jobs = [
+            (input_path, output_path, output_format, options, max_edge)
+            for input_path, output_path in jobs
+        ]
+    else:
+        stages = [
+            Stage("decode", decode, workers, on_error=on_error),
+            Stage("encode", encode, workers, on_error=on_error),
+        ]
+    stats = Pipeline(stages, stage_workers).run(jobs)
+    print(stats.summary())
+
+    counts["converted"] = stats.stages[-1].processed
+    counts["failed"] = stats.failed
+    return counts
+
+
+def convert_webp_to_png_bulk(input_folder, output_folder):
+    return convert_bulk(
+        input_folder, output_folder, output_format="PNG", input_formats=["WEBP"]
+    )
+
+
+def _format_arg(value):
+    value = value.upper()
+    return {"HEIC": "HEIF", "JPG": "JPEG"}.get(value, value)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert images between WebP, PNG, JPEG and HEIC"
+    )
+    parser.add_argument("input_folder")
+    parser.add_argument(
+        "--output", help="Output folder (defaults to the input folder)"
+    )
+    parser.add_argument(
+        "--to",
+        dest="output_format",
+        default="PNG",
+        type=_format_arg,
+        choices=sorted(OUTPUT_EXTENSIONS),
+    )
+    parser.add_argument(
+        "--from",
+        dest="input_formats",
+        action="append",
+        type=_format_arg,
+        choices=sorted(OUTPUT_EXTENSIONS),
+        help="Only convert these source formats (repeatable)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Workers per stage"
+    )
+    parser.add_argument(
+        "--stage-workers",
+        type=parse_stage_workers,
+        help="Per-stage workers, e.g. convert=4, or decode=2,encode=6 "
+        "with --threads",
+    )
+    parser.add_argument(
+        "--threads",
+        action="store_true",
+        help="Decode and encode in threads instead of worker processes",
+    )
+    parser.add_argument("--quality", type=int, help="JPEG/WebP/HEIC quality")
+    parser.add_argument(
+        "--compress-level", type=int, help="PNG zlib compression level (0-9)"
+    )
+    parser.add_argument(
+        "--max-edge",
+        type=int,
+        help="Downsize so the longest edge is at most this size",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Overwrite up-to-date outputs"
+    )
+    args = parser.parse_args()
+
+    encoder_options = {}
+    if args.quality is not None and args.output_format != "PNG":
+        encoder_options["quality"] = args.quality
+    if args.compress_level is not None and args.output_format == "PNG":
+        encoder_options["compress_level"] = args.compress_level
+
+    counts = convert_bulk(
+        args.input_folder,
+        args.output or args.input_folder,
+        output_format=args.output_format,
+        input_formats=args.input_formats,
+        encoder_options=encoder_options,
+        workers=args.workers,
+        force=args.force,
+        max_edge=args.max_edge,
+        stage_workers=args.stage_workers,
+        processes=not args.threads,
+    )
+    print(
+        f"Converted {counts['converted']}, skipped {counts['skipped']}, "
+        f"failed {counts['failed']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
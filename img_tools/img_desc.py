@@ -1,118 +1,651 @@
-import getpass
-import io
+import argparse
+import asyncio
 import os
-import base64
+import threading
 import time
-import argparse
 
-from dotenv import load_dotenv
-from PIL import Image
 from langchain_core.messages import HumanMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
 
+from caption_backends import BACKENDS, create_model, get_backend
+from caption_batch import build_batch_message, chunked, parse_batch_response
+from caption_cache import (
+    DEFAULT_CACHE_PATH,
+    CaptionCache,
+    get_model_id,
+    hash_text,
+)
+from caption_engine import EngineStats, TokenBucket
+from caption_manifest import DONE, FAILED, CaptionManifest, get_manifest_path
+from image_dedupe import load_duplicates
+from image_index import DEFAULT_INDEX_PATH, ImageIndex
+from img_preprocess import PreprocessOptions, get_image_data_url
+from img_walk import IMAGE_EXTENSIONS, WorkItem, iter_caption_jobs
+from metrics import METRICS
+from pipeline import Pipeline, Stage, parse_stage_workers
+from prompt_templates import (
+    DEFAULT_PROMPT_PATH,
+    preflight_prompt,
+    render_prompt,
+)
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
-
-def _set_env(var: str):
-    load_dotenv()
-    if not os.environ.get(var):
-        os.environ[var] = getpass.getpass(f"{var}: ")
-
-
-def get_chat_gemini():
-    _set_env("GOOGLE_API_KEY")
-    return ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash", api_key=os.getenv("GOOGLE_API_KEY")
-    )
-
-
-def read_prompt(prompt_path: str):
-    with open(prompt_path, "r") as f:
-        return f.read()
+DEFAULT_TRIGGER_WORD = "ohmyra"
 
 
-def get_image_bytes(image_path):
-    # image_format = image_path.split(".")[-1].lower()
-    image = Image.open(image_path)
+def get_caption_path(image_path):
+    name, _ = os.path.splitext(os.path.basename(image_path))
+    return os.path.join(os.path.dirname(image_path), name + ".txt")
 
-    with io.BytesIO() as output:
-        image.save(output, format="png")
-        image_bytes = output.getvalue()
-    return image_bytes
 
-
-def get_base64_image(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
-
-
-def caption_image(model, image_path):
+def prepare_caption_job(image_path):
+    """
+    Validate `image_path` and return the caption path to write, or None
+    when a non-empty caption already exists.
+    """
     if not os.path.exists(image_path):
         raise ValueError(f"Image path {image_path} does not exist")
 
     if not os.path.isfile(image_path):
         raise ValueError(f"Image path {image_path} is not a file")
 
-    name, ext = os.path.splitext(os.path.basename(image_path))
-    ext = ext.lower()
-    if ext not in [".png", ".jpg", ".jpeg", ".webp"]:
+    ext = os.path.splitext(image_path)[1].lower()
+    if ext not in IMAGE_EXTENSIONS:
         raise ValueError(f"Unsupported image extension: {ext}")
 
-    caption_path = os.path.join(os.path.dirname(image_path), name + ".txt")
+    caption_path = get_caption_path(image_path)
     if os.path.exists(caption_path):
         try:
             if os.path.getsize(caption_path) > 0:
                 print(f"Skipping {image_path} (caption exists)")
-                return
+                METRICS.incr("skipped")
+                return None
         except OSError:
             pass
+    return caption_path
+
+
+def get_prompt(prompt_path=None, trigger_word=DEFAULT_TRIGGER_WORD):
+    return render_prompt(
+        prompt_path or DEFAULT_PROMPT_PATH, trigger_word=trigger_word
+    )
+
+
+def build_caption_message(image_path, prompt, preprocess=None):
+    return build_url_message(get_image_data_url(image_path, preprocess), prompt)
+
+
+def build_url_message(image_url, prompt):
+    return HumanMessage(
+        content=[
+            {"type": "text", "text": prompt},
+            {"type": "image_url", "image_url": {"url": image_url}},
+        ]
+    )
+
+
+def lookup_cached_caption(cache, image_path, prompt, model, index=None):
+    """
+    Args:
+        index: Optional ImageIndex providing the image's content hash, so
+            unchanged images aren't re-read to build the cache key
+
+    Returns:
+        tuple: (CacheKey, cached caption or None)
+    """
+    with METRICS.timer("cache_lookup"):
+        image_hash = (
+            index.content_hash(image_path) if index is not None else None
+        )
+        key = cache.make_key(
+            image_path, prompt, get_model_id(model), image_hash
+        )
+        caption = cache.get(key)
+    METRICS.incr("cache_misses" if caption is None else "cache_hits")
+    return key, caption
+
+
+def write_caption(caption_path, caption):
+    print("Writing caption to file:", caption_path)
+    with METRICS.timer("write"), open(caption_path, "w") as f:
+        f.write(caption)
+    METRICS.incr("captions_written")
+
+
+def caption_image(model, image_path, prompt=None, preprocess=None, cache=None):
+    caption_path = prepare_caption_job(image_path)
+    if caption_path is None:
+        return
+
+    prompt = prompt or get_prompt()
+    if cache is not None:
+        key, caption = lookup_cached_caption(cache, image_path, prompt, model)
+        if caption is not None:
+            print(f"Cache hit for {image_path}")
+            write_caption(caption_path, caption)
+            return
 
     start = time.perf_counter()
     try:
         print("Captioning image:", image_path)
-        prompt = read_prompt(os.path.join(BASE_DIR, "prompts", "LORA.md"))
-        prompt = prompt.replace("{trigger_word}", "ohmyra")
-        img = get_base64_image(image_path)
-        image_b64 = f"data:image/png;base64,{img}"
-        message = HumanMessage(
-            content=[
-                {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": {"url": image_b64}},
-            ]
-        )
-        response = model.invoke([message])
+        message = build_caption_message(image_path, prompt, preprocess)
+        with METRICS.timer("request"):
+            response = model.invoke([message])
+        METRICS.incr("requests")
         caption = response.content
     finally:
         print("Time taken:", time.perf_counter() - start)
 
-    print("Writing caption to file:", caption_path)
-    with open(caption_path, "w") as f:
-        f.write(caption)
+    write_caption(caption_path, caption)
+    if cache is not None:
+        cache.put(key, caption)
 
 
-def caption_image_dataset(model, image_dir):
-    if not os.path.exists(image_dir):
-        raise ValueError(f"Image directory {image_dir} does not exist")
+async def _ainvoke(model, message, throttle=None):
+    if throttle is not None:
+        await throttle()
+    start = time.perf_counter()
+    response = await model.ainvoke([message])
+    latency = time.perf_counter() - start
+    METRICS.observe("request", latency)
+    METRICS.incr("requests")
+    return response.content, latency
+
+
+def prepare_caption_request(
+    model, items, prompt, preprocess=None, cache=None, index=None
+):
+    """
+    Validate WorkItems, serve cached captions and build the request for
+    the rest. `index` is passed on to lookup_cached_caption.
+
+    Each image is checked and encoded on its own, so an unreadable image
+    fails alone and the rest of the batch is still captioned.
 
-    for file in os.listdir(image_dir):
+    Returns:
+        tuple: (jobs, message, finished, failed) where jobs are
+            (image_path, caption_path, cache_key) tuples still to caption,
+            message is the request for them (None when there are none),
+            finished lists the paths of skipped or cached images and
+            failed lists (image_path, exception) for images that couldn't
+            be prepared
+    """
+    jobs = []
+    image_urls = []
+    finished = []
+    failed = []
+    for item in items:
         try:
-            caption_image(model, os.path.join(image_dir, file))
+            caption_path = item.caption_path or prepare_caption_job(item.path)
+            if caption_path is None:
+                finished.append(item.path)
+                continue
+            key = None
+            if cache is not None:
+                key, caption = lookup_cached_caption(
+                    cache, item.path, prompt, model, index
+                )
+                if caption is not None:
+                    print(f"Cache hit for {item.path}")
+                    write_caption(caption_path, caption)
+                    finished.append(item.path)
+                    continue
+            image_urls.append(get_image_data_url(item.path, preprocess))
         except Exception as e:
-            print(f"Unable to caption image {file}: {e}")
+            failed.append((item.path, e))
+            continue
+        jobs.append((item.path, caption_path, key))
+
+    if not jobs:
+        return jobs, None, finished, failed
+
+    if len(jobs) == 1:
+        message = build_url_message(image_urls[0], prompt)
+    else:
+        message = build_batch_message(image_urls, prompt)
+    image_paths = [path for path, _, _ in jobs]
+    print(f"Captioning batch of {len(jobs)} images:", ", ".join(image_paths))
+    return jobs, message, finished, failed
+
+
+async def request_captions(
+    model, jobs, message, prompt, throttle=None, preprocess=None
+):
+    """
+    Send a request built by `prepare_caption_request`.
+
+    The model is asked for a JSON array with one caption per image. If the
+    response can't be split back into per-image captions, each image is
+    captioned with its own request instead.
+
+    Returns:
+        tuple: ((job, caption, latency) per job, latency per model call).
+            The jobs of a batch share the latency of its request.
+    """
+    content, latency = await _ainvoke(model, message, throttle)
+    if len(jobs) == 1:
+        return [(jobs[0], content, latency)], [latency]
+
+    captions = parse_batch_response(content, len(jobs))
+    if captions is not None:
+        results = [
+            (job, caption, latency) for job, caption in zip(jobs, captions)
+        ]
+        return results, [latency]
+
+    print("Malformed batch response, captioning images one at a time")
+    METRICS.incr("batch_fallbacks")
+    results = []
+    latencies = [latency]
+    for job in jobs:
+        message = await asyncio.to_thread(
+            build_caption_message, job[0], prompt, preprocess
+        )
+        caption, image_latency = await _ainvoke(model, message, throttle)
+        results.append((job, caption, image_latency))
+        latencies.append(image_latency)
+    return results, latencies
+
+
+def store_captions(results, cache=None):
+    """Write the captions returned by `request_captions` and cache them."""
+    for (_, caption_path, key), caption, _ in results:
+        write_caption(caption_path, caption)
+        if cache is not None:
+            cache.put(key, caption)
+
+
+def caption_image_dataset(
+    model,
+    image_dir,
+    prompt=None,
+    concurrency=4,
+    rate=None,
+    preprocess=None,
+    cache=None,
+    resume=False,
+    retry_failed=False,
+    manifest_path=None,
+    recursive=True,
+    batch_size=1,
+    stage_workers=None,
+    index=None,
+    skip=(),
+):
+    """
+    Caption every supported image in `image_dir` with a
+    prepare -> request -> write pipeline.
+
+    Progress is tracked in a job manifest. With `resume` and/or
+    `retry_failed` only the pending and/or failed images recorded in the
+    manifest are processed and the directory is not re-scanned.
+
+    Args:
+        model: Chat model exposing `ainvoke`
+        image_dir: Directory containing the images
+        prompt: Rendered prompt text (defaults to the LORA.md template)
+        concurrency: Maximum number of in-flight model requests
+        rate: Optional request rate limit (requests per second)
+        preprocess: PreprocessOptions applied to each image before upload
+        cache: Optional CaptionCache consulted before calling the model
+        resume: Only process images still pending in the manifest
+        retry_failed: Only process (or also process) failed images
+        manifest_path: Manifest location (defaults to one in `image_dir`)
+        recursive: Include images in subdirectories
+        batch_size: Images packed into each request (1 disables batching)
+        stage_workers: Optional {"prepare": n, "request": n, "write": n}
+            overrides; request defaults to `concurrency`
+        index: Optional ImageIndex that serves content hashes for the
+            cache and records each image's caption state. Images changed
+            since the index recorded them as captioned are captioned
+            again, although their caption file exists.
+        skip: Absolute paths of images not to caption, e.g. the
+            near-duplicates from image_dedupe.load_duplicates
+
+    Returns:
+        EngineStats: Throughput and latency stats for the run
+    """
+    if not os.path.exists(image_dir):
+        raise ValueError(f"Image directory {image_dir} does not exist")
+
+    prompt = prompt or get_prompt()
+    if cache is not None:
+        stale = cache.count_stale(hash_text(prompt), get_model_id(model))
+        if stale:
+            print(
+                f"Warning: {stale} cached captions were generated with a "
+                "different prompt"
+            )
+
+    manifest = CaptionManifest(manifest_path or get_manifest_path(image_dir))
+    if resume or retry_failed:
+        paths = manifest.outstanding(pending=resume, failed=retry_failed)
+        print(f"Resuming job with {len(paths)} outstanding images")
+        work_items = [WorkItem(path) for path in paths]
+    else:
+        captioned = None
+        if index is not None:
+            captioned = {
+                entry.path: (entry.size, entry.mtime_ns)
+                for entry in index.entries(image_dir, caption_state=DONE)
+            }
+        # Register the whole scan up front so a killed run can be resumed
+        work_items = list(
+            iter_caption_jobs(
+                image_dir, recursive=recursive, captioned=captioned
+            )
+        )
+        if skip:
+            kept = [
+                w for w in work_items if os.path.abspath(w.path) not in skip
+            ]
+            print(f"Skipping {len(work_items) - len(kept)} near-duplicates")
+            work_items = kept
+        manifest.add_pending(item.path for item in work_items)
+
+    if batch_size > 1:
+        work_items = chunked(work_items, batch_size)
+
+    stats = EngineStats()
+    stats_lock = threading.Lock()
+    throttle = TokenBucket(rate, concurrency).acquire if rate else None
+
+    def finish(image_path, latency):
+        manifest.record(
+            image_path, DONE, latency=latency, attempted=latency is not None
+        )
+        if index is not None:
+            index.record_caption_state(image_path, DONE)
+        with stats_lock:
+            if latency is None:
+                stats.skipped += 1
+            else:
+                stats.completed += 1
+
+    def fail(image_paths, error, attempted=True):
+        print(f"Unable to caption {', '.join(image_paths)}: {error}")
+        for image_path in image_paths:
+            manifest.record(
+                image_path, FAILED, error=str(error), attempted=attempted
+            )
+            if index is not None and os.path.exists(image_path):
+                index.record_caption_state(image_path, FAILED)
+        METRICS.incr("failed", len(image_paths))
+        with stats_lock:
+            stats.failed += len(image_paths)
+
+    def prepare(item):
+        items = item if isinstance(item, list) else [item]
+        jobs, message, finished, failed = prepare_caption_request(
+            model, items, prompt, preprocess, cache, index
+        )
+        for image_path in finished:
+            finish(image_path, None)
+        for image_path, error in failed:
+            fail([image_path], error, attempted=False)
+        return (jobs, message) if jobs else None
+
+    async def request(prepared):
+        jobs, message = prepared
+        return await request_captions(
+            model, jobs, message, prompt, throttle, preprocess
+        )
+
+    def write(requested):
+        results, latencies = requested
+        store_captions(results, cache)
+        for (image_path, _, _), _, latency in results:
+            finish(image_path, latency)
+        # One sample per model call, however many images it captioned
+        with stats_lock:
+            stats.latencies.extend(latencies)
+        return results
+
+    def job_paths(jobs):
+        return [image_path for image_path, _, _ in jobs]
+
+    def prepare_failed(item, error):
+        items = item if isinstance(item, list) else [item]
+        fail([w.path for w in items], error, attempted=False)
+
+    def request_failed(prepared, error):
+        fail(job_paths(prepared[0]), error)
+
+    def write_failed(requested, error):
+        fail(job_paths(job for job, _, _ in requested[0]), error)
+
+    pipeline = Pipeline(
+        [
+            Stage(
+                "prepare",
+                prepare,
+                workers=min(concurrency, os.cpu_count() or 1),
+                on_error=prepare_failed,
+            ),
+            Stage(
+                "request", request, workers=concurrency, on_error=request_failed
+            ),
+            Stage("write", write, on_error=write_failed),
+        ],
+        stage_workers,
+    )
+
+    with manifest:
+        pipeline_stats = pipeline.run(work_items)
+        stats.elapsed = pipeline_stats.elapsed
+        counts = manifest.counts()
+    print("Captioning finished:", stats.summary())
+    print("Pipeline:")
+    print(pipeline_stats.summary())
+    print("Stage timings:")
+    print(METRICS.format_stages())
+    print(
+        f"Manifest: {counts[DONE]} done, {counts[FAILED]} failed, "
+        f"{len(manifest.entries) - counts[DONE] - counts[FAILED]} pending"
+    )
+    if cache is not None:
+        print("Caption cache:", cache.summary())
+    if index is not None:
+        print("Image index:", index.summary())
+    return stats
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("path")
+    parser.add_argument(
+        "--prompt",
+        default=DEFAULT_PROMPT_PATH,
+        help="Path to the prompt template",
+    )
+    parser.add_argument(
+        "--trigger-word",
+        default=DEFAULT_TRIGGER_WORD,
+        help="Value substituted for {trigger_word} in the prompt",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=sorted(BACKENDS),
+        default="gemini",
+        help="Captioning backend",
+    )
+    parser.add_argument(
+        "--model",
+        default=None,
+        help="Model name passed to the backend (backend default if omitted)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="Maximum number of in-flight model requests "
+        "(defaults to the backend limit)",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="Maximum model requests per second",
+    )
+    parser.add_argument(
+        "--max-edge",
+        type=int,
+        default=PreprocessOptions.max_edge,
+        help="Downsize images so their longest edge fits (0 to disable)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["jpeg", "png", "webp", "original"],
+        default="jpeg",
+        help="Format images are re-encoded to before upload",
+    )
+    parser.add_argument(
+        "--quality",
+        type=int,
+        default=PreprocessOptions.quality,
+        help="Encoder quality for lossy formats",
+    )
+    parser.add_argument(
+        "--cache",
+        default=DEFAULT_CACHE_PATH,
+        help="Path to the caption cache database",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always call the model, ignoring the caption cache",
+    )
+    parser.add_argument(
+        "--cache-max-entries",
+        type=int,
+        default=None,
+        help="Evict least recently used cache entries beyond this size",
+    )
+    parser.add_argument(
+        "--index",
+        default=DEFAULT_INDEX_PATH,
+        help="Path to the image index database",
+    )
+    parser.add_argument(
+        "--no-index",
+        action="store_true",
+        help="Don't read or update the image index",
+    )
+    parser.add_argument(
+        "--skip-duplicates",
+        metavar="REPORT",
+        default=None,
+        help="Don't caption the duplicates listed in an image_dedupe report",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Only caption images still pending in the job manifest",
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="Only caption images that failed in a previous run",
+    )
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        help="Path to the job manifest (defaults to one in the dataset)",
+    )
+    parser.add_argument(
+        "--no-recursive",
+        action="store_true",
+        help="Do not caption images in subdirectories",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="Images packed into each request (0 uses the backend maximum)",
+    )
+    parser.add_argument(
+        "--stage-workers",
+        type=parse_stage_workers,
+        help="Per-stage workers, e.g. prepare=4,write=2 "
+        "(request follows --concurrency)",
+    )
+    parser.add_argument(
+        "--metrics-json",
+        default=None,
+        help="Write a JSON summary of stage timings and counters",
+    )
+    parser.add_argument(
+        "--metrics-prom",
+        default=None,
+        help="Write metrics in Prometheus text format to this file",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Serve Prometheus metrics on this port while running",
+    )
     args = parser.parse_args()
 
-    model = get_chat_gemini()
+    metrics_server = None
+    if args.metrics_port:
+        metrics_server = METRICS.serve_prometheus(args.metrics_port)
+
+    preflight_prompt(args.prompt)
+    prompt = get_prompt(args.prompt, args.trigger_word)
+    preprocess = PreprocessOptions(
+        max_edge=args.max_edge or None,
+        format=None if args.format == "original" else args.format.upper(),
+        quality=args.quality,
+    )
+
+    backend = get_backend(args.backend)
+    model = create_model(
+        backend.name, **({"model": args.model} if args.model else {})
+    )
+    cache = None
+    if not args.no_cache:
+        cache = CaptionCache(args.cache, max_entries=args.cache_max_entries)
+    index = None if args.no_index else ImageIndex(args.index)
 
     if os.path.isdir(args.path):
-        caption_image_dataset(model, args.path)
+        caption_image_dataset(
+            model,
+            args.path,
+            prompt=prompt,
+            concurrency=args.concurrency or backend.max_concurrency,
+            rate=args.rate,
+            preprocess=preprocess,
+            cache=cache,
+            resume=args.resume,
+            retry_failed=args.retry_failed,
+            manifest_path=args.manifest,
+            recursive=not args.no_recursive,
+            batch_size=args.batch_size or backend.max_batch_size,
+            stage_workers=args.stage_workers,
+            index=index,
+            skip=(
+                load_duplicates(args.skip_duplicates)
+                if args.skip_duplicates
+                else ()
+            ),
+        )
     else:
-        caption_image(model, args.path)
+        caption_image(
+            model, args.path, prompt=prompt, preprocess=preprocess, cache=cache
+        )
+
+    if cache is not None:
+        cache.close()
+    if index is not None:
+        index.close()
+
+    if args.metrics_json:
+        METRICS.write_json(args.metrics_json)
+    if args.metrics_prom:
+        METRICS.write_prometheus(args.metrics_prom)
+    if metrics_server is not None:
+        metrics_server.shutdown()
 
 
 if __name__ == "__main__":
@@ -4,28 +4,129 @@ Script to modify EXIF metadata of images based on sample data.
 Supports JPEG, PNG, and other PIL-compatible formats.
 """
 
-import piexif
-from PIL import Image
+import argparse
 import os
-from datetime import datetime, timedelta
 import random
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import cached_property, partial
+from typing import Optional
+
 import cv2
 import numpy as np
-import argparse
+import piexif
+from PIL import Image
 
+from exif_inject import inject_exif, injectable_format
+from exif_template import ExifTemplate
+from image_dedupe import load_duplicates
+from image_index import DEFAULT_INDEX_PATH, ImageIndex
+from img_load import FULL, STATS, STATS_MAX_EDGE, load_image, reduce_to
+from metrics import METRICS
+from pipeline import Pipeline, Stage, parse_stage_workers
 
-def analyze_image(img):
+# ITU-R BT.601 weights, the same ones cv2.COLOR_RGB2GRAY uses
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114])
+
+FACE_CASCADE = "haarcascade_frontalface_default.xml"
+
+
+@dataclass(frozen=True)
+class DetectionPreset:
     """
-    Analyze image to extract measurable properties.
-    Returns a dictionary with calculated values.
+    Args:
+        max_edge: Longest edge of the detection proxy (None for full size)
+        scale_factor: detectMultiScale pyramid step, smaller is slower
+        min_neighbors: detectMultiScale overlap needed to keep a face
+        saliency: Fall back to saliency when no face is found
+    """
+
+    max_edge: Optional[int]
+    scale_factor: float
+    min_neighbors: int
+    saliency: bool = True
+
+    @property
+    def key(self):
+        """Identifies boxes detected with these settings in the image index."""
+        return (
+            f"{self.max_edge}:{self.scale_factor}:{self.min_neighbors}:"
+            f"{int(self.saliency)}"
+        )
+
+
+DETECTION_PRESETS = {
+    "fast": DetectionPreset(max_edge=512, scale_factor=1.2, min_neighbors=3),
+    "balanced": DetectionPreset(
+        max_edge=STATS_MAX_EDGE, scale_factor=1.1, min_neighbors=4
+    ),
+    # Full resolution, what detect_subject_area always used to do
+    "accurate": DetectionPreset(
+        max_edge=None, scale_factor=1.1, min_neighbors=4
+    ),
+}
+DEFAULT_DETECTION_PRESET = "balanced"
+
+# IMG_1000 .. IMG_9999
+MAX_IPHONE_FILENAMES = 9000
+
+EXIF_INPUT_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# Extension of metadata-only outputs, by source container
+IPHONE_EXTENSIONS = {"JPEG": ".JPG", "PNG": ".PNG", "WEBP": ".WEBP"}
+
+
+def _region_means(rgb):
+    """
+    Compute per-channel means of the full frame, the center crop and the
+    four edge bands in a single pass over the pixel buffer.
+
+    The frame is split into five column bands at the 1/4, 1/3, 2/3 and 3/4
+    boundaries and each band is reduced to per-row channel sums. Every
+    region used by the analysis is a union of rows x bands of that table,
+    so no grayscale or BGR copy of the frame is needed.
 
     Args:
-        img: PIL Image object
+        rgb: uint8 array of shape (..., H, W, 3); leading axes are a batch
+
+    Returns:
+        dict: Region name -> (..., 3) array of RGB means
     """
-    # Convert PIL to OpenCV format
-    img_cv = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-    height, width = img_cv.shape[:2]
+    height, width = rgb.shape[-3], rgb.shape[-2]
+    cols = [0, width // 4, width // 3, 2 * width // 3, 3 * width // 4, width]
+    # Fold the batch axes into rows so each band is one cv2.reduce call
+    rows = np.ascontiguousarray(rgb).reshape(-1, width, 3)
+    band_sums = []
+    for lo, hi in zip(cols[:-1], cols[1:]):
+        if hi > lo:
+            sums = cv2.reduce(
+                rows[:, lo:hi], 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S
+            )
+        else:
+            sums = np.zeros((rows.shape[0], 1, 3), dtype=np.int32)
+        band_sums.append(sums.reshape(rgb.shape[:-2] + (3,)))
+    # (..., 5, H, 3) row sums per column band
+    bands = np.stack(band_sums, axis=-3)
+
+    def region(row_lo, row_hi, band_lo, band_hi):
+        total = bands[..., band_lo:band_hi, row_lo:row_hi, :].sum(axis=(-3, -2))
+        count = (row_hi - row_lo) * (cols[band_hi] - cols[band_lo])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return total / count
+
+    return {
+        "full": region(0, height, 0, 5),
+        "center": region(height // 3, 2 * height // 3, 2, 3),
+        "top": region(0, height // 4, 0, 5),
+        "bottom": region(3 * height // 4, height, 0, 5),
+        "left": region(0, height, 0, 1),
+        "right": region(0, height, 4, 5),
+    }
 
+
+def _analysis_from_means(means, width, height):
+    """Build the analysis dict from the region means of one image."""
     analysis = {
         "width": width,
         "height": height,
@@ -40,8 +141,8 @@ def analyze_image(img):
     analysis["orientation"] = 1
 
     # Calculate brightness (average luminance)
-    gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
-    avg_brightness = np.mean(gray)
+    luma = {name: float(m @ LUMA_WEIGHTS) for name, m in means.items()}
+    avg_brightness = luma["full"]
     # Convert to EXIF brightness value (APEX scale)
     # APEX brightness = log2(B) where B is luminance
     # Normalize to -5 to +10 range
@@ -49,8 +150,7 @@ def analyze_image(img):
 
     # Estimate color temperature
     # Calculate average R, G, B values
-    avg_color = np.mean(img_cv, axis=(0, 1))  # [B, G, R] in OpenCV
-    b_avg, g_avg, r_avg = avg_color
+    r_avg, g_avg, b_avg = means["full"]
 
     # Simple color temperature estimation
     # Warmer images (more red) = lower color temp (2000-4000K)
@@ -71,24 +171,76 @@ def analyze_image(img):
 
     # Detect potential flash usage
     # Flash typically creates bright center with darker edges
-    center_region = gray[
-        height // 3 : 2 * height // 3, width // 3 : 2 * width // 3
-    ]
     edge_brightness = np.mean(
-        [
-            np.mean(gray[0 : height // 4, :]),
-            np.mean(gray[3 * height // 4 :, :]),
-            np.mean(gray[:, 0 : width // 4]),
-            np.mean(gray[:, 3 * width // 4 :]),
-        ]
+        [luma["top"], luma["bottom"], luma["left"], luma["right"]]
     )
-    center_brightness = np.mean(center_region)
+    center_brightness = luma["center"]
 
     if center_brightness > edge_brightness * 1.5 and avg_brightness > 150:
         analysis["has_flash"] = True
 
+    return analysis
+
+
+def _as_rgb_array(img):
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGB")
+    return np.asarray(img)[..., :3]
+
+
+class Frame:
+    """
+    Pixel buffers of one image shared by the analysis and detection steps.
+
+    The RGB array is a view of the decoded image; the BGR and grayscale
+    copies OpenCV needs are converted on first use and then reused.
+
+    Args:
+        rgb: uint8 array of shape (H, W, 3)
+    """
+
+    def __init__(self, rgb):
+        self.rgb = rgb
+
+    @classmethod
+    def from_image(cls, img):
+        return cls(_as_rgb_array(img))
+
+    @property
+    def size(self):
+        """(width, height), like PIL's Image.size."""
+        return self.rgb.shape[1], self.rgb.shape[0]
+
+    @cached_property
+    def bgr(self):
+        return cv2.cvtColor(self.rgb, cv2.COLOR_RGB2BGR)
+
+    @cached_property
+    def gray(self):
+        return cv2.cvtColor(self.rgb, cv2.COLOR_RGB2GRAY)
+
+
+def _as_frame(img):
+    return img if isinstance(img, Frame) else Frame.from_image(img)
+
+
+def analyze_image(img, original_size=None):
+    """
+    Analyze image to extract measurable properties.
+    Returns a dictionary with calculated values.
+
+    Args:
+        img: PIL Image or Frame, may be a reduced-resolution proxy
+        original_size: (width, height) of the full image when `img` is a proxy
+    """
+    rgb = _as_frame(img).rgb
+    height, width = rgb.shape[:2]
+    full_width, full_height = original_size or (width, height)
+
+    analysis = _analysis_from_means(_region_means(rgb), full_width, full_height)
+
     print(
-        f"  Image analysis: {width}x{height}, orientation={analysis['orientation']}, "
+        f"  Image analysis: {full_width}x{full_height}, orientation={analysis['orientation']}, "
         f"brightness={analysis['brightness']:.2f}, color_temp={analysis['color_temp']}K, "
         f"flash={'Yes' if analysis['has_flash'] else 'No'}"
     )
@@ -96,126 +248,193 @@ def analyze_image(img):
     return analysis
 
 
-def estimate_camera_settings(image_analysis):
+def analyze_images_batch(images, original_sizes=None):
     """
-    Estimate realistic camera settings based on image analysis.
-    Returns a dictionary with camera settings.
+    Analyze several images at once.
+
+    Images of the same size are stacked and reduced together, so a batch of
+    thumbnails costs one vectorized pass per distinct size.
 
     Args:
-        image_analysis: Dictionary with analyzed image properties
+        images: List of PIL Images or an (N, H, W, 3) uint8 array
+        original_sizes: Optional list of (width, height) per image
+
+    Returns:
+        list: One analysis dict per image, in input order
+    """
+    if isinstance(images, np.ndarray):
+        means = _region_means(images[..., :3])
+        height, width = images.shape[1:3]
+        return [
+            _analysis_from_means(
+                {name: m[i] for name, m in means.items()},
+                *(original_sizes[i] if original_sizes else (width, height)),
+            )
+            for i in range(len(images))
+        ]
+
+    arrays = [_as_rgb_array(img) for img in images]
+    groups = {}
+    for i, rgb in enumerate(arrays):
+        groups.setdefault(rgb.shape, []).append(i)
+
+    results = [None] * len(arrays)
+    for shape, indices in groups.items():
+        stack = np.stack([arrays[i] for i in indices])
+        means = _region_means(stack)
+        height, width = shape[:2]
+        for j, i in enumerate(indices):
+            size = original_sizes[i] if original_sizes else (width, height)
+            results[i] = _analysis_from_means(
+                {name: m[j] for name, m in means.items()}, *size
+            )
+    return results
+
+
+def analyze_image_file(image_path):
     """
-    brightness = image_analysis["brightness"]
-    has_flash = image_analysis["has_flash"]
+    Analyze an image file without decoding it at full resolution.
 
-    settings = {}
+    Args:
+        image_path: Path to the image
+    """
+    loaded = load_image(image_path, STATS)
+    with loaded.image as img:
+        return analyze_image(
+            Frame.from_image(img), original_size=loaded.original_size
+        )
 
-    # Estimate ISO based on brightness
-    # Darker scenes need higher ISO
-    if has_flash:
-        # Flash photos typically use lower ISO
-        iso_options = [100, 125, 160, 200, 250, 320, 400]
-        settings["iso"] = random.choice(iso_options)
-    elif brightness < -3:  # Very dark
-        iso_options = [1600, 2000, 2500, 3200]
-        settings["iso"] = random.choice(iso_options)
-    elif brightness < 0:  # Dark
-        iso_options = [640, 800, 1000, 1250, 1600]
-        settings["iso"] = random.choice(iso_options)
-    elif brightness < 3:  # Normal
-        iso_options = [200, 250, 320, 400, 500, 640]
-        settings["iso"] = random.choice(iso_options)
-    else:  # Bright
-        iso_options = [32, 50, 64, 80, 100, 125, 160]
-        settings["iso"] = random.choice(iso_options)
-
-    # Estimate shutter speed based on brightness and ISO
-    # Darker = slower shutter, but iPhone has stabilization
+
+# Camera setting choices by exposure class, see _exposure_class
+ISO_OPTIONS = {
+    # Flash photos typically use lower ISO
+    "flash": [100, 125, 160, 200, 250, 320, 400],
+    "very_dark": [1600, 2000, 2500, 3200],
+    "dark": [640, 800, 1000, 1250, 1600],
+    "normal": [200, 250, 320, 400, 500, 640],
+    "bright": [32, 50, 64, 80, 100, 125, 160],
+}
+
+# Darker = slower shutter, but iPhone has stabilization
+SHUTTER_OPTIONS = {
+    # Flash sync speed range
+    "flash": [(1, 60), (1, 80), (1, 100), (1, 125)],
+    "very_dark": [(1, 4), (1, 8), (1, 10), (1, 15)],
+    "dark": [(1, 15), (1, 20), (1, 30), (1, 40), (1, 60)],
+    "normal": [(1, 60), (1, 80), (1, 100), (1, 125), (1, 160), (1, 200)],
+    "bright": [
+        (1, 250),
+        (1, 320),
+        (1, 400),
+        (1, 500),
+        (1, 640),
+        (1, 800),
+        (1, 1000),
+    ],
+}
+
+# iPhone 15 has two main lenses
+# Wide: f/1.6, 5.96mm (26mm equivalent)
+# Ultra-wide: f/2.4, 2.22mm (13mm equivalent)
+IPHONE_LENS_SPEC = (
+    (154, 100),  # Min focal length: 1.54mm
+    (596, 100),  # Max focal length: 5.96mm
+    (16, 10),  # Min f-number: f/1.6
+    (24, 10),  # Max f-number: f/2.4
+)
+WIDE_LENS = {
+    "aperture": (16, 10),  # f/1.6
+    "focal_length": (596, 100),  # 5.96mm
+    "focal_length_35mm": 26,
+    "lens_model": b"iPhone 15 back dual wide camera 5.96mm f/1.6",
+    "lens_spec": IPHONE_LENS_SPEC,
+}
+ULTRA_WIDE_LENS = {
+    "aperture": (24, 10),  # f/2.4
+    "focal_length": (222, 100),  # 2.22mm
+    "focal_length_35mm": 13,
+    "lens_model": b"iPhone 15 back dual wide camera 2.22mm f/2.4",
+    "lens_spec": IPHONE_LENS_SPEC,
+}
+
+# Exposure compensation (usually small adjustments)
+# Bias toward 0, but allow ±1 EV range
+EV_OPTIONS = [
+    (0, 1),  # 0 EV (most common)
+    (0, 1),
+    (0, 1),
+    (0, 1),  # Weight toward 0
+    (-333, 1000),
+    (-667, 1000),  # -0.33, -0.67 EV
+    (333, 1000),
+    (667, 1000),  # +0.33, +0.67 EV
+    (-1000, 1000),
+    (1000, 1000),  # ±1 EV
+]
+
+# Metering mode - multi-pattern is most common on iPhone
+METERING_OPTIONS = [
+    5,  # Multi-spot/Pattern (most common)
+    5,
+    5,
+    5,  # Weight toward multi-pattern
+    2,  # Center-weighted average
+    3,  # Spot
+]
+
+
+def _exposure_class(brightness, has_flash):
     if has_flash:
-        # Flash sync speed range
-        shutter_options = [(1, 60), (1, 80), (1, 100), (1, 125)]
-    elif brightness < -3:  # Very dark
-        shutter_options = [(1, 4), (1, 8), (1, 10), (1, 15)]
-    elif brightness < 0:  # Dark
-        shutter_options = [(1, 15), (1, 20), (1, 30), (1, 40), (1, 60)]
-    elif brightness < 3:  # Normal
-        shutter_options = [
-            (1, 60),
-            (1, 80),
-            (1, 100),
-            (1, 125),
-            (1, 160),
-            (1, 200),
-        ]
-    else:  # Bright
-        shutter_options = [
-            (1, 250),
-            (1, 320),
-            (1, 400),
-            (1, 500),
-            (1, 640),
-            (1, 800),
-            (1, 1000),
-        ]
+        return "flash"
+    if brightness < -3:
+        return "very_dark"
+    if brightness < 0:
+        return "dark"
+    if brightness < 3:
+        return "normal"
+    return "bright"
 
-    settings["shutter_speed"] = random.choice(shutter_options)
-
-    # iPhone 15 has two main lenses
-    # Wide: f/1.6, 5.96mm (26mm equivalent)
-    # Ultra-wide: f/2.4, 2.22mm (13mm equivalent)
-    # Choose based on image aspect and randomness
-    if random.random() < 0.8:  # 80% use wide lens (most common)
-        settings["aperture"] = (16, 10)  # f/1.6
-        settings["focal_length"] = (596, 100)  # 5.96mm
-        settings["focal_length_35mm"] = 26
-        settings["lens_model"] = b"iPhone 15 back dual wide camera 5.96mm f/1.6"
-        settings["lens_spec"] = (
-            (154, 100),  # Min focal length: 1.54mm
-            (596, 100),  # Max focal length: 5.96mm
-            (16, 10),  # Min f-number: f/1.6
-            (24, 10),  # Max f-number: f/2.4
-        )
-    else:  # 20% use ultra-wide
-        settings["aperture"] = (24, 10)  # f/2.4
-        settings["focal_length"] = (222, 100)  # 2.22mm
-        settings["focal_length_35mm"] = 13
-        settings["lens_model"] = b"iPhone 15 back dual wide camera 2.22mm f/2.4"
-        settings["lens_spec"] = (
-            (154, 100),  # Min focal length: 1.54mm
-            (596, 100),  # Max focal length: 5.96mm
-            (16, 10),  # Min f-number: f/1.6
-            (24, 10),  # Max f-number: f/2.4
-        )
 
-    # Exposure compensation (usually small adjustments)
-    # Bias toward 0, but allow ±1 EV range
-    ev_options = [
-        (0, 1),  # 0 EV (most common)
-        (0, 1),
-        (0, 1),
-        (0, 1),  # Weight toward 0
-        (-333, 1000),
-        (-667, 1000),  # -0.33, -0.67 EV
-        (333, 1000),
-        (667, 1000),  # +0.33, +0.67 EV
-        (-1000, 1000),
-        (1000, 1000),  # ±1 EV
-    ]
-    settings["exposure_compensation"] = random.choice(ev_options)
-
-    # Metering mode - vary based on scene
-    # Multi-pattern is most common on iPhone
-    metering_options = [
-        5,  # Multi-spot/Pattern (most common)
-        5,
-        5,
-        5,  # Weight toward multi-pattern
-        2,  # Center-weighted average
-        3,  # Spot
-    ]
-    settings["metering_mode"] = random.choice(metering_options)
+def synthesize_camera_settings(image_analysis, rng):
+    """
+    Draw realistic camera settings for an analyzed image from `rng`.
+
+    Has no side effects besides advancing `rng`, see
+    estimate_camera_settings for the logging variant.
+
+    Args:
+        image_analysis: Dictionary with analyzed image properties
+        rng: random.Random (or the random module) to draw from
 
+    Returns:
+        dict: Camera settings
+    """
+    exposure = _exposure_class(
+        image_analysis["brightness"], image_analysis["has_flash"]
+    )
+    settings = {
+        "iso": rng.choice(ISO_OPTIONS[exposure]),
+        "shutter_speed": rng.choice(SHUTTER_OPTIONS[exposure]),
+    }
+    # 80% use the wide lens (most common), 20% the ultra-wide
+    settings.update(WIDE_LENS if rng.random() < 0.8 else ULTRA_WIDE_LENS)
+    settings["exposure_compensation"] = rng.choice(EV_OPTIONS)
+    settings["metering_mode"] = rng.choice(METERING_OPTIONS)
     # Subsecond time (milliseconds)
-    settings["subsec_time"] = str(random.randint(0, 999)).zfill(3).encode()
+    settings["subsec_time"] = str(rng.randint(0, 999)).zfill(3).encode()
+    return settings
+
+
+def estimate_camera_settings(image_analysis, rng=None):
+    """
+    Estimate realistic camera settings based on image analysis.
+    Returns a dictionary with camera settings.
+
+    Args:
+        image_analysis: Dictionary with analyzed image properties
+        rng: random.Random to draw from (defaults to the global generator)
+    """
+    settings = synthesize_camera_settings(image_analysis, rng or random)
 
     print(
         f"  Camera settings: ISO {settings['iso']}, {settings['shutter_speed'][0]}/{settings['shutter_speed'][1]}s, "
@@ -225,29 +444,82 @@ def estimate_camera_settings(image_analysis):
     return settings
 
 
-def detect_subject_area(img):
+class DetectorContext:
+    """
+    Face cascade and saliency detector, built once and reused for every
+    image. Loading the cascade parses a ~1 MB XML file, far more than a
+    detection on a small frame costs.
+    """
+
+    def __init__(self):
+        self.face_cascade = cv2.CascadeClassifier(
+            cv2.data.haarcascades + FACE_CASCADE
+        )
+        if self.face_cascade.empty():
+            raise ValueError(f"Could not load face cascade {FACE_CASCADE}")
+        # Saliency lives in opencv-contrib, fall back to faces only
+        try:
+            self.saliency = cv2.saliency.StaticSaliencyFineGrained_create()
+        except AttributeError as e:
+            print(f"  Saliency detection unavailable: {e}")
+            self.saliency = None
+
+
+# OpenCV detectors are not safe to share between threads
+_detectors = threading.local()
+
+
+def get_detector_context():
+    """Return this thread's DetectorContext, creating it on first use."""
+    context = getattr(_detectors, "context", None)
+    if context is None:
+        context = _detectors.context = DetectorContext()
+    return context
+
+
+def _scale_box(box, scale_x, scale_y):
+    """Map an (x, y, w, h) box on a proxy back to full-resolution pixels."""
+    x, y, w, h = box
+    return (
+        round(x * scale_x),
+        round(y * scale_y),
+        round(w * scale_x),
+        round(h * scale_y),
+    )
+
+
+def detect_subject_area(
+    img, detectors=None, original_size=None, preset=DEFAULT_DETECTION_PRESET
+):
     """
     Detect the main subject in the image using face detection or saliency.
     Returns (center_x, center_y, width, height) or None if no subject detected.
 
     Args:
-        img: PIL Image object
+        img: PIL Image or Frame, may be a reduced-resolution proxy
+        detectors: DetectorContext (defaults to the per-process context)
+        original_size: (width, height) of the full image when `img` is a
+            proxy, the returned area is in full-resolution pixels
+        preset: Name of a DETECTION_PRESETS entry or a DetectionPreset
     """
-    # Convert PIL to OpenCV format
-    img_cv = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-    height, width = img_cv.shape[:2]
+    frame = _as_frame(img)
+    detectors = detectors or get_detector_context()
+    if isinstance(preset, str):
+        preset = DETECTION_PRESETS[preset]
+    width, height = original_size or frame.size
+    scale_x = width / frame.size[0]
+    scale_y = height / frame.size[1]
 
     # Try face detection first
-    face_cascade = cv2.CascadeClassifier(
-        cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-    )
-    gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
-    faces = face_cascade.detectMultiScale(gray, 1.1, 4)
+    with METRICS.timer("detect_faces"):
+        faces = detectors.face_cascade.detectMultiScale(
+            frame.gray, preset.scale_factor, preset.min_neighbors
+        )
 
     if len(faces) > 0:
         # Use the largest face
         largest_face = max(faces, key=lambda f: f[2] * f[3])
-        x, y, w, h = largest_face
+        x, y, w, h = _scale_box(largest_face, scale_x, scale_y)
         center_x = x + w // 2
         center_y = y + h // 2
         print(
@@ -257,8 +529,12 @@ def detect_subject_area(img):
 
     # If no face, try saliency detection
     try:
-        saliency = cv2.saliency.StaticSaliencyFineGrained_create()
-        success, saliency_map = saliency.computeSaliency(img_cv)
+        success = False
+        if preset.saliency and detectors.saliency is not None:
+            with METRICS.timer("detect_saliency"):
+                success, saliency_map = detectors.saliency.computeSaliency(
+                    frame.bgr
+                )
 
         if success:
             # Threshold the saliency map
@@ -277,7 +553,9 @@ def detect_subject_area(img):
             if contours:
                 # Get the largest contour
                 largest_contour = max(contours, key=cv2.contourArea)
-                x, y, w, h = cv2.boundingRect(largest_contour)
+                x, y, w, h = _scale_box(
+                    cv2.boundingRect(largest_contour), scale_x, scale_y
+                )
                 center_x = x + w // 2
                 center_y = y + h // 2
                 print(
@@ -298,50 +576,71 @@ def detect_subject_area(img):
     return (center_x, center_y, area_w, area_h)
 
 
-def create_exif_data(subject_area=None, image_analysis=None):
+# Fields that are the same for every generated image
+CONSTANT_EXIF_IFD = {
+    piexif.ExifIFD.ExposureProgram: 2,  # Program AE
+    piexif.ExifIFD.ExifVersion: b"0232",
+    piexif.ExifIFD.ColorSpace: 65535,  # Uncalibrated
+    piexif.ExifIFD.SensingMethod: 2,  # One-chip color area
+    piexif.ExifIFD.SceneType: b"\x01",  # Directly photographed
+    piexif.ExifIFD.ExposureMode: 0,  # Auto
+    piexif.ExifIFD.WhiteBalance: 0,  # Auto
+    piexif.ExifIFD.LensMake: b"Apple",
+}
+CONSTANT_ZEROTH_IFD = {
+    piexif.ImageIFD.Make: b"Apple",
+    piexif.ImageIFD.Model: b"iPhone 15",
+    piexif.ImageIFD.XResolution: (72, 1),
+    piexif.ImageIFD.YResolution: (72, 1),
+    piexif.ImageIFD.ResolutionUnit: 2,  # inches
+    piexif.ImageIFD.Software: b"26.0",
+    piexif.ImageIFD.HostComputer: b"iPhone 15",
+}
+
+DEFAULT_SUBJECT_AREA = (1887, 1945, 748, 753)
+DEFAULT_IMAGE_ANALYSIS = {
+    "width": 4032,
+    "height": 3024,
+    "orientation": 6,
+    "brightness": -5.006109058,
+    "color_temp": 4921,
+    "has_flash": False,
+}
+
+# Capture times are spread over the days before the run
+MAX_CAPTURE_AGE_DAYS = 3
+
+
+def _capture_datetime(now, rng):
+    random_dt = now - timedelta(days=rng.uniform(0, MAX_CAPTURE_AGE_DAYS))
+    return random_dt.strftime("%Y:%m:%d %H:%M:%S").encode()
+
+
+def build_exif_dict(
+    subject_area, image_analysis, camera_settings, datetime_str
+):
     """
-    Create EXIF data dictionary based on the sample.txt reference.
-    Returns a piexif-compatible EXIF dictionary.
+    Assemble the piexif dictionary from already chosen values.
 
     Args:
-        subject_area: Tuple of (center_x, center_y, width, height) for the main subject
+        subject_area: Tuple of (center_x, center_y, width, height)
         image_analysis: Dictionary with analyzed image properties
-    """
-
-    now = datetime.now()
-    random_days = random.uniform(0, 3)
-    random_dt = now - timedelta(days=random_days)
-    datetime_str = random_dt.strftime("%Y:%m:%d %H:%M:%S").encode()
-
-    # Use provided subject area or default
-    if subject_area is None:
-        subject_area = (1887, 1945, 748, 753)
-
-    # Use analyzed values or defaults
-    if image_analysis is None:
-        image_analysis = {
-            "width": 4032,
-            "height": 3024,
-            "orientation": 6,
-            "brightness": -5.006109058,
-            "color_temp": 4921,
-            "has_flash": False,
-        }
+        camera_settings: Dictionary from synthesize_camera_settings
+        datetime_str: Capture time as EXIF b"YYYY:MM:DD HH:MM:SS"
 
+    Returns:
+        dict: piexif-compatible EXIF dictionary
+    """
     # Calculate brightness value for EXIF (as rational)
     # Use smaller denominator to keep within 32-bit signed integer limits
     brightness_rational = (int(image_analysis["brightness"] * 1000000), 1000000)
 
-    # Estimate realistic camera settings
-    camera_settings = estimate_camera_settings(image_analysis)
-
     # EXIF IFD (Image File Directory)
     exif_ifd = {
+        **CONSTANT_EXIF_IFD,
         piexif.ExifIFD.ExposureTime: camera_settings["shutter_speed"],
         piexif.ExifIFD.FNumber: camera_settings["aperture"],
-        piexif.ExifIFD.ExposureProgram: 2,  # Program AE
         piexif.ExifIFD.ISOSpeedRatings: camera_settings["iso"],
-        piexif.ExifIFD.ExifVersion: b"0232",
         piexif.ExifIFD.DateTimeOriginal: datetime_str,
         piexif.ExifIFD.DateTimeDigitized: datetime_str,
         piexif.ExifIFD.ShutterSpeedValue: camera_settings["shutter_speed"],
@@ -358,41 +657,166 @@ def create_exif_data(subject_area=None, image_analysis=None):
         piexif.ExifIFD.SubjectArea: subject_area,
         piexif.ExifIFD.SubSecTimeOriginal: camera_settings["subsec_time"],
         piexif.ExifIFD.SubSecTimeDigitized: camera_settings["subsec_time"],
-        piexif.ExifIFD.ColorSpace: 65535,  # Uncalibrated
         piexif.ExifIFD.PixelXDimension: image_analysis["width"],
         piexif.ExifIFD.PixelYDimension: image_analysis["height"],
-        piexif.ExifIFD.SensingMethod: 2,  # One-chip color area
-        piexif.ExifIFD.SceneType: b"\x01",  # Directly photographed
-        piexif.ExifIFD.ExposureMode: 0,  # Auto
-        piexif.ExifIFD.WhiteBalance: 0,  # Auto
         piexif.ExifIFD.FocalLengthIn35mmFilm: camera_settings[
             "focal_length_35mm"
         ],
         piexif.ExifIFD.LensSpecification: camera_settings["lens_spec"],
-        piexif.ExifIFD.LensMake: b"Apple",
         piexif.ExifIFD.LensModel: camera_settings["lens_model"],
     }
 
     # 0th IFD (Main Image)
     zeroth_ifd = {
-        piexif.ImageIFD.Make: b"Apple",
-        piexif.ImageIFD.Model: b"iPhone 15",
+        **CONSTANT_ZEROTH_IFD,
         piexif.ImageIFD.Orientation: image_analysis["orientation"],
-        piexif.ImageIFD.XResolution: (72, 1),
-        piexif.ImageIFD.YResolution: (72, 1),
-        piexif.ImageIFD.ResolutionUnit: 2,  # inches
-        piexif.ImageIFD.Software: b"26.0",
         piexif.ImageIFD.DateTime: datetime_str,
-        piexif.ImageIFD.HostComputer: b"iPhone 15",
     }
 
     # Combine all IFDs
-    exif_dict = {
+    return {
         "0th": zeroth_ifd,
         "Exif": exif_ifd,
     }
 
-    return exif_dict
+
+def create_exif_data(subject_area=None, image_analysis=None, rng=None):
+    """
+    Create EXIF data dictionary based on the sample.txt reference.
+    Returns a piexif-compatible EXIF dictionary.
+
+    Args:
+        subject_area: Tuple of (center_x, center_y, width, height) for the main subject
+        image_analysis: Dictionary with analyzed image properties
+        rng: random.Random to draw from (defaults to the global generator)
+    """
+    rng = rng or random
+    datetime_str = _capture_datetime(datetime.now(), rng)
+
+    # Use provided subject area and analyzed values or defaults
+    if subject_area is None:
+        subject_area = DEFAULT_SUBJECT_AREA
+    if image_analysis is None:
+        image_analysis = DEFAULT_IMAGE_ANALYSIS
+
+    # Estimate realistic camera settings
+    camera_settings = estimate_camera_settings(image_analysis, rng)
+
+    return build_exif_dict(
+        subject_area, image_analysis, camera_settings, datetime_str
+    )
+
+
+class ExifBatch:
+    """
+    Dumps the EXIF of many images through one shared ExifTemplate.
+
+    The first image is dumped with piexif and becomes the template, later
+    images only patch the fields that vary. Every capture time is drawn
+    back from the same `now`. Nothing is printed. Safe to share between
+    threads.
+
+    Args:
+        now: datetime the capture times are drawn back from (defaults to
+            when the batch is created)
+    """
+
+    def __init__(self, now=None):
+        self.now = now or datetime.now()
+        self._template = None
+        self._lock = threading.Lock()
+
+    def _get_template(self, exif_dict):
+        with self._lock:
+            if self._template is None:
+                self._template = ExifTemplate(
+                    exif_dict,
+                    {
+                        ifd_name: [tag for tag in ifd if tag not in constant]
+                        for (ifd_name, ifd), constant in zip(
+                            exif_dict.items(),
+                            (CONSTANT_ZEROTH_IFD, CONSTANT_EXIF_IFD),
+                        )
+                    },
+                )
+            return self._template
+
+    def generate(self, image_analysis, subject_area=None, rng=None):
+        """
+        Draw camera settings and a capture time for one image and dump its
+        EXIF. Draws from `rng` in the same order as create_exif_data.
+
+        Args:
+            image_analysis: Analysis dict, see analyze_image
+            subject_area: (center_x, center_y, width, height), None for
+                DEFAULT_SUBJECT_AREA
+            rng: random.Random to draw from (defaults to the global
+                generator)
+
+        Returns:
+            tuple: (exif_bytes, datetime_str, camera_settings)
+        """
+        rng = rng or random
+        if subject_area is None:
+            subject_area = DEFAULT_SUBJECT_AREA
+        datetime_str = _capture_datetime(self.now, rng)
+        camera_settings = synthesize_camera_settings(image_analysis, rng)
+        exif_dict = build_exif_dict(
+            subject_area, image_analysis, camera_settings, datetime_str
+        )
+        template = self._template or self._get_template(exif_dict)
+        return template.dump(exif_dict), datetime_str, camera_settings
+
+
+def create_exif_batch(
+    analyses, subject_areas=None, seed=None, now=None, log=None
+):
+    """
+    Generate dumped EXIF for many images without touching any pixels.
+
+    All random choices come from one generator seeded with `seed`, and every
+    capture time is relative to a single `now`, so a batch is reproducible.
+    Nothing is printed; pass `log` to receive one record per image.
+
+    Args:
+        analyses: Analysis dicts (see analyze_image), one per image
+        subject_areas: Optional (center_x, center_y, width, height) per
+            image, None entries use DEFAULT_SUBJECT_AREA
+        seed: Seed for the batch generator, None for random
+        now: datetime the capture times are drawn back from
+        log: Optional callable receiving a dict per generated image
+
+    Returns:
+        list: piexif.dump bytes, in input order
+    """
+    rng = random.Random(seed)
+    batch = ExifBatch(now)
+
+    results = []
+    for i, image_analysis in enumerate(analyses):
+        subject_area = subject_areas[i] if subject_areas else None
+        if subject_area is None:
+            subject_area = DEFAULT_SUBJECT_AREA
+        exif_bytes, datetime_str, camera_settings = batch.generate(
+            image_analysis, subject_area, rng
+        )
+        results.append(exif_bytes)
+        if log is not None:
+            log(
+                {
+                    "index": i,
+                    "datetime": datetime_str.decode(),
+                    "iso": camera_settings["iso"],
+                    "shutter_speed": "{}/{}".format(
+                        *camera_settings["shutter_speed"]
+                    ),
+                    "f_number": camera_settings["aperture"][0]
+                    / camera_settings["aperture"][1],
+                    "focal_length_35mm": camera_settings["focal_length_35mm"],
+                    "subject_area": list(subject_area),
+                }
+            )
+    return results
 
 
 def generate_iphone_filename(directory, counter, prefix=None):
@@ -403,7 +827,9 @@ def generate_iphone_filename(directory, counter, prefix=None):
     Args:
         directory: Directory where the file will be saved
         counter: Sequential counter for the last 2 digits (00-99)
-        prefix: Fixed 2-digit prefix (if None, generates a random one)
+        prefix: 2-digit prefix (if None, generates a random one). Rolls over
+            to the next prefix when the counter wraps, so names never repeat
+            within 9000 calls
 
     Returns:
         tuple: (filename, next_counter, prefix)
@@ -415,53 +841,195 @@ def generate_iphone_filename(directory, counter, prefix=None):
     # Increment counter for sequential numbering
     next_counter = counter + 1
 
-    # Handle counter overflow (reset to 0 after 99)
+    # Handle counter overflow: reset to 0 after 99 and move to the next
+    # prefix (99 rolls over to 10) instead of reusing IMG_XX00
     if next_counter > 99:
         next_counter = 0
+        prefix = prefix + 1 if prefix < 99 else 10
 
     # Format: IMG_XXYY.PNG where XX is prefix, YY is counter
     img_number = prefix * 100 + next_counter
     return f"IMG_{img_number:04d}.PNG", next_counter, prefix
 
 
-def modify_image_exif(input_path, output_path=None):
+def allocate_iphone_filenames(count, rng=None, taken=()):
     """
-    Modify the EXIF metadata of an image.
+    Assign `count` distinct iPhone-style filenames up front.
+
+    The starting prefix is drawn from `rng` and numbering continues across
+    prefixes, skipping any name in `taken` (e.g. files already in the output
+    folder).
 
     Args:
-        input_path: Path to the input image
-        output_path: Path to save the modified image (if None, generates iPhone-style name)
+        count: Number of names needed
+        rng: random.Random for the starting prefix (defaults to the global
+            generator)
+        taken: Filenames that must not be reused, compared without their
+            extension so IMG_1234.JPG also blocks IMG_1234.PNG
+
+    Returns:
+        list: Filenames (with a .PNG extension) in allocation order
     """
+    if count > MAX_IPHONE_FILENAMES:
+        raise ValueError(
+            f"Cannot allocate {count} names, only {MAX_IPHONE_FILENAMES} "
+            "IMG_XXYY names exist"
+        )
+    rng = rng or random
+    taken = {os.path.splitext(name)[0].upper() for name in taken}
+    prefix = rng.randint(10, 99)
+    counter = 0
 
-    if not os.path.exists(input_path):
-        print(f"Error: File '{input_path}' not found.")
-        return False
+    names = []
+    for _ in range(MAX_IPHONE_FILENAMES):
+        if len(names) == count:
+            break
+        name, counter, prefix = generate_iphone_filename(None, counter, prefix)
+        stem = os.path.splitext(name)[0]
+        if stem not in taken:
+            names.append(name)
+            taken.add(stem)
+    if len(names) < count:
+        raise ValueError(f"Only {len(names)} unused IMG_XXYY names left")
+    return names
+
+
+def iphone_output_name(name, input_path, metadata_only=False):
+    """
+    Give an allocated IMG_XXYY name the extension of the file that will be
+    written: the source container when EXIF is injected, PNG otherwise.
+    """
+    source_format = injectable_format(input_path) if metadata_only else None
+    extension = IPHONE_EXTENSIONS.get(source_format, ".PNG")
+    return os.path.splitext(name)[0] + extension
 
-    # Open the image
-    img = Image.open(input_path)
 
-    # Analyze image properties
+def lookup_exif_analysis(index, input_path, preset, st=None):
+    """
+    Indexed analysis of `input_path` for `preset`.
+
+    Returns:
+        tuple: (image_analysis, subject_area), or None when the image isn't
+            indexed, has changed, or wasn't detected with this preset
+    """
+    if index is None:
+        return None
+    entry = index.lookup(input_path, st)
+    if entry is None or entry.analysis is None:
+        return None
+    subject_area = entry.subjects.get(preset.key)
+    if subject_area is None:
+        return None
+    print(f"Using indexed analysis for {input_path}")
+    return entry.analysis, subject_area
+
+
+def decode_for_exif(input_path, preset, metadata_only=False, analyzed=False):
+    """
+    Decode an image at the resolution its EXIF pass needs.
+
+    Pixels are only needed at full resolution to re-encode them or to
+    detect on the full frame, otherwise a reduced decode is enough. An
+    `analyzed` image whose EXIF is injected isn't decoded at all.
+
+    Returns:
+        tuple: (image, original_size, inject) where inject tells whether
+            the EXIF can be injected without re-encoding; image and
+            original_size are None when nothing was decoded
+    """
+    inject = metadata_only and injectable_format(input_path) is not None
+    if inject and analyzed:
+        return None, None, inject
+    resolution = FULL if not inject or preset.max_edge is None else STATS
+    with METRICS.timer("decode"):
+        loaded = load_image(input_path, resolution)
+    return loaded.image, loaded.original_size, inject
+
+
+def analyze_for_exif(
+    img, original_size, preset, index=None, input_path=None, st=None
+):
+    """
+    Analyze an image and detect its subject.
+
+    Args:
+        img: Decoded image, see decode_for_exif
+        original_size: (width, height) of the image in the file
+        preset: DetectionPreset
+        index: Optional ImageIndex the result is recorded in
+        input_path: Path the result is recorded under
+        st: os.stat result taken before decoding
+
+    Returns:
+        tuple: (image_analysis, subject_area)
+    """
+    # Analysis and detection run on reduced proxies; when they share a size
+    # the frame (and its gray/BGR copies) is reused
+    with METRICS.timer("proxy"):
+        stats_frame = Frame.from_image(reduce_to(img, STATS_MAX_EDGE))
+        if preset.max_edge == STATS_MAX_EDGE:
+            detect_frame = stats_frame
+        elif preset.max_edge is None:
+            detect_frame = Frame.from_image(img)
+        else:
+            detect_frame = Frame.from_image(reduce_to(img, preset.max_edge))
+
     print("Analyzing image properties...")
-    image_analysis = analyze_image(img)
+    with METRICS.timer("analyze"):
+        image_analysis = analyze_image(stats_frame, original_size=original_size)
 
     # Detect subject area
     print("Detecting subject in image...")
-    subject_area = detect_subject_area(img)
+    subject_area = detect_subject_area(
+        detect_frame,
+        get_detector_context(),
+        original_size=original_size,
+        preset=preset,
+    )
+
+    if index is not None:
+        index.record_analysis(
+            input_path, image_analysis, subject_area, preset.key, st=st
+        )
+    return image_analysis, subject_area
+
+
+def exif_for_analysis(analyzed, rng=None, batch=None):
+    """
+    Generate EXIF for an `analyze_for_exif` result.
+
+    Args:
+        batch: Optional ExifBatch dumping the EXIF through its template,
+            without printing the camera settings
 
-    # Create EXIF data with detected subject area and analysis
+    Returns:
+        bytes: piexif-dumped EXIF
+    """
+    image_analysis, subject_area = analyzed
+    if batch is not None:
+        return batch.generate(image_analysis, subject_area, rng)[0]
     exif_dict = create_exif_data(
-        subject_area=subject_area, image_analysis=image_analysis
+        subject_area=subject_area, image_analysis=image_analysis, rng=rng
     )
-    exif_bytes = piexif.dump(exif_dict)
+    return piexif.dump(exif_dict)
 
-    # Determine output path - generate iPhone-style filename
-    if output_path is None:
-        input_dir = os.path.dirname(os.path.abspath(input_path))
-        output_filename = generate_iphone_filename(input_dir, 0)
-        output_path = os.path.join(input_dir, output_filename)
+
+def write_exif_image(img, input_path, output_path, exif_bytes, inject=False):
+    """
+    Write the image with its new EXIF, injecting it into a copy of the
+    source when `inject` is set and re-encoding as PNG otherwise. Closes
+    `img`.
+    """
+    if inject:
+        if img is not None:
+            img.close()
+        with METRICS.timer("inject"):
+            inject_exif(exif_bytes, input_path, output_path)
+        return
 
     # Save image with new EXIF data
     # Convert to RGB if necessary (for PNG or other formats)
+    source = img
     if img.mode in ("RGBA", "LA", "P"):
         # Create a white background
         background = Image.new("RGB", img.size, (255, 255, 255))
@@ -478,31 +1046,292 @@ def modify_image_exif(input_path, output_path=None):
         img = img.convert("RGB")
 
     # Save with EXIF data as PNG
-    img.save(output_path, "PNG", exif=exif_bytes)
+    try:
+        with METRICS.timer("encode"):
+            img.save(output_path, "PNG", exif=exif_bytes)
+    finally:
+        img.close()
+        source.close()
+
+
+def modify_image_exif(
+    input_path,
+    output_path=None,
+    preset=DEFAULT_DETECTION_PRESET,
+    rng=None,
+    metadata_only=False,
+    index=None,
+):
+    """
+    Modify the EXIF metadata of an image.
+
+    Args:
+        input_path: Path to the input image
+        output_path: Path to save the modified image (if None, generates iPhone-style name)
+        preset: Subject detection preset, see DETECTION_PRESETS
+        rng: random.Random for the generated camera settings
+        metadata_only: Inject the EXIF into a copy of the source file
+            instead of re-encoding it as PNG (JPEG, PNG and WebP inputs;
+            other formats are still re-encoded)
+        index: Optional ImageIndex; an unchanged indexed image is not
+            analyzed again
+    """
+
+    if not os.path.exists(input_path):
+        print(f"Error: File '{input_path}' not found.")
+        return False
+
+    if isinstance(preset, str):
+        preset = DETECTION_PRESETS[preset]
+
+    st = os.stat(input_path)
+    analyzed = lookup_exif_analysis(index, input_path, preset, st)
+    img, original_size, inject = decode_for_exif(
+        input_path, preset, metadata_only, analyzed is not None
+    )
+    if analyzed is None:
+        analyzed = analyze_for_exif(
+            img, original_size, preset, index, input_path, st
+        )
+    exif_bytes = exif_for_analysis(analyzed, rng)
+
+    # Determine output path - generate iPhone-style filename
+    if output_path is None:
+        input_dir = os.path.dirname(os.path.abspath(input_path))
+        (output_filename,) = allocate_iphone_filenames(
+            1, rng, taken=os.listdir(input_dir)
+        )
+        output_path = os.path.join(
+            input_dir,
+            iphone_output_name(output_filename, input_path, metadata_only),
+        )
+
+    write_exif_image(img, input_path, output_path, exif_bytes, inject)
 
     print(f"✓ Successfully processed: {input_path}")
-    print(f"  Saved to: {output_path}")
+    print(f"  Saved to: {output_path}{' (metadata only)' if inject else ''}")
 
     return True
 
 
-def modify_image_exif_folder(input_folder, output_folder):
+# This pool process's ExifBatch, see _init_exif_worker
+_exif_batch = None
+
+
+def _init_exif_worker(now):
+    global _exif_batch
+    # Load the detectors once per worker process instead of once per image
+    get_detector_context()
+    _exif_batch = ExifBatch(now)
+
+
+def _exif_job(job):
+    """
+    Decode, analyze and write one image in a pool process.
+
+    Returns:
+        tuple: (input_path, output_path, st, analyzed, stages) where
+            analyzed is the new (image_analysis, subject_area) to record in
+            the index, None when it came from the index, and stages maps
+            each timed stage to its seconds
+    """
+    input_path, output_path, job_seed, st, analyzed, preset, metadata_only = job
+    # Each job reports only its own stage timings back to the parent
+    METRICS.reset()
+    img, original_size, inject = decode_for_exif(
+        input_path, preset, metadata_only, analyzed is not None
+    )
+    fresh = None
+    try:
+        if analyzed is None:
+            analyzed = fresh = analyze_for_exif(img, original_size, preset)
+        with METRICS.timer("exif"):
+            exif_bytes = exif_for_analysis(
+                analyzed, random.Random(job_seed), _exif_batch
+            )
+    except Exception:
+        if img is not None:
+            img.close()
+        raise
+    write_exif_image(img, input_path, output_path, exif_bytes, inject)
+    stages = {stage: h.sum for stage, h in METRICS.histograms.items()}
+    return input_path, output_path, st, fresh, stages
+
+
+def plan_exif_jobs(
+    input_folder, output_folder, seed=None, metadata_only=False, skip=()
+):
+    """
+    Pair every image in `input_folder` with its output path.
+
+    Images whose absolute path is in `skip` (e.g. near-duplicates, see
+    image_dedupe.load_duplicates) are left out. Names are allocated up
+    front in sorted input order, skipping files that already exist in
+    `output_folder`. Each job gets its own RNG seed derived
+    from `seed` and the input name, so the generated metadata does not
+    depend on which worker picks the job up.
+
+    Returns:
+        list: (input_path, output_path, job_seed) tuples
+    """
+    with os.scandir(input_folder) as it:
+        entries = sorted(
+            (
+                e
+                for e in it
+                if e.is_file()
+                and os.path.splitext(e.name)[1].lower() in EXIF_INPUT_EXTENSIONS
+                and os.path.abspath(e.path) not in skip
+            ),
+            key=lambda e: e.name,
+        )
+    names = allocate_iphone_filenames(
+        len(entries), random.Random(seed), taken=os.listdir(output_folder)
+    )
+
+    jobs = []
+    for entry, name in zip(entries, names):
+        job_seed = None if seed is None else f"{seed}:{entry.name}"
+        name = iphone_output_name(name, entry.path, metadata_only)
+        jobs.append((entry.path, os.path.join(output_folder, name), job_seed))
+    return jobs
+
+
+def modify_image_exif_folder(
+    input_folder,
+    output_folder,
+    preset=DEFAULT_DETECTION_PRESET,
+    workers=None,
+    seed=None,
+    metadata_only=False,
+    stage_workers=None,
+    index=None,
+    skip=(),
+    processes=False,
+):
+    """
+    Stamp EXIF metadata on every image in `input_folder` with a
+    decode -> analyze -> write pipeline. With `processes` the decode,
+    analysis and write of each image run in one pool process instead, in a
+    lookup -> process -> record pipeline.
+
+    Args:
+        input_folder: Folder containing the source images
+        output_folder: Folder the IMG_XXYY files are written to
+        preset: Subject detection preset, see DETECTION_PRESETS
+        workers: Workers per stage (None for the CPU count)
+        seed: Seed for filenames and camera settings, None for random
+        metadata_only: Inject EXIF into copies of the sources instead of
+            re-encoding them as PNG, see modify_image_exif
+        stage_workers: Optional {"decode": n, "analyze": n, "write": n}
+            overrides ({"lookup": n, "process": n, "record": n} with
+            `processes`)
+        index: Optional ImageIndex; unchanged indexed images skip analysis
+            and, with `metadata_only`, decoding
+        skip: Absolute paths of images to leave out, see plan_exif_jobs
+        processes: Run the pixel work in a pool of `workers` processes,
+            each loading its own detectors, instead of threads
+
+    Returns:
+        dict: Counts of processed and failed images
+    """
     if not output_folder:
         output_folder = input_folder
+    os.makedirs(output_folder, exist_ok=True)
+    if isinstance(preset, str):
+        preset = DETECTION_PRESETS[preset]
 
-    # Start counter at 0, prefix will be randomly generated on first call
-    counter = 0
-    prefix = None
-
-    for filename in os.listdir(input_folder):
-        _, file_extension = os.path.splitext(filename)
-        if file_extension.lower() in (".jpg", ".jpeg", ".png"):
-            input_path = os.path.join(input_folder, filename)
-            output_file_name, counter, prefix = generate_iphone_filename(
-                output_folder, counter, prefix
-            )
-            output_path = os.path.join(output_folder, output_file_name)
-            modify_image_exif(input_path, output_path)
+    jobs = plan_exif_jobs(
+        input_folder, output_folder, seed, metadata_only, skip
+    )
+    # Every image shares the EXIF layout, so only the first one is dumped
+    # with piexif
+    batch = ExifBatch()
+
+    def decode(job):
+        input_path, output_path, job_seed = job
+        st = os.stat(input_path)
+        analyzed = lookup_exif_analysis(index, input_path, preset, st)
+        img, original_size, inject = decode_for_exif(
+            input_path, preset, metadata_only, analyzed is not None
+        )
+        return (*job, st, analyzed, img, original_size, inject)
+
+    def analyze(decoded):
+        input_path, output_path, job_seed, st, analyzed = decoded[:5]
+        img, original_size, inject = decoded[5:]
+        try:
+            if analyzed is None:
+                analyzed = analyze_for_exif(
+                    img, original_size, preset, index, input_path, st
+                )
+            with METRICS.timer("exif"):
+                exif_bytes = exif_for_analysis(
+                    analyzed, random.Random(job_seed), batch
+                )
+        except Exception:
+            if img is not None:
+                img.close()
+            raise
+        return input_path, output_path, img, exif_bytes, inject
+
+    def write(analyzed):
+        input_path, output_path, img, exif_bytes, inject = analyzed
+        write_exif_image(img, input_path, output_path, exif_bytes, inject)
+        print(f"✓ Successfully processed: {input_path}")
+        print(f"  Saved to: {output_path}")
+        return output_path
+
+    def lookup(job):
+        input_path = job[0]
+        st = os.stat(input_path)
+        analyzed = lookup_exif_analysis(index, input_path, preset, st)
+        return (*job, st, analyzed, preset, metadata_only)
+
+    def record(processed):
+        input_path, output_path, st, analyzed, stages = processed
+        for stage, seconds in stages.items():
+            METRICS.observe(stage, seconds)
+        if index is not None and analyzed is not None:
+            index.record_analysis(input_path, *analyzed, preset.key, st=st)
+        print(f"✓ Successfully processed: {input_path}")
+        print(f"  Saved to: {output_path}")
+        return output_path
+
+    def on_error(item, e):
+        print(f"Error processing '{item[0]}': {e}")
+
+    workers = workers or os.cpu_count() or 1
+    if processes:
+        stages = [
+            Stage("lookup", lookup, on_error=on_error),
+            Stage(
+                "process",
+                _exif_job,
+                workers,
+                on_error=on_error,
+                processes=True,
+                initializer=partial(_init_exif_worker, batch.now),
+            ),
+            Stage("record", record, on_error=on_error),
+        ]
+    else:
+        stages = [
+            Stage("decode", decode, workers, on_error=on_error),
+            Stage("analyze", analyze, workers, on_error=on_error),
+            Stage("write", write, workers, on_error=on_error),
+        ]
+    stats = Pipeline(stages, stage_workers).run(jobs)
+    counts = {"processed": stats.stages[-1].processed, "failed": stats.failed}
+
+    print(f"Processed {counts['processed']}, failed {counts['failed']}")
+    print("Pipeline:")
+    print(stats.summary())
+    print("Stage timings:")
+    print(METRICS.format_stages())
+    if index is not None:
+        print("Image index:", index.summary())
+    return counts
 
 
 if __name__ == "__main__":
@@ -510,15 +1339,89 @@ if __name__ == "__main__":
         description="Modify EXIF metadata of images"
     )
     parser.add_argument("input_path", help="Path to image file or folder")
+    parser.add_argument(
+        "--preset",
+        default=DEFAULT_DETECTION_PRESET,
+        choices=sorted(DETECTION_PRESETS),
+        help="Subject detection accuracy/speed trade-off",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Workers per pipeline stage for folders (defaults to the CPU "
+        "count)",
+    )
+    parser.add_argument(
+        "--stage-workers",
+        type=parse_stage_workers,
+        help="Per-stage workers, e.g. decode=2,analyze=4,write=4",
+    )
+    parser.add_argument(
+        "--processes",
+        action="store_true",
+        help="Process folders in worker processes instead of threads",
+    )
+    parser.add_argument(
+        "--seed",
+        help="Seed filenames and camera settings for reproducible runs",
+    )
+    parser.add_argument(
+        "--metadata-only",
+        action="store_true",
+        help="Keep the source format and only rewrite the EXIF (no re-encode)",
+    )
+    parser.add_argument(
+        "--index",
+        default=DEFAULT_INDEX_PATH,
+        help="Path to the image index database",
+    )
+    parser.add_argument(
+        "--no-index",
+        action="store_true",
+        help="Analyze every image, ignoring the image index",
+    )
+    parser.add_argument(
+        "--skip-duplicates",
+        metavar="REPORT",
+        default=None,
+        help="Leave out the duplicates listed in an image_dedupe report",
+    )
     args = parser.parse_args()
 
     input_path = args.input_path
+    rng = random.Random(args.seed) if args.seed is not None else None
+    index = None if args.no_index else ImageIndex(args.index)
 
     if os.path.isdir(input_path):
         print(f"Modifying images in folder: {input_path}")
         output_path = os.path.join(input_path, "exif_output")
         os.makedirs(output_path, exist_ok=True)
-        modify_image_exif_folder(input_path, output_path)
+        modify_image_exif_folder(
+            input_path,
+            output_path,
+            args.preset,
+            workers=args.workers,
+            seed=args.seed,
+            metadata_only=args.metadata_only,
+            stage_workers=args.stage_workers,
+            index=index,
+            processes=args.processes,
+            skip=(
+                load_duplicates(args.skip_duplicates)
+                if args.skip_duplicates
+                else ()
+            ),
+        )
     else:
         print(f"Modifying image: {input_path}")
-        modify_image_exif(input_path)
+        modify_image_exif(
+            input_path,
+            preset=args.preset,
+            rng=rng,
+            metadata_only=args.metadata_only,
+            index=index,
+        )
+
+    if index is not None:
+        index.close()
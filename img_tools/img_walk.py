@@ -0,0 +1,113 @@
+"""
+Streaming dataset walker built on `os.scandir`.
+
+Each directory is listed once: image files are filtered by extension and
+matched against the captions found in the same listing, so only images
+that still need work are yielded and no per-file `exists`/`isfile` calls
+are made.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+
+@dataclass(frozen=True)
+class WorkItem:
+    path: str
+    caption_path: Optional[str] = None
+
+    def __str__(self):
+        return self.path
+
+
+def iter_image_entries(root, extensions=IMAGE_EXTENSIONS, recursive=True):
+    """
+    Yield `os.DirEntry` objects for image files under `root`.
+
+    Hidden directories are skipped. Entries are yielded in name order per
+    directory so runs are deterministic.
+    """
+    for entries in _iter_listings(root, recursive):
+        for entry in entries:
+            if os.path.splitext(entry.name)[1].lower() in extensions:
+                yield entry
+
+
+def _iter_listings(root, recursive):
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        files, subdirs = [], []
+        with os.scandir(directory) as it:
+            for entry in it:
+                # is_file/is_dir use the d_type cached by scandir
+                if entry.is_file():
+                    files.append(entry)
+                elif recursive and entry.is_dir():
+                    if not entry.name.startswith("."):
+                        subdirs.append(entry.path)
+        files.sort(key=lambda e: e.name)
+        yield files
+        pending.extend(sorted(subdirs, reverse=True))
+
+
+def _changed_since(entry, captioned):
+    """Whether the image `entry` differs from its version in `captioned`."""
+    recorded = captioned.get(os.path.abspath(entry.path)) if captioned else None
+    if recorded is None:
+        return False
+    st = entry.stat()
+    return (st.st_size, st.st_mtime_ns) != recorded
+
+
+def iter_caption_jobs(
+    root,
+    extensions=IMAGE_EXTENSIONS,
+    recursive=True,
+    skip_captioned=True,
+    captioned=None,
+):
+    """
+    Yield a WorkItem for every image that has no non-empty caption yet.
+
+    Args:
+        root: Dataset directory
+        extensions: Image extensions to include
+        recursive: Descend into subdirectories
+        skip_captioned: Drop images whose `.txt` caption exists and is
+            non-empty
+        captioned: Optional {absolute path: (size, mtime_ns)} of the
+            images as they were when captioned, e.g. from the image index.
+            Such an image that changed since is yielded again, its caption
+            is stale.
+    """
+    for entries in _iter_listings(root, recursive):
+        captions = {}
+        images = []
+        for entry in entries:
+            stem, ext = os.path.splitext(entry.name)
+            ext = ext.lower()
+            if ext == ".txt":
+                captions[stem] = entry
+            elif ext in extensions:
+                images.append((stem, entry))
+
+        for stem, entry in images:
+            caption = captions.get(stem)
+            if skip_captioned and caption is not None:
+                try:
+                    if caption.stat().st_size > 0 and not _changed_since(
+                        entry, captioned
+                    ):
+                        continue
+                except OSError:
+                    pass
+            yield WorkItem(
+                path=entry.path,
+                caption_path=os.path.join(
+                    os.path.dirname(entry.path), stem + ".txt"
+                ),
+            )
@@ -0,0 +1,321 @@
+"""
+Staged pipelines with bounded queues, shared by the img_tools scripts.
+
+A Pipeline feeds the items of a source iterable (the discover stage)
+through a chain of stages. Each stage has its own workers and a bounded
+input queue. When a stage falls behind, the stages in front of it block
+on the full queue (backpressure), so decoded images never pile up in
+memory, while I/O-bound and CPU-bound stages keep overlapping. PIL, numpy
+and OpenCV release the GIL while decoding, resizing and encoding, so
+thread workers scale for most of the pixel work as well. Stages whose
+work holds the GIL can run their function in a process pool instead.
+
+Stage functions take one item and return the item for the next stage, or
+None to drop it. Coroutine functions run on an event loop owned by the
+stage, with `workers` calls in flight. Functions of process stages must
+be picklable, as must the items they take and return.
+"""
+
+import asyncio
+import functools
+import inspect
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+# End-of-stream marker, one per worker of the receiving stage
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    """
+    Args:
+        name: Stage name used in the stats
+        fn: Callable or coroutine function processing one item
+        workers: Number of concurrent calls
+        queue_size: Capacity of the stage's input queue (defaults to twice
+            the number of workers)
+        on_error: Optional callable(item, exception) for failed items,
+            the default prints the error. The item is dropped either way;
+            exceptions raised by the handler are printed and swallowed.
+        processes: Run `fn` in a pool of `workers` processes, for work
+            that holds the GIL. `on_error` still runs in this process.
+        initializer: Optional callable run once in each pool process,
+            e.g. to load per-worker state
+    """
+
+    name: str
+    fn: Callable
+    workers: int = 1
+    queue_size: Optional[int] = None
+    on_error: Optional[Callable] = None
+    processes: bool = False
+    initializer: Optional[Callable] = None
+
+
+@dataclass
+class StageStats:
+    name: str
+    workers: int
+    processed: int = 0
+    dropped: int = 0
+    failed: int = 0
+    # Seconds spent in the stage function, summed over workers
+    busy: float = 0.0
+    # Seconds spent waiting for room in the next stage's queue
+    blocked: float = 0.0
+
+    def utilization(self, elapsed):
+        return self.busy / (elapsed * self.workers) if elapsed > 0 else 0.0
+
+
+@dataclass
+class PipelineStats:
+    discovered: int = 0
+    elapsed: float = 0.0
+    stages: list = field(default_factory=list)
+
+    @property
+    def failed(self):
+        return sum(stage.failed for stage in self.stages)
+
+    def summary(self):
+        """One line per stage with its counts and worker utilization."""
+        lines = [f"  discovered {self.discovered} items in {self.elapsed:.2f}s"]
+        for s in self.stages:
+            lines.append(
+                f"  {s.name:<10} workers={s.workers:<3} out={s.processed} "
+                f"dropped={s.dropped} failed={s.failed} "
+                f"busy={s.utilization(self.elapsed):.0%} "
+                f"blocked={s.blocked:.2f}s"
+            )
+        return "\n".join(lines)
+
+
+class Pipeline:
+    """
+    Chain of stages connected by bounded queues.
+
+    Args:
+        stages: Stages in processing order
+        stage_workers: Optional {stage name: workers} overriding the
+            stages' own worker counts, e.g. from parse_stage_workers
+    """
+
+    def __init__(self, stages, stage_workers=None):
+        self.stages = list(stages)
+        if not self.stages:
+            raise ValueError("A pipeline needs at least one stage")
+        overrides = dict(stage_workers or {})
+        for stage in self.stages:
+            stage.workers = overrides.pop(stage.name, stage.workers)
+        if overrides:
+            known = ", ".join(stage.name for stage in self.stages)
+            raise ValueError(
+                f"Unknown stage(s) {', '.join(overrides)}, expected {known}"
+            )
+        for stage in self.stages:
+            if stage.workers < 1:
+                raise ValueError(f"Stage {stage.name} needs at least 1 worker")
+            if stage.processes and inspect.iscoroutinefunction(stage.fn):
+                raise ValueError(
+                    f"Stage {stage.name} can't run a coroutine in processes"
+                )
+        self._lock = threading.Lock()
+
+    def run(self, source):
+        """
+        Push every item of `source` through the stages and wait for them.
+
+        Returns:
+            PipelineStats: Per-stage counts and timings
+        """
+        stats = PipelineStats(
+            stages=[StageStats(s.name, s.workers) for s in self.stages]
+        )
+        queues = [
+            queue.Queue(maxsize=s.queue_size or 2 * s.workers)
+            for s in self.stages
+        ]
+        # Pools are started before any thread, so forking them copies a
+        # single-threaded process
+        pools = {}
+        try:
+            for i, stage in enumerate(self.stages):
+                if stage.processes:
+                    pools[i] = ProcessPoolExecutor(
+                        max_workers=stage.workers, initializer=stage.initializer
+                    )
+                    pools[i].submit(int).result()
+            return self._run(source, stats, queues, pools)
+        finally:
+            for pool in pools.values():
+                pool.shutdown()
+
+    def _run(self, source, stats, queues, pools):
+        source_errors = []
+
+        def feed():
+            try:
+                for item in source:
+                    queues[0].put(item)
+                    stats.discovered += 1
+            except Exception as e:
+                source_errors.append(e)
+            finally:
+                for _ in range(self.stages[0].workers):
+                    queues[0].put(_DONE)
+
+        threads = [threading.Thread(target=feed, daemon=True)]
+        for i, stage in enumerate(self.stages):
+            out_queue = queues[i + 1] if i + 1 < len(queues) else None
+            finish = self._finisher(stage, out_queue, i)
+            call = stage.fn
+            if i in pools:
+                call = functools.partial(_call_in_pool, pools[i], stage.fn)
+            args = (stage, call, stats.stages[i], queues[i], out_queue, finish)
+            if inspect.iscoroutinefunction(stage.fn):
+                threads.append(
+                    threading.Thread(
+                        target=self._run_async, args=args, daemon=True
+                    )
+                )
+            else:
+                threads.extend(
+                    threading.Thread(target=self._work, args=args, daemon=True)
+                    for _ in range(stage.workers)
+                )
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats.elapsed = time.perf_counter() - start
+
+        if source_errors:
+            raise source_errors[0]
+        return stats
+
+    def _finisher(self, stage, out_queue, index):
+        """
+        Called once per finished worker; the last one closes the next queue.
+        """
+        remaining = [stage.workers]
+
+        def finish():
+            with self._lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last and out_queue is not None:
+                for _ in range(self.stages[index + 1].workers):
+                    out_queue.put(_DONE)
+
+        return finish
+
+    def _record(self, stage, stage_stats, item, result, error, elapsed):
+        with self._lock:
+            stage_stats.busy += elapsed
+            if error is not None:
+                stage_stats.failed += 1
+            elif result is None:
+                stage_stats.dropped += 1
+            else:
+                stage_stats.processed += 1
+        if error is None:
+            return
+        if stage.on_error is None:
+            print(f"Unable to process {item} in {stage.name}: {error}")
+            return
+        try:
+            stage.on_error(item, error)
+        except Exception as e:
+            # A failing handler must not kill the worker, the stages in
+            # front of it would block on a queue nobody drains
+            print(
+                f"Error handler of {stage.name} failed for {item}: {e} "
+                f"(while handling: {error})"
+            )
+
+    def _forward(self, stage_stats, out_queue, result):
+        start = time.perf_counter()
+        out_queue.put(result)
+        blocked = time.perf_counter() - start
+        with self._lock:
+            stage_stats.blocked += blocked
+
+    def _work(self, stage, call, stage_stats, in_queue, out_queue, finish):
+        try:
+            while True:
+                item = in_queue.get()
+                if item is _DONE:
+                    break
+                result = error = None
+                start = time.perf_counter()
+                try:
+                    result = call(item)
+                except Exception as e:
+                    error = e
+                elapsed = time.perf_counter() - start
+                self._record(stage, stage_stats, item, result, error, elapsed)
+                if result is not None and out_queue is not None:
+                    self._forward(stage_stats, out_queue, result)
+        finally:
+            finish()
+
+    def _run_async(self, stage, call, stage_stats, in_queue, out_queue, finish):
+        async def consume(executor):
+            loop = asyncio.get_running_loop()
+            while True:
+                item = await loop.run_in_executor(executor, in_queue.get)
+                if item is _DONE:
+                    return
+                result = error = None
+                start = time.perf_counter()
+                try:
+                    result = await call(item)
+                except Exception as e:
+                    error = e
+                elapsed = time.perf_counter() - start
+                self._record(stage, stage_stats, item, result, error, elapsed)
+                if result is not None and out_queue is not None:
+                    await loop.run_in_executor(
+                        executor, self._forward, stage_stats, out_queue, result
+                    )
+
+        async def main():
+            # Blocking queue calls run here so they never stall the loop
+            with ThreadPoolExecutor(max_workers=stage.workers) as executor:
+                await asyncio.gather(
+                    *(consume(executor) for _ in range(stage.workers))
+                )
+
+        try:
+            asyncio.run(main())
+        finally:
+            for _ in range(stage.workers):
+                finish()
+
+
+def _call_in_pool(pool, fn, item):
+    return pool.submit(fn, item).result()
+
+
+def parse_stage_workers(value):
+    """
+    Parse a `--stage-workers` value like "decode=2,encode=4".
+
+    Returns:
+        dict: Stage name -> worker count
+    """
+    workers = {}
+    for part in value.split(","):
+        name, sep, count = part.partition("=")
+        if not sep or not count.strip().isdigit() or int(count) < 1:
+            raise ValueError(f"Expected stage=workers, got {part!r}")
+        workers[name.strip()] = int(count)
+    return workers
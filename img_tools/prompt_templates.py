@@ -0,0 +1,90 @@
+"""
+Prompt template loading for the captioning scripts.
+
+Templates are read and compiled once and cached by path; the cache entry
+is refreshed only when the file's mtime changes. Rendered prompts are
+memoized per set of substitution values.
+"""
+
+import os
+import re
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+DEFAULT_PROMPT_PATH = os.path.join(BASE_DIR, "prompts", "LORA.md")
+
+_PLACEHOLDER_RE = re.compile(r"\{(\w+)\}")
+
+_TEMPLATE_CACHE = {}
+
+
+class PromptTemplate:
+    """
+    A prompt file compiled into literal text and `{name}` placeholders.
+
+    Placeholders without a value at render time are kept verbatim so that
+    prompts may contain other braces (e.g. JSON examples).
+
+    Args:
+        path: Path the template was loaded from
+        text: Raw template text
+        mtime_ns: Modification time of the file when it was read
+    """
+
+    def __init__(self, path: str, text: str, mtime_ns: int = 0):
+        self.path = path
+        self.text = text
+        self.mtime_ns = mtime_ns
+        self._parts = _PLACEHOLDER_RE.split(text)
+        self._rendered = {}
+
+    @property
+    def placeholders(self):
+        return set(self._parts[1::2])
+
+    def render(self, **values) -> str:
+        key = tuple(sorted(values.items()))
+        rendered = self._rendered.get(key)
+        if rendered is None:
+            parts = list(self._parts)
+            for i in range(1, len(parts), 2):
+                name = parts[i]
+                parts[i] = (
+                    str(values[name]) if name in values else f"{{{name}}}"
+                )
+            rendered = "".join(parts)
+            self._rendered[key] = rendered
+        return rendered
+
+
+def load_prompt_template(path: str = DEFAULT_PROMPT_PATH) -> PromptTemplate:
+    """
+    Return the compiled template at `path`, re-reading it only if the file
+    changed since it was cached.
+    """
+    path = os.path.abspath(path)
+    mtime_ns = os.stat(path).st_mtime_ns
+
+    template = _TEMPLATE_CACHE.get(path)
+    if template is None or template.mtime_ns != mtime_ns:
+        with open(path, "r") as f:
+            template = PromptTemplate(path, f.read(), mtime_ns)
+        _TEMPLATE_CACHE[path] = template
+    return template
+
+
+def render_prompt(path: str = DEFAULT_PROMPT_PATH, **values) -> str:
+    return load_prompt_template(path).render(**values)
+
+
+def preflight_prompt(path: str = DEFAULT_PROMPT_PATH) -> PromptTemplate:
+    """
+    Fail fast if the prompt template is missing, unreadable or empty.
+    """
+    if not os.path.isfile(path):
+        raise ValueError(f"Prompt template {path} does not exist")
+
+    template = load_prompt_template(path)
+    if not template.text.strip():
+        raise ValueError(f"Prompt template {path} is empty")
+    return template
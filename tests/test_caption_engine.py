@@ -0,0 +1,183 @@
+import asyncio
+import os
+import time
+
+import pytest
+from PIL import Image
+
+from caption_backends import StubChatModel
+from caption_engine import EngineStats, TokenBucket, percentile
+from caption_manifest import DONE, FAILED, CaptionManifest, get_manifest_path
+from img_desc import caption_image_dataset, prepare_caption_job
+
+
+class CountingModel(StubChatModel):
+    """StubChatModel counting the images it was asked to caption."""
+
+    def __init__(self, latency=0.0):
+        super().__init__(latency=latency)
+        self.images = 0
+        self.requests = 0
+
+    async def ainvoke(self, messages):
+        self.requests += 1
+        self.images += sum(
+            part["type"] == "image_url"
+            for message in messages
+            for part in message.content
+        )
+        return await super().ainvoke(messages)
+
+
+def make_images(directory, count):
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"img{i}.jpg")
+        Image.new("RGB", (32, 24), (i * 40 % 256, 80, 160)).save(path)
+        paths.append(path)
+    return paths
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def time_acquires(bucket, count):
+    async def run():
+        start = time.monotonic()
+        for _ in range(count):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    return asyncio.run(run())
+
+
+def test_token_bucket_paces_to_rate():
+    # The first token is available right away, the next 5 take 1/rate each
+    elapsed = time_acquires(TokenBucket(rate=50, burst=1), 6)
+    assert elapsed >= 5 / 50 * 0.9
+
+
+def test_token_bucket_allows_burst():
+    assert time_acquires(TokenBucket(rate=1, burst=5), 5) < 0.5
+
+
+def test_token_bucket_rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+
+
+def test_rate_limits_requests(tmp_path):
+    make_images(tmp_path, 6)
+    stats = caption_image_dataset(
+        StubChatModel(), str(tmp_path), prompt="Describe", rate=40
+    )
+    assert stats.completed == 6
+    # The bucket holds `concurrency` tokens, the rest arrive at 40/s
+    assert stats.elapsed >= (6 - 4) / 40 * 0.9
+
+
+def test_percentile_nearest_rank():
+    values = [0.5, 0.1, 0.4, 0.2, 0.3]
+    assert percentile(values, 50) == 0.3
+    assert percentile(values, 95) == 0.5
+    assert percentile(list(range(1, 101)), 95) == 95
+    assert percentile([], 50) == 0.0
+
+
+def test_summary_reports_latency_percentiles():
+    stats = EngineStats(completed=4, elapsed=2.0)
+    stats.latencies = [0.1, 0.2, 0.3, 0.4]
+    summary = stats.summary()
+    assert "throughput=2.00 img/s" in summary
+    assert "p50=0.200s" in summary
+    assert "p95=0.400s" in summary
+
+
+def test_run_collects_latencies(tmp_path):
+    make_images(tmp_path, 5)
+    stats = caption_image_dataset(
+        StubChatModel(latency=0.02), str(tmp_path), prompt="Describe"
+    )
+    assert stats.completed == 5
+    assert len(stats.latencies) == 5
+    assert percentile(stats.latencies, 50) >= 0.02
+    assert percentile(stats.latencies, 95) >= percentile(stats.latencies, 50)
+
+
+def test_skips_images_with_captions(tmp_path):
+    captioned, empty, new = make_images(tmp_path, 3)
+    with open(tmp_path / "img0.txt", "w") as f:
+        f.write("existing caption")
+    (tmp_path / "img1.txt").touch()
+    assert prepare_caption_job(captioned) is None
+    assert prepare_caption_job(empty) == str(tmp_path / "img1.txt")
+
+    model = CountingModel()
+    stats = caption_image_dataset(model, str(tmp_path), prompt="Describe")
+
+    assert model.images == 2
+    assert stats.completed == 2
+    assert read(tmp_path / "img0.txt") == "existing caption"
+    assert read(tmp_path / "img1.txt").startswith("a photo")
+    assert read(tmp_path / "img2.txt").startswith("a photo")
+    assert prepare_caption_job(new) is None
+
+
+def test_resume_counts_only_model_attempts(tmp_path):
+    paths = make_images(tmp_path, 3)
+    with CaptionManifest(get_manifest_path(str(tmp_path))) as manifest:
+        manifest.add_pending(paths)
+    # Captioned after the job was registered, e.g. by an earlier run
+    with open(tmp_path / "img0.txt", "w") as f:
+        f.write("existing caption")
+
+    model = CountingModel()
+    stats = caption_image_dataset(
+        model, str(tmp_path), prompt="Describe", resume=True
+    )
+
+    assert (stats.completed, stats.skipped) == (2, 1)
+    assert model.images == 2
+    with CaptionManifest(get_manifest_path(str(tmp_path))) as manifest:
+        attempts = {k: e["attempts"] for k, e in manifest.entries.items()}
+    assert attempts == {"img0.jpg": 0, "img1.jpg": 1, "img2.jpg": 1}
+
+
+def test_batched_captions_match_single(tmp_path):
+    single = tmp_path / "single"
+    batched = tmp_path / "batched"
+    for directory in (single, batched):
+        directory.mkdir()
+        make_images(directory, 5)
+
+    caption_image_dataset(StubChatModel(), str(single), prompt="Describe")
+    model = CountingModel()
+    stats = caption_image_dataset(
+        model, str(batched), prompt="Describe", batch_size=4
+    )
+
+    assert stats.completed == 5
+    assert model.requests == 2
+    assert len(stats.latencies) == model.requests
+    for i in range(5):
+        name = f"img{i}.txt"
+        assert read(batched / name) == read(single / name)
+
+
+def test_unreadable_image_fails_alone(tmp_path):
+    make_images(tmp_path, 2)
+    with open(tmp_path / "bad.jpg", "wb") as f:
+        f.write(b"not an image")
+
+    stats = caption_image_dataset(
+        StubChatModel(), str(tmp_path), prompt="Describe", batch_size=4
+    )
+
+    assert (stats.completed, stats.failed) == (2, 1)
+    with CaptionManifest(get_manifest_path(str(tmp_path))) as manifest:
+        assert manifest.counts() == {"pending": 0, DONE: 2, FAILED: 1}
+        assert manifest.entries["bad.jpg"]["state"] == FAILED
+        # It never reached the model
+        assert manifest.entries["bad.jpg"]["attempts"] == 0
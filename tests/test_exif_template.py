@@ -0,0 +1,104 @@
+import random
+from datetime import datetime
+
+import piexif
+
+from exif_template import ExifTemplate
+from img_exif import (
+    CONSTANT_EXIF_IFD,
+    CONSTANT_ZEROTH_IFD,
+    DEFAULT_IMAGE_ANALYSIS,
+    DEFAULT_SUBJECT_AREA,
+    ExifBatch,
+    _capture_datetime,
+    build_exif_dict,
+    create_exif_batch,
+    synthesize_camera_settings,
+)
+
+NOW = datetime(2025, 6, 1, 12, 0, 0)
+
+
+def make_analysis(rng):
+    return {
+        **DEFAULT_IMAGE_ANALYSIS,
+        "width": rng.randint(320, 8000),
+        "height": rng.randint(240, 6000),
+        "orientation": rng.choice([1, 3, 6, 8]),
+        "brightness": rng.uniform(-8, 8),
+        "has_flash": rng.random() < 0.2,
+    }
+
+
+def make_subject_area(rng):
+    return tuple(rng.randint(0, 4000) for _ in range(4))
+
+
+def draw_exif_dict(image_analysis, subject_area, rng):
+    """The dict ExifBatch.generate dumps for the same draws."""
+    datetime_str = _capture_datetime(NOW, rng)
+    camera_settings = synthesize_camera_settings(image_analysis, rng)
+    return build_exif_dict(
+        subject_area, image_analysis, camera_settings, datetime_str
+    )
+
+
+def variable_tags(exif_dict):
+    return {
+        ifd_name: [tag for tag in ifd if tag not in constant]
+        for (ifd_name, ifd), constant in zip(
+            exif_dict.items(), (CONSTANT_ZEROTH_IFD, CONSTANT_EXIF_IFD)
+        )
+    }
+
+
+def test_render_matches_piexif_dump():
+    rng = random.Random(0)
+    first = draw_exif_dict(make_analysis(rng), make_subject_area(rng), rng)
+    template = ExifTemplate(first, variable_tags(first))
+    assert template.data == piexif.dump(first)
+
+    for _ in range(300):
+        exif_dict = draw_exif_dict(
+            make_analysis(rng), make_subject_area(rng), rng
+        )
+        assert template.render(exif_dict) == piexif.dump(exif_dict)
+
+
+def test_value_of_another_size_falls_back_to_piexif():
+    rng = random.Random(1)
+    first = draw_exif_dict(DEFAULT_IMAGE_ANALYSIS, (1, 2, 3, 4), rng)
+    template = ExifTemplate(first, variable_tags(first))
+
+    exif_dict = draw_exif_dict(DEFAULT_IMAGE_ANALYSIS, (1, 2, 3, 4), rng)
+    exif_dict["Exif"][piexif.ExifIFD.LensModel] = b"a much longer lens model"
+    assert template.render(exif_dict) is None
+    assert template.dump(exif_dict) == piexif.dump(exif_dict)
+
+
+def test_batch_matches_piexif_dump():
+    rng = random.Random(2)
+    analyses = [make_analysis(rng) for _ in range(50)]
+    areas = [make_subject_area(rng) for _ in range(50)]
+
+    dumped = create_exif_batch(analyses, areas, seed=7, now=NOW)
+
+    rng = random.Random(7)
+    expected = [
+        piexif.dump(draw_exif_dict(analysis, area, rng))
+        for analysis, area in zip(analyses, areas)
+    ]
+    assert dumped == expected
+
+
+def test_batch_generate_matches_piexif_dump():
+    batch = ExifBatch(NOW)
+    for seed in range(20):
+        analysis = make_analysis(random.Random(seed))
+        exif_bytes, _, _ = batch.generate(
+            analysis, None, random.Random(f"job:{seed}")
+        )
+        exif_dict = draw_exif_dict(
+            analysis, DEFAULT_SUBJECT_AREA, random.Random(f"job:{seed}")
+        )
+        assert exif_bytes == piexif.dump(exif_dict)
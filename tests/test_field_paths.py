@@ -0,0 +1,180 @@
+import pytest
+
+from field_paths import (
+    MISSING,
+    Field,
+    compile_field,
+    compile_path,
+    compile_schema,
+    parse_path,
+)
+
+VIDEO = {
+    "videoId": "abc123",
+    "title": {"runs": [{"text": "First"}, {"text": "Second"}]},
+    "thumbnail": {
+        "thumbnails": [
+            {"url": "small.jpg", "width": 120},
+            {"url": "large.jpg", "width": 720},
+        ]
+    },
+    "badges": [
+        {"metadataBadgeRenderer": {"label": "New"}},
+        {"metadataBadgeRenderer": {"label": ""}},
+        {"otherRenderer": {}},
+        {"metadataBadgeRenderer": {"label": "4K"}},
+    ],
+    "shelves": [
+        {"items": [{"id": 1}, {"id": 2}]},
+        {"items": []},
+        {"items": [{"id": 3}, {"name": "no id"}]},
+        {"other": True},
+    ],
+    "viewCountText": {"simpleText": ""},
+    "shortViewCountText": {"simpleText": "1.2K views"},
+    "owner": None,
+}
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    [
+        ("videoId", "abc123"),
+        ("title.runs[0].text", "First"),
+        ("title.runs[-1].text", "Second"),
+        ("thumbnail.thumbnails[-1].width", 720),
+        ("badges[*].metadataBadgeRenderer.label", ["New", "4K"]),
+        ("shelves[*].items[*].id", [1, 2, 3]),
+        ("title.runs[*]", [{"text": "First"}, {"text": "Second"}]),
+    ],
+)
+def test_path_finds_value(path, expected):
+    assert compile_path(path)(VIDEO) == expected
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "missing",
+        "missing.deeper[0].text",
+        "title.runs[5].text",
+        "title.runs[-3].text",
+        # Wrong types: a key into a list, an index into an object or None
+        "title.runs.text",
+        "title[0]",
+        "owner.name",
+        "owner[0]",
+    ],
+)
+def test_unresolved_path_is_missing(path):
+    assert compile_path(path)(VIDEO) is MISSING
+
+
+def test_wildcard_without_matches_is_empty():
+    assert compile_path("missing[*].text")(VIDEO) == []
+    assert compile_path("videoId[*]")(VIDEO) == []
+    assert compile_path("badges[*].missing")(VIDEO) == []
+
+
+def test_path_on_non_dict_input():
+    assert compile_path("title.runs[0]")(None) is MISSING
+    assert compile_path("[1]")(["a", "b"]) == "b"
+    assert compile_path("[*].id")([{"id": 1}, "x", {"id": 2}]) == [1, 2]
+
+
+@pytest.mark.parametrize(
+    "path", ["", "a..b", ".a", "a.", "a[", "a[x]", "a[1.5]", "a]b", "a[]"]
+)
+def test_invalid_path_raises(path):
+    with pytest.raises(ValueError):
+        parse_path(path)
+    with pytest.raises(ValueError):
+        compile_path(path)
+
+
+def test_field_default_and_convert():
+    assert compile_field(Field("missing", default="n/a"))(VIDEO) == "n/a"
+    assert compile_field(Field("missing"))(VIDEO) == ""
+    assert compile_field(Field("videoId", convert=str.upper))(VIDEO) == (
+        "ABC123"
+    )
+    # The default is returned as is, without converting it
+    assert compile_field(Field("missing", 0, convert=str.upper))(VIDEO) == 0
+    # Wildcard paths always convert their list, even an empty one
+    assert compile_field(Field("badges[*].missing", convert=len))(VIDEO) == 0
+
+
+def test_field_fallback_paths():
+    field = Field(("viewCountText.simpleText", "shortViewCountText.simpleText"))
+    assert compile_field(field)(VIDEO) == "1.2K views"
+    field = Field(("missing", "videoId", "title.runs[0].text"))
+    assert compile_field(field)(VIDEO) == "abc123"
+    field = Field(("missing", "viewCountText.simpleText"), default="none")
+    assert compile_field(field)(VIDEO) == "none"
+    field = Field(
+        ("badges[*].missing", "badges[*].metadataBadgeRenderer.label")
+    )
+    assert compile_field(field)(VIDEO) == ["New", "4K"]
+
+
+def test_bare_paths_and_none_fields():
+    assert compile_field("title.runs[1].text")(VIDEO) == "Second"
+    assert compile_field(("missing", "videoId"))(VIDEO) == "abc123"
+    assert compile_field(None)(VIDEO) is None
+
+
+def test_schema_builds_record_in_order():
+    extract = compile_schema(
+        {
+            "id": "videoId",
+            "title": Field("title.runs[0].text", convert=str.lower),
+            "views": (
+                "viewCountText.simpleText",
+                "shortViewCountText.simpleText",
+            ),
+            "thumbnail": "thumbnail.thumbnails[-1].url",
+            "badges": Field(
+                "badges[*].metadataBadgeRenderer.label", convert=", ".join
+            ),
+            "channel": Field("owner.name", default="unknown"),
+            "scraped_at": None,
+            "missing": "no.such[0].path",
+        }
+    )
+    record = extract(VIDEO)
+    assert list(record) == [
+        "id",
+        "title",
+        "views",
+        "thumbnail",
+        "badges",
+        "channel",
+        "scraped_at",
+        "missing",
+    ]
+    assert record == {
+        "id": "abc123",
+        "title": "first",
+        "views": "1.2K views",
+        "thumbnail": "large.jpg",
+        "badges": "New, 4K",
+        "channel": "unknown",
+        "scraped_at": None,
+        "missing": "",
+    }
+    # Every field resolves independently on another renderer
+    assert extract({"videoId": "x"}) == {
+        "id": "x",
+        "title": "",
+        "views": "",
+        "thumbnail": "",
+        "badges": "",
+        "channel": "unknown",
+        "scraped_at": None,
+        "missing": "",
+    }
+
+
+def test_schema_rejects_invalid_path():
+    with pytest.raises(ValueError):
+        compile_schema({"id": "videoId", "bad": "a..b"})
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from image_dedupe import (
+    HashedImage,
+    HashIndex,
+    connected_labels,
+    find_duplicates,
+    hamming_distance,
+)
+
+
+def make_hashes(seed, count=400, near=150):
+    """Random hashes plus copies of some of them with a few bits flipped."""
+    rng = np.random.default_rng(seed)
+    hashes = rng.integers(0, 2**64, size=count, dtype=np.uint64)
+    sources = rng.integers(0, count, size=near)
+    flips = [
+        rng.choice(64, size=rng.integers(0, 8), replace=False) for _ in sources
+    ]
+    copies = [
+        hashes[source] ^ np.uint64(sum(1 << int(bit) for bit in bits))
+        for source, bits in zip(sources, flips)
+    ]
+    return np.concatenate([hashes, np.array(copies, dtype=np.uint64)])
+
+
+def brute_force_pairs(hashes, radius):
+    distances = hamming_distance(hashes[:, None], hashes[None, :])
+    left, right = np.nonzero(np.triu(distances <= radius, k=1))
+    return set(zip(left.tolist(), right.tolist()))
+
+
+def index_pairs(index):
+    found = set()
+    for left, right in index.pairs():
+        for a, b in zip(left.tolist(), right.tolist()):
+            found.add((min(a, b), max(a, b)))
+    return found
+
+
+@pytest.mark.parametrize("radius", [0, 1, 3, 6])
+def test_pairs_match_brute_force(radius):
+    hashes = make_hashes(radius)
+    expected = brute_force_pairs(hashes, radius)
+    assert expected
+    assert index_pairs(HashIndex(hashes, radius)) == expected
+
+
+@pytest.mark.parametrize("radius", [0, 3, 6])
+def test_query_matches_brute_force(radius):
+    hashes = make_hashes(10 + radius)
+    index = HashIndex(hashes, radius)
+    rng = np.random.default_rng(radius)
+    # Hashes in the index and hashes next to them
+    queries = list(hashes[:50]) + [
+        h ^ np.uint64(1 << int(bit))
+        for h, bit in zip(hashes[-50:], rng.integers(0, 64, size=50))
+    ]
+    for value in queries:
+        expected = np.nonzero(hamming_distance(hashes, value) <= radius)[0]
+        np.testing.assert_array_equal(index.query(value), expected)
+
+
+def test_radius_out_of_range():
+    with pytest.raises(ValueError):
+        HashIndex([1, 2], radius=64)
+    with pytest.raises(ValueError):
+        HashIndex([1, 2], radius=-1)
+
+
+def test_connected_labels_are_transitive():
+    pairs = [
+        (np.array([0, 3]), np.array([1, 4])),
+        (np.array([1]), np.array([2])),
+    ]
+    labels = connected_labels(6, pairs)
+    assert labels.tolist() == [0, 0, 0, 3, 3, 5]
+
+
+def test_find_duplicates_keeps_largest():
+    images = [
+        HashedImage("a.jpg", 0b1111, (100, 100)),
+        HashedImage("b.jpg", 0b1111, (200, 100)),
+        HashedImage("c.jpg", 0b0111, (100, 100)),
+        HashedImage("d.jpg", 2**63, (100, 100)),
+    ]
+    groups = find_duplicates(images, radius=1)
+    assert len(groups) == 1
+    assert groups[0].keep == "b.jpg"
+    assert sorted(groups[0].duplicates) == ["a.jpg", "c.jpg"]
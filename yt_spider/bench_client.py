@@ -0,0 +1,153 @@
+"""
+Benchmark per-request connections against the pooled client.
+
+Serves a stand-in page from a local HTTP(S) server and fetches it `--urls`
+times, once with a new connection per URL (module-level `httpx.get`, what
+fetch_page_source used to do) and once through `create_client`. The server
+counts the TCP connections it accepts, which shows the handshakes saved.
+With --tls a throwaway self-signed certificate is generated with openssl,
+so TLS handshakes are included as they would be against youtube.com.
+
+Usage:
+    python bench_client.py --urls 1000 --tls
+"""
+
+import argparse
+import os
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+from common import DEFAULT_HEADERS, create_client, fetch_page_source
+
+
+class CountingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler, body):
+        super().__init__(address, handler)
+        self.body = body
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    # Keep-alive needs HTTP/1.1 and a Content-Length
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = self.server.body
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_certificate(folder):
+    """Self-signed localhost certificate, returns (cert_path, key_path)."""
+    cert = os.path.join(folder, "cert.pem")
+    key = os.path.join(folder, "key.pem")
+    subprocess.run(
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "rsa:2048",
+            "-nodes",
+            "-keyout",
+            key,
+            "-out",
+            cert,
+            "-days",
+            "1",
+            "-subj",
+            "/CN=localhost",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+def start_server(body, tls_files=None):
+    server = CountingServer(("127.0.0.1", 0), PageHandler, body)
+    scheme = "http"
+    if tls_files:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(*tls_files)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"{scheme}://127.0.0.1:{server.server_address[1]}"
+
+
+def fetch_unpooled(url):
+    response = httpx.get(
+        url, headers=DEFAULT_HEADERS, follow_redirects=True, verify=False
+    )
+    response.raise_for_status()
+    return response.text
+
+
+def run(server, fetch, urls):
+    server.connections = 0
+    start = time.perf_counter()
+    for url in urls:
+        fetch(url)
+    return time.perf_counter() - start, server.connections
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the HTTP client")
+    parser.add_argument("--urls", type=int, default=1000)
+    parser.add_argument(
+        "--body-kb", type=int, default=64, help="Size of the served page"
+    )
+    parser.add_argument(
+        "--tls", action="store_true", help="Serve HTTPS (needs openssl)"
+    )
+    args = parser.parse_args()
+
+    body = b"<html>" + b"x" * (args.body_kb * 1024) + b"</html>"
+    with tempfile.TemporaryDirectory() as folder:
+        tls_files = make_certificate(folder) if args.tls else None
+        server, base_url = start_server(body, tls_files)
+        urls = [f"{base_url}/watch?v={i:011d}" for i in range(args.urls)]
+
+        unpooled_time, unpooled_conns = run(server, fetch_unpooled, urls)
+        with create_client(verify=False) as client:
+            pooled_time, pooled_conns = run(
+                server, lambda url: fetch_page_source(url, client=client), urls
+            )
+        server.shutdown()
+
+    print(f"{args.urls} URLs from {base_url} ({args.body_kb} KB pages)")
+    for label, elapsed, conns in (
+        ("new connection per URL", unpooled_time, unpooled_conns),
+        ("pooled client", pooled_time, pooled_conns),
+    ):
+        print(
+            f"  {label:<24} {elapsed:7.2f}s  "
+            f"{elapsed / args.urls * 1000:6.2f} ms/URL  "
+            f"{conns:5d} connections"
+        )
+    print(f"  speedup {unpooled_time / pooled_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Benchmark the page object extractors against the full-page regex.
+
+The regex path is what extract_details and extract_video_data_from_search
+used to do: a lazy `({.+?});` DOTALL match over the whole page followed by
+`json.loads` of the match. It is compared with yt_extract.extract_json,
+decoding the whole object and only the top-level keys extract_details
+reads.
+
+Pages are saved watch pages (`--pages DIR` of *.html files) or synthetic
+ones of `--size-mb`. The synthetic pages come in two variants: a clean one
+and one whose video description contains `};`, where the lazy regex cuts
+the object short.
+
+Usage:
+    python bench_extract.py --size-mb 2
+    python bench_extract.py --pages fixtures/
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import time
+
+from scrape_videos import INITIAL_DATA_KEYS, PLAYER_RESPONSE_KEYS
+from yt_extract import extract_json
+
+
+def extract_regex(page, name):
+    """The previous full-page regex extraction."""
+    match = re.search(rf"var {name}\s*=\s*({{.+?}});", page, re.DOTALL)
+    if not match:
+        return None
+    return json.loads(match.group(1))
+
+
+def make_renderer(rng, i):
+    words = ["cat", "video", "{music}", "[live]", 'a "quote"', "\\path", "é"]
+    text = " ".join(rng.choice(words) for _ in range(12))
+    return {
+        "compactVideoRenderer": {
+            "videoId": f"{i:011d}",
+            "title": {"runs": [{"text": text}]},
+            "thumbnail": {
+                "thumbnails": [
+                    {"url": f"https://i.ytimg.com/vi/{i}/{q}.jpg", "width": w}
+                    for q, w in (("default", 120), ("hqdefault", 480))
+                ]
+            },
+            "viewCountText": {"simpleText": f"{rng.randrange(10**7)} views"},
+            "navigationEndpoint": {"watchEndpoint": {"videoId": f"{i:011d}"}},
+        }
+    }
+
+
+def make_page(size_mb, description, seed=0):
+    """Synthetic watch page of about `size_mb` MB."""
+    rng = random.Random(seed)
+    player = {
+        "playabilityStatus": {"status": "OK"},
+        "streamingData": {
+            "adaptiveFormats": [
+                {"itag": 137, "qualityLabel": "1080p", "fps": 30},
+                {"itag": 136, "qualityLabel": "720p", "fps": 60},
+            ]
+        },
+        "videoDetails": {
+            "videoId": "dQw4w9WgXcQ",
+            "title": "Benchmark video",
+            "shortDescription": description,
+            "lengthSeconds": "212",
+            "keywords": ["bench", "mark"],
+            "channelId": "UC0000000000000000000000",
+            "author": "Bench",
+        },
+        "microformat": {
+            "playerMicroformatRenderer": {
+                "viewCount": "1000",
+                "category": "Music",
+            }
+        },
+        "storyboards": {"spec": "x" * 50_000},
+    }
+    initial = {
+        "contents": {"results": [make_renderer(rng, i) for i in range(200)]},
+        "engagementPanels": [
+            {
+                "engagementPanelSectionListRenderer": {
+                    "header": {
+                        "engagementPanelTitleHeaderRenderer": {
+                            "title": {"runs": [{"text": "Comments"}]},
+                            "contextualInfo": {"runs": [{"text": "1,234"}]},
+                        }
+                    }
+                }
+            }
+        ],
+    }
+    # Most of ytInitialData is related videos, fill up to the page size
+    count = size_mb * 1024 * 1024 // len(json.dumps(make_renderer(rng, 0)))
+    initial["contents"]["related"] = [
+        make_renderer(rng, i) for i in range(count)
+    ]
+
+    filler = "<div>" + "x" * 2000 + "</div>\n"
+    return (
+        "<html><head>"
+        + filler * 20
+        + "<script>var ytInitialPlayerResponse = "
+        + json.dumps(player)
+        + ";var meta = {};</script>"
+        + filler * 20
+        + "<script>var ytInitialData = "
+        + json.dumps(initial)
+        + ";</script>"
+        + filler * 20
+        + "</body></html>"
+    )
+
+
+def load_pages(args):
+    if args.pages:
+        pages = {}
+        for path in sorted(glob.glob(os.path.join(args.pages, "*.html"))):
+            with open(path, "r", encoding="utf-8") as f:
+                pages[os.path.basename(path)] = f.read()
+        return pages
+    return {
+        "synthetic": make_page(args.size_mb, "A plain description"),
+        "synthetic, '};' in description": make_page(
+            args.size_mb, "Code: if (x) { return; };\nmore text"
+        ),
+    }
+
+
+def extract_all(method, page):
+    if method == "regex":
+        return (
+            extract_regex(page, "ytInitialPlayerResponse"),
+            extract_regex(page, "ytInitialData"),
+        )
+    if method == "full":
+        return (
+            extract_json(page, "ytInitialPlayerResponse"),
+            extract_json(page, "ytInitialData"),
+        )
+    return (
+        extract_json(page, "ytInitialPlayerResponse", PLAYER_RESPONSE_KEYS),
+        extract_json(page, "ytInitialData", INITIAL_DATA_KEYS),
+    )
+
+
+def check(result, reference):
+    """Whether the extracted keys match the reference decode."""
+    player, initial = result
+    for keys, got, expected in (
+        (PLAYER_RESPONSE_KEYS, player, reference[0]),
+        (INITIAL_DATA_KEYS, initial, reference[1]),
+    ):
+        for key in keys:
+            if key in expected and (got or {}).get(key) != expected[key]:
+                return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark ytInitial* extraction"
+    )
+    parser.add_argument(
+        "--pages", default=None, help="Folder of saved watch pages (*.html)"
+    )
+    parser.add_argument(
+        "--size-mb", type=int, default=2, help="Size of the synthetic pages"
+    )
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    for label, page in load_pages(args).items():
+        reference = extract_all("full", page)
+        print(f"{label} ({len(page) / 1024 / 1024:.1f} MB)")
+        regex_time = None
+        for method in ("regex", "full", "subtrees"):
+            try:
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    result = extract_all(method, page)
+                elapsed = (time.perf_counter() - start) / args.repeat
+                status = "ok" if check(result, reference) else "WRONG"
+            except ValueError as e:
+                elapsed, status = None, f"failed: {str(e)[:40]}"
+            if elapsed is None:
+                print(f"  {method:<9} {'':>16}  {status}")
+                continue
+            if method == "regex":
+                regex_time = elapsed
+            speedup = f"{regex_time / elapsed:5.1f}x" if regex_time else ""
+            print(
+                f"  {method:<9} {elapsed * 1000:7.2f}ms {speedup:>6}  {status}"
+            )
+
+
+if __name__ == "__main__":
+    main()
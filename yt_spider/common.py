@@ -1,40 +1,345 @@
+import asyncio
+import atexit
+import importlib.util
+import threading
 import time
+from dataclasses import dataclass
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Optional, Union
+from urllib.parse import urlsplit
 
 import httpx
 
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 
-def fetch_page_source(url: str, timeout: int = 30, max_retries: int = 3) -> str:
-    """Fetch page source with retry logic and timeout."""
+DEFAULT_HEADERS = {"User-Agent": USER_AGENT}
+
+# Connection pool defaults, see create_client
+DEFAULT_MAX_CONNECTIONS = 10
+DEFAULT_MAX_KEEPALIVE = 10
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+
+# Per-host request rate and concurrent requests of the async scraper
+DEFAULT_RATE = 2.0
+DEFAULT_CONCURRENCY = 8
+
+# Longest Retry-After honored, in seconds
+MAX_RETRY_AFTER = 300
+# Seconds after a slowdown in which further 429s don't slow a host again
+SLOWDOWN_WINDOW = 1.0
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+
+def _client_options(
+    http2, max_connections, max_keepalive, keepalive_expiry, timeout, kwargs
+):
+    if http2 and importlib.util.find_spec("h2") is None:
+        print("  ⚠ HTTP/2 needs the h2 package, using HTTP/1.1")
+        http2 = False
+    return dict(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=timeout,
+        follow_redirects=True,
+        headers=DEFAULT_HEADERS,
+        **kwargs,
+    )
+
+
+def create_client(
+    http2: bool = False,
+    max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    max_keepalive: int = DEFAULT_MAX_KEEPALIVE,
+    keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+    timeout: float = 30,
+    **kwargs,
+) -> httpx.Client:
+    """
+    Create a pooled HTTP client with the scraper's headers.
+
+    Connections are kept alive and reused, so fetching many pages from
+    one host pays for the TCP and TLS handshakes once per pooled
+    connection instead of once per URL. Use it as a context manager to
+    close the pool when done.
+
+    Args:
+        http2: Negotiate HTTP/2 when the server supports it (needs the
+            `h2` package, falls back to HTTP/1.1 without it)
+        max_connections: Maximum open connections
+        max_keepalive: Maximum idle connections kept for reuse
+        keepalive_expiry: Seconds an idle connection is kept
+        timeout: Default request timeout in seconds
+        **kwargs: Passed on to httpx.Client
+    """
+    return httpx.Client(
+        **_client_options(
+            http2,
+            max_connections,
+            max_keepalive,
+            keepalive_expiry,
+            timeout,
+            kwargs,
+        )
+    )
+
+
+def create_async_client(
+    http2: bool = False,
+    max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    max_keepalive: int = DEFAULT_MAX_KEEPALIVE,
+    keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+    timeout: float = 30,
+    **kwargs,
+) -> httpx.AsyncClient:
+    """httpx.AsyncClient counterpart of create_client."""
+    return httpx.AsyncClient(
+        **_client_options(
+            http2,
+            max_connections,
+            max_keepalive,
+            keepalive_expiry,
+            timeout,
+            kwargs,
+        )
+    )
+
+
+@dataclass
+class _HostBucket:
+    rate: float
+    tokens: float
+    updated: float
+    paused_until: float = 0.0
+    slowed_at: float = float("-inf")
+
+
+class HostRateLimiter:
+    """
+    Token bucket per host with adaptive slowdown.
+
+    Every host starts at `rate` requests per second, with bursts of up to
+    `burst` requests. A 429 response halves the host's rate, down to
+    `min_rate`, and a Retry-After header pauses the host for that long.
+    429s arriving within SLOWDOWN_WINDOW of a halving come from requests
+    that were already in flight and don't halve it again.
+    Each successful response then gives back `rate / recovery_steps`
+    until the host is at full rate again.
+
+    Callers reserve a slot and wait for it: `wait` in threads, `acquire`
+    in coroutines.
+
+    Args:
+        rate: Requests per second per host
+        burst: Requests a host may receive at once after being idle
+        min_rate: Lowest rate a host is slowed down to (defaults to
+            rate / 16)
+        recovery_steps: Successes needed to recover from one halving
+    """
+
+    def __init__(self, rate, burst=1, min_rate=None, recovery_steps=10):
+        if rate <= 0:
+            raise ValueError(f"Rate must be positive, got {rate}")
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate or rate / 16
+        self.recovery_steps = recovery_steps
+        self._hosts = {}
+        # Seconds handed out by reserve, summed over all requests
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def _bucket(self, url, now):
+        host = urlsplit(str(url)).netloc
+        bucket = self._hosts.get(host)
+        if bucket is None:
+            bucket = self._hosts[host] = _HostBucket(self.rate, self.burst, now)
+        return bucket
+
+    def reserve(self, url) -> float:
+        """Take a request slot for `url`'s host; returns seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._bucket(url, now)
+            bucket.tokens = min(
+                self.burst,
+                bucket.tokens + (now - bucket.updated) * bucket.rate,
+            )
+            bucket.updated = now
+            bucket.tokens -= 1
+            delay = max(0.0, bucket.paused_until - now) + max(
+                0.0, -bucket.tokens / bucket.rate
+            )
+            self.waited += delay
+            return delay
+
+    def wait(self, url):
+        time.sleep(self.reserve(url))
+
+    async def acquire(self, url):
+        await asyncio.sleep(self.reserve(url))
+
+    def slow_down(self, url, retry_after=None):
+        """Halve the host's rate after a 429, pausing it for `retry_after`."""
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._bucket(url, now)
+            if now - bucket.slowed_at >= SLOWDOWN_WINDOW:
+                bucket.rate = max(self.min_rate, bucket.rate / 2)
+                bucket.slowed_at = now
+            if retry_after:
+                bucket.paused_until = max(
+                    bucket.paused_until, now + retry_after
+                )
+            return bucket.rate
+
+    def record_success(self, url):
+        with self._lock:
+            bucket = self._bucket(url, time.monotonic())
+            bucket.rate = min(
+                self.rate, bucket.rate + self.rate / self.recovery_steps
+            )
+
+
+def parse_retry_after(response) -> Optional[float]:
+    """Seconds from a Retry-After header (delta or HTTP date), if any."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        seconds = (when - datetime.now(when.tzinfo)).total_seconds()
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+def add_client_arguments(parser, rate=DEFAULT_RATE):
+    """
+    Add the connection pool and rate limit options to a script's argument
+    parser, with `rate` as the default requests per second per host.
+    """
+    parser.add_argument(
+        "--http2",
+        action="store_true",
+        help="Use HTTP/2 when the server supports it (needs h2)",
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=DEFAULT_MAX_CONNECTIONS,
+        help="Maximum pooled connections",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=rate,
+        help="Maximum requests per second per host (halved on HTTP 429)",
+    )
+
+
+def get_shared_client() -> httpx.Client:
+    """Process-wide client used when a fetch isn't given one."""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = create_client()
+            atexit.register(_shared_client.close)
+        return _shared_client
+
+
+def _retry_delay(error, url, attempt, max_retries, limiter):
+    """
+    Seconds to wait before retrying after `error`. Re-raises errors that
+    are not retried and the last attempt's error.
+    """
+    if attempt >= max_retries - 1:
+        raise error
+    if isinstance(error, httpx.TimeoutException):
+        wait_time = 2**attempt  # Exponential backoff
+        print(
+            f"  ⚠ Timeout (attempt {attempt + 1}/{max_retries}), retrying in {wait_time}s..."
+        )
+        return wait_time
+    if (
+        isinstance(error, httpx.HTTPStatusError)
+        and error.response.status_code == 429  # Rate limited
+    ):
+        retry_after = parse_retry_after(error.response)
+        if limiter is not None:
+            # The limiter spaces out the retry and everything after it
+            rate = limiter.slow_down(url, retry_after)
+            print(f"  ⚠ Rate limited, slowing down to {rate:.2f} req/s...")
+            return 0
+        wait_time = retry_after or 5 * 2**attempt
+        print(f"  ⚠ Rate limited, waiting {wait_time}s before retry...")
+        return wait_time
+    raise error
+
+
+def fetch_page_source(
+    url: str,
+    timeout: int = 30,
+    max_retries: int = 3,
+    client: Optional[httpx.Client] = None,
+    limiter: Optional[HostRateLimiter] = None,
+) -> str:
+    """
+    Fetch page source with retry logic and timeout.
+
+    Args:
+        client: Pooled client (defaults to the shared one)
+        limiter: Optional HostRateLimiter every attempt waits for
+    """
+    client = client or get_shared_client()
     for attempt in range(max_retries):
+        if limiter is not None:
+            limiter.wait(url)
         try:
-            response = httpx.get(
-                url,
-                timeout=timeout,
-                follow_redirects=True,
-                headers={
-                    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-                },
-            )
+            response = client.get(url, timeout=timeout)
             response.raise_for_status()
-            return response.text
-        except (httpx.TimeoutException, httpx.ReadTimeout):
-            if attempt < max_retries - 1:
-                wait_time = 2**attempt  # Exponential backoff
-                print(
-                    f"  ⚠ Timeout (attempt {attempt + 1}/{max_retries}), retrying in {wait_time}s..."
-                )
-                time.sleep(wait_time)
-            else:
-                raise
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 429:  # Rate limited
-                if attempt < max_retries - 1:
-                    wait_time = 5 * (attempt + 1)
-                    print(
-                        f"  ⚠ Rate limited, waiting {wait_time}s before retry..."
-                    )
-                    time.sleep(wait_time)
-                else:
-                    raise
-            else:
-                raise
+        except (httpx.TimeoutException, httpx.HTTPStatusError) as e:
+            time.sleep(_retry_delay(e, url, attempt, max_retries, limiter))
+            continue
+        if limiter is not None:
+            limiter.record_success(url)
+        return response.text
+
+
+async def afetch_page_source(
+    url: str,
+    client: httpx.AsyncClient,
+    timeout: int = 30,
+    max_retries: int = 3,
+    limiter: Optional[HostRateLimiter] = None,
+    raw: bool = False,
+) -> Union[str, bytes]:
+    """
+    Coroutine version of fetch_page_source for an httpx.AsyncClient.
+
+    Args:
+        raw: Return the undecoded body bytes instead of the text
+    """
+    for attempt in range(max_retries):
+        if limiter is not None:
+            await limiter.acquire(url)
+        try:
+            response = await client.get(url, timeout=timeout)
+            response.raise_for_status()
+        except (httpx.TimeoutException, httpx.HTTPStatusError) as e:
+            await asyncio.sleep(
+                _retry_delay(e, url, attempt, max_retries, limiter)
+            )
+            continue
+        if limiter is not None:
+            limiter.record_success(url)
+        return response.content if raw else response.text
@@ -0,0 +1,210 @@
+"""
+Declarative field paths into the JSON YouTube embeds in its pages.
+
+A path names a value the way it is written in JavaScript, e.g.
+`title.runs[0].text` or `thumbnail.thumbnails[-1].url`. `[*]` visits
+every element of a list and makes the path return the list of values
+found, e.g. `badges[*].metadataBadgeRenderer.label`. Elements where the
+rest of the path is missing or empty are left out.
+
+Paths are compiled once into Python source and `exec`'d, so a lookup is
+a single expression with no per-step function calls. A missing key, an
+index out of range or a value of the wrong type ends the lookup.
+
+A schema maps output names to paths or Fields and compiles into one
+function that turns one renderer into one record.
+"""
+
+import re
+from typing import Any, Callable, NamedTuple, Optional
+
+# Returned by compiled paths that don't resolve
+MISSING = object()
+
+_PATH = re.compile(
+    r"(?:[^.\[\]]+|\[(?:-?\d+|\*)\])(?:\.[^.\[\]]+|\[(?:-?\d+|\*)\])*"
+)
+_STEP = re.compile(r"([^.\[\]]+)|\[(-?\d+)\]|\[(\*)\]")
+_WILDCARD = object()
+
+
+def parse_path(path: str) -> list:
+    """Steps of a path: str keys, int indices and the wildcard marker."""
+    if not _PATH.fullmatch(path):
+        raise ValueError(f"Invalid field path: {path!r}")
+    steps = []
+    for key, index, wildcard in _STEP.findall(path):
+        if key:
+            steps.append(key)
+        elif index:
+            steps.append(int(index))
+        else:
+            steps.append(_WILDCARD)
+    return steps
+
+
+# Lookups end in an exception when an index is out of range or a value
+# has the wrong type
+_ERRORS = (KeyError, IndexError, TypeError, AttributeError)
+# What a missing key looks up to. Keys and the indices used by compiled
+# paths look up to itself again, so a missing key carries through the rest
+# of the lookup without an exception. JSON objects only have str keys, so
+# indexing a real object still fails.
+_NONE = {}
+
+
+def _access(source, steps):
+    """Expression that follows `steps` from `source`."""
+    expression = source
+    for step in steps:
+        if isinstance(step, str):
+            expression += f".get({step!r}, _NONE)"
+        else:
+            _NONE[step] = _NONE
+            expression += f"[{step}]"
+    return expression
+
+
+def _lookup_source(steps, source="obj", level=0):
+    """
+    Source lines that set `value` to what `steps` find in `source`: the
+    value or _NONE, or for paths with `[*]` the list of values found.
+    """
+    if _WILDCARD not in steps:
+        return [
+            "try:",
+            f"    value = {_access(source, steps)}",
+            "except _ERRORS:",
+            "    value = _NONE",
+        ]
+    return ["value = []"] + _collect_source(steps, source, level)
+
+
+def _collect_source(steps, source, level):
+    """Source lines appending every value a `[*]` path finds to `value`."""
+    if _WILDCARD not in steps:
+        return [
+            "try:",
+            f"    found = {_access(source, steps)}",
+            "except _ERRORS:",
+            "    continue",
+            "if found and found is not _NONE:",
+            "    value.append(found)",
+        ]
+    split = steps.index(_WILDCARD)
+    items, item = f"items{level}", f"item{level}"
+    lines = [
+        "try:",
+        f"    {items} = {_access(source, steps[:split])}",
+        "except _ERRORS:",
+        f"    {items} = None",
+        f"if isinstance({items}, list):",
+        f"    for {item} in {items}:",
+    ]
+    inner = _collect_source(steps[split + 1 :], item, level + 1)
+    return lines + ["        " + line for line in inner]
+
+
+def _exec_function(body, namespace):
+    """Define `get(obj)` from the lines of its body."""
+    source = "def get(obj):\n" + "".join(f"    {line}\n" for line in body)
+    namespace = {
+        "MISSING": MISSING,
+        "_ERRORS": _ERRORS,
+        "_NONE": _NONE,
+        **namespace,
+    }
+    exec(source, namespace)
+    return namespace["get"]
+
+
+def compile_path(path: str) -> Callable[[Any], Any]:
+    """
+    Compile a field path.
+
+    Returns:
+        callable: Takes decoded JSON and returns the value at the path or
+            MISSING. Paths with `[*]` return a (possibly empty) list.
+    """
+    lines = _lookup_source(parse_path(path))
+    return _exec_function(
+        lines + ["return MISSING if value is _NONE else value"], {}
+    )
+
+
+class Field(NamedTuple):
+    """
+    How one output value is looked up.
+
+    Attributes:
+        path: A path, or a tuple of paths tried in order where the first
+            non-empty value wins
+        default: Value when no path resolves
+        convert: Optional function applied to the found value (always
+            applied to the list of a `[*]` path)
+    """
+
+    path: Any
+    default: Any = ""
+    convert: Optional[Callable] = None
+
+
+def _field_source(field, target, namespace, prefix="_f"):
+    """
+    Source lines that look up `field` in `obj` and assign the result to
+    `target`. The defaults and converts they refer to are added to
+    `namespace` under names starting with `prefix`.
+    """
+    if field is None:
+        return [f"{target} = None"]
+    if not isinstance(field, Field):
+        field = Field(field)
+    paths = (field.path,) if isinstance(field.path, str) else field.path
+    namespace[f"{prefix}_default"] = field.default
+    lines = []
+    for i, path in enumerate(paths):
+        lookup = _lookup_source(parse_path(path))
+        if i == 0:
+            lines += lookup
+        else:
+            # Later paths only run while no non-empty value was found
+            lines.append("if value is _NONE or not value:")
+            lines += ["    " + line for line in lookup]
+
+    missing = "value is _NONE"
+    if len(paths) > 1:
+        missing += " or not value"
+    result = "value"
+    if field.convert is not None:
+        namespace[f"{prefix}_convert"] = field.convert
+        result = f"{prefix}_convert(value)"
+    lines.append(f"{target} = {prefix}_default if {missing} else {result}")
+    return lines
+
+
+def compile_field(field) -> Callable[[Any], Any]:
+    """
+    Compile a Field (or a bare path or tuple of paths) into a getter. None
+    compiles into a getter that always returns None, for columns filled in
+    by the caller.
+    """
+    namespace = {}
+    lines = _field_source(field, "value", namespace)
+    return _exec_function(lines + ["return value"], namespace)
+
+
+def compile_schema(schema: dict) -> Callable[[Any], dict]:
+    """
+    Compile a schema of output names to Fields (or paths, or None for
+    columns the caller fills in) into a single function.
+
+    Returns:
+        callable: Takes decoded JSON and returns a dict with every name of
+            the schema, in schema order
+    """
+    namespace = {}
+    lines = ["record = {}"]
+    for i, (name, field) in enumerate(schema.items()):
+        lines += _field_source(field, f"record[{name!r}]", namespace, f"_f{i}")
+    lines.append("return record")
+    return _exec_function(lines, namespace)
@@ -0,0 +1,227 @@
+"""
+Fetch pages concurrently and parse them in a process pool.
+
+Decoding ytInitialData is CPU-bound and holds the GIL, so parsing in the
+process that runs the fetches would stall the event loop once pages
+arrive faster than one core can parse them. Here fetch coroutines put the
+raw page bytes on a bounded queue, and parse tasks hand them to a process
+pool. When the parsers fall behind, the queue fills and the fetchers wait
+on it (backpressure). Memory stays bounded by the queue and the rate
+limiter keeps pacing the host.
+
+Each stage reports how busy its workers were. A fetch stage that is
+mostly blocked means parsing is the bottleneck; an idle parse stage means
+the network or, when the fetches are mostly throttled, the rate limit is.
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+
+# Leave a core for the event loop
+DEFAULT_PARSE_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+
+
+@dataclass
+class StageStats:
+    name: str
+    workers: int
+    processed: int = 0
+    failed: int = 0
+    # Seconds spent fetching or parsing, summed over workers
+    busy: float = 0.0
+    # Seconds fetches waited for the rate limiter, summed over workers
+    throttled: float = 0.0
+    # Seconds spent waiting for room in the parse queue
+    blocked: float = 0.0
+
+    def utilization(self, elapsed):
+        return self.busy / (elapsed * self.workers) if elapsed > 0 else 0.0
+
+
+@dataclass
+class PipelineStats:
+    elapsed: float = 0.0
+    # Most pages waiting in the parse queue at once
+    peak_queued: int = 0
+    stages: list = field(default_factory=list)
+
+    def summary(self):
+        """One line per stage with its counts and worker utilization."""
+        lines = [
+            f"  {self.elapsed:.2f}s, at most {self.peak_queued} pages queued"
+        ]
+        for s in self.stages:
+            lines.append(
+                f"  {s.name:<6} workers={s.workers:<3} ok={s.processed} "
+                f"failed={s.failed} busy={s.utilization(self.elapsed):.0%} "
+                f"throttled={s.throttled:.2f}s blocked={s.blocked:.2f}s"
+            )
+        return "\n".join(lines)
+
+
+def add_pipeline_arguments(parser, concurrency):
+    """Add the fetch concurrency and parse worker options to a parser."""
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=concurrency,
+        help="Requests in flight",
+    )
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=DEFAULT_PARSE_WORKERS,
+        help="Processes parsing pages (0 parses in the fetching process)",
+    )
+
+
+def start_parse_pool(workers):
+    """
+    Process pool for `workers` parse processes, or a context giving None
+    for 0 workers. Use it as a context manager.
+
+    The processes are started right away, before the caller starts an
+    event loop or any threads, so forking them copies a single-threaded
+    process.
+    """
+    if workers < 0:
+        raise ValueError(f"Parse workers can't be negative, got {workers}")
+    if workers == 0:
+        return nullcontext()
+    pool = ProcessPoolExecutor(max_workers=workers)
+    pool.submit(int).result()
+    return pool
+
+
+def _parse(parse, raw):
+    """
+    Run `parse` on a raw page, in a pool process.
+
+    Returns:
+        tuple: (result, error, seconds spent)
+    """
+    start = time.perf_counter()
+    result = error = None
+    try:
+        result = parse(raw.decode("utf-8", errors="replace"))
+    except Exception as e:
+        # Only the message goes back, a pickled JSONDecodeError carries
+        # the whole page
+        error = ValueError(str(e))
+    return result, error, time.perf_counter() - start
+
+
+async def fetch_and_parse(
+    urls,
+    fetch,
+    parse,
+    on_result,
+    concurrency,
+    pool=None,
+    parse_workers=1,
+    queue_size=None,
+    limiter=None,
+):
+    """
+    Fetch `urls` and parse every page.
+
+    `on_result(index, url, result, error, done)` is called in the event
+    loop as each URL finishes, in completion order. `index` is the URL's
+    position in `urls`.
+
+    Args:
+        urls: Page URLs
+        fetch: Coroutine function returning a URL's page as bytes
+        parse: Picklable function turning a page's text into a result
+        on_result: Callback for each finished URL
+        concurrency: Maximum concurrent fetches
+        pool: Executor from start_parse_pool, None parses in this process
+        parse_workers: The pool's processes, pages parsed at once
+        queue_size: Capacity of the parse queue (defaults to twice the
+            parse workers)
+        limiter: The HostRateLimiter `fetch` waits for, if any. Its waits
+            are reported as throttled time instead of fetch time.
+
+    Returns:
+        PipelineStats: Per-stage counts and utilization
+    """
+    if pool is None:
+        parse_workers = 1
+    fetch_stats = StageStats("fetch", concurrency)
+    parse_stats = StageStats("parse", parse_workers)
+    stats = PipelineStats(stages=[fetch_stats, parse_stats])
+    pages = asyncio.Queue(maxsize=queue_size or 2 * parse_workers)
+    pending = iter(enumerate(urls))
+    done = 0
+    loop = asyncio.get_running_loop()
+    waited = limiter.waited if limiter is not None else 0.0
+
+    def finish(idx, url, result, error):
+        nonlocal done
+        done += 1
+        try:
+            on_result(idx, url, result, error, done)
+        except Exception as e:
+            # A dead parse task would leave the fetchers waiting on a full
+            # queue, so the URL is only reported lost
+            print(f"Unable to handle the result for {url}: {e}")
+
+    async def fetch_worker():
+        for idx, url in pending:
+            start = time.perf_counter()
+            try:
+                raw = await fetch(url)
+            except Exception as e:
+                fetch_stats.busy += time.perf_counter() - start
+                fetch_stats.failed += 1
+                finish(idx, url, None, e)
+                continue
+            fetch_stats.busy += time.perf_counter() - start
+            fetch_stats.processed += 1
+
+            start = time.perf_counter()
+            await pages.put((idx, url, raw))
+            fetch_stats.blocked += time.perf_counter() - start
+            stats.peak_queued = max(stats.peak_queued, pages.qsize())
+
+    async def parse_worker():
+        while True:
+            job = await pages.get()
+            if job is None:
+                return
+            idx, url, raw = job
+            if pool is None:
+                result, error, elapsed = _parse(parse, raw)
+            else:
+                try:
+                    result, error, elapsed = await loop.run_in_executor(
+                        pool, _parse, parse, raw
+                    )
+                except Exception as e:
+                    # E.g. a crashed pool; failing the page keeps the
+                    # fetchers from waiting on a queue nobody empties
+                    result, error, elapsed = None, e, 0.0
+            parse_stats.busy += elapsed
+            if error is None:
+                parse_stats.processed += 1
+            else:
+                parse_stats.failed += 1
+            finish(idx, url, result, error)
+
+    start = time.perf_counter()
+    parsers = [
+        asyncio.create_task(parse_worker()) for _ in range(parse_workers)
+    ]
+    await asyncio.gather(*(fetch_worker() for _ in range(concurrency)))
+    for _ in parsers:
+        await pages.put(None)
+    await asyncio.gather(*parsers)
+    stats.elapsed = time.perf_counter() - start
+    if limiter is not None:
+        fetch_stats.throttled = limiter.waited - waited
+        fetch_stats.busy = max(0.0, fetch_stats.busy - fetch_stats.throttled)
+    return stats
@@ -1,135 +1,201 @@
-import json
+import argparse
+import asyncio
 import os
-import re
-import time
-from datetime import datetime, UTC
+from datetime import UTC, datetime
 from typing import Optional
 
 import httpx
 import pandas as pd
 
-from common import fetch_page_source
+from common import (
+    DEFAULT_CONCURRENCY,
+    HostRateLimiter,
+    add_client_arguments,
+    afetch_page_source,
+    create_async_client,
+)
+from field_paths import Field, compile_field, compile_path, compile_schema
+from page_pipeline import (
+    add_pipeline_arguments,
+    fetch_and_parse,
+    start_parse_pool,
+)
+from yt_extract import extract_json
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
+# Top-level members of the page objects extract_details reads
+PLAYER_RESPONSE_KEYS = ("videoDetails", "microformat", "streamingData")
+INITIAL_DATA_KEYS = ("engagementPanels",)
+
+# Output columns and where they are in ytInitialPlayerResponse. The
+# columns set to None are filled in by extract_details.
+VIDEO_DETAILS_SCHEMA = compile_schema(
+    {
+        "video_id": "videoDetails.videoId",
+        "title": "videoDetails.title",
+        "description": "videoDetails.shortDescription",
+        "channel_id": "videoDetails.channelId",
+        "channel_name": "videoDetails.author",
+        # Engagement metrics from microformat
+        "views": Field("microformat.playerMicroformatRenderer.viewCount", "0"),
+        "likes": Field("microformat.playerMicroformatRenderer.likeCount", "0"),
+        "comments": None,
+        "length_seconds": Field("videoDetails.lengthSeconds", "0"),
+        "keywords": Field("videoDetails.keywords", convert=", ".join),
+        "category": "microformat.playerMicroformatRenderer.category",
+        "publish_date": "microformat.playerMicroformatRenderer.publishDate",
+        "upload_date": "microformat.playerMicroformatRenderer.uploadDate",
+        "is_unlisted": Field(
+            "microformat.playerMicroformatRenderer.isUnlisted", False
+        ),
+        "max_quality": None,
+        "max_fps": None,
+    }
+)
+ADAPTIVE_FORMATS = compile_field(Field("streamingData.adaptiveFormats", []))
+
+# Engagement panel headers in ytInitialData, and their title and count
+PANEL_HEADERS = compile_path(
+    "engagementPanels[*].engagementPanelSectionListRenderer.header"
+    ".engagementPanelTitleHeaderRenderer"
+)
+PANEL_HEADER_SCHEMA = compile_schema(
+    {
+        "title": Field("title.runs[0].text", None),
+        "count": Field("contextualInfo.runs[0].text", None),
+    }
+)
+
+
 def extract_details(page_source: str) -> Optional[dict]:
-    # Extract ytInitialPlayerResponse JSON object
-    player_response_match = re.search(
-        r"var ytInitialPlayerResponse\s*=\s*({.+?});", page_source, re.DOTALL
+    # Extract the needed parts of the ytInitialPlayerResponse JSON object
+    player_data = extract_json(
+        page_source, "ytInitialPlayerResponse", PLAYER_RESPONSE_KEYS
     )
 
-    if not player_response_match:
+    if player_data is None:
         raise ValueError(
             "Could not find ytInitialPlayerResponse in page source"
         )
 
-    player_data = json.loads(player_response_match.group(1))
-
-    # Extract ytInitialData JSON object for engagement panels
-    initial_data_match = re.search(
-        r"var ytInitialData\s*=\s*({.+?});", page_source, re.DOTALL
-    )
-
     comments_count = None
-    if initial_data_match:
-        try:
-            initial_data = json.loads(initial_data_match.group(1))
-
-            # Navigate through the JSON structure to find engagement panels
-            engagement_panels = initial_data.get("engagementPanels", [])
-
-            # Find the comments panel
-            for panel in engagement_panels:
-                panel_renderer = panel.get(
-                    "engagementPanelSectionListRenderer", {}
-                )
-                header = panel_renderer.get("header", {})
-                title_header = header.get(
-                    "engagementPanelTitleHeaderRenderer", {}
-                )
-
-                # Check if this is the comments panel
-                title = title_header.get("title", {})
-                title_runs = title.get("runs", [])
-
-                if title_runs and title_runs[0].get("text") == "Comments":
-                    # Extract comment count from contextualInfo
-                    contextual_info = title_header.get("contextualInfo", {})
-                    info_runs = contextual_info.get("runs", [])
-                    if info_runs:
-                        comments_count = info_runs[0].get("text", "0")
-                    break
-        except Exception:
-            # If parsing fails, keep default value
-            pass
-
-    # Extract video details
-    video_details = player_data.get("videoDetails", {})
-    microformat = player_data.get("microformat", {}).get(
-        "playerMicroformatRenderer", {}
-    )
+    try:
+        # Extract ytInitialData engagement panels
+        initial_data = (
+            extract_json(page_source, "ytInitialData", INITIAL_DATA_KEYS) or {}
+        )
 
-    # Extract data
-    video_id = video_details.get("videoId", "")
-    title = video_details.get("title", "")
-    description = video_details.get("shortDescription", "")
-    length_seconds = video_details.get("lengthSeconds", "0")
-    keywords = ", ".join(video_details.get("keywords", []))
-    channel_id = video_details.get("channelId", "")
-    channel_name = video_details.get("author", "")
-
-    # Engagement metrics from microformat
-    view_count = microformat.get("viewCount", "0")
-    like_count = microformat.get("likeCount", "0")
-
-    # Additional metadata
-    category = microformat.get("category", "")
-    publish_date = microformat.get("publishDate", "")
-    upload_date = microformat.get("uploadDate", "")
-    is_unlisted = microformat.get("isUnlisted", False)
-
-    # Video quality info
-    formats = player_data.get("streamingData", {}).get("formats", [])
-    adaptive_formats = player_data.get("streamingData", {}).get(
-        "adaptiveFormats", []
-    )
+        # The comments panel header holds the comment count
+        for header in PANEL_HEADERS(initial_data):
+            panel = PANEL_HEADER_SCHEMA(header)
+            if panel["title"] == "Comments":
+                comments_count = panel["count"]
+                break
+    except Exception:
+        # If parsing fails, keep default value
+        pass
+
+    details = VIDEO_DETAILS_SCHEMA(player_data)
 
     # Get highest quality video format
     max_quality = ""
     max_fps = 0
-    if adaptive_formats:
-        for fmt in adaptive_formats:
-            if "qualityLabel" in fmt:
-                quality_label = fmt.get("qualityLabel", "")
-                fps = fmt.get("fps", 0)
-                if fps > max_fps or (
-                    fps == max_fps and quality_label > max_quality
-                ):
-                    max_quality = quality_label
-                    max_fps = fps
-
-    return {
-        "video_id": video_id,
-        "title": title,
-        "description": description,
-        "channel_id": channel_id,
-        "channel_name": channel_name,
-        "views": view_count,
-        "likes": like_count,
-        "comments": comments_count,
-        "length_seconds": length_seconds,
-        "keywords": keywords,
-        "category": category,
-        "publish_date": publish_date,
-        "upload_date": upload_date,
-        "is_unlisted": is_unlisted,
-        "max_quality": max_quality,
-        "max_fps": max_fps,
-    }
+    for fmt in ADAPTIVE_FORMATS(player_data):
+        if "qualityLabel" in fmt:
+            quality_label = fmt.get("qualityLabel", "")
+            fps = fmt.get("fps", 0)
+            if fps > max_fps or (
+                fps == max_fps and quality_label > max_quality
+            ):
+                max_quality = quality_label
+                max_fps = fps
+
+    details["comments"] = comments_count
+    details["max_quality"] = max_quality
+    details["max_fps"] = max_fps
+    return details
+
+
+async def scrape_urls(
+    urls,
+    concurrency,
+    limiter,
+    on_result,
+    pool=None,
+    parse_workers=1,
+    **client_options,
+):
+    """
+    Fetch `urls` with up to `concurrency` requests in flight and run
+    extract_details on the pages in `pool`.
+
+    `on_result(index, url, details, error, done)` is called as each URL
+    finishes. That happens in completion order; `index` is the URL's
+    position in `urls`, so callers can restore the input order.
+
+    Args:
+        urls: Video page URLs
+        concurrency: Maximum concurrent requests
+        limiter: HostRateLimiter pacing the requests
+        on_result: Callback for each finished URL
+        pool: Parse process pool from start_parse_pool, None parses in
+            this process
+        parse_workers: Processes in `pool`
+        **client_options: Passed on to create_async_client
+
+    Returns:
+        PipelineStats: Fetch and parse stage utilization
+    """
+    async with create_async_client(**client_options) as client:
+
+        async def fetch(url):
+            return await afetch_page_source(
+                url, client, limiter=limiter, raw=True
+            )
+
+        return await fetch_and_parse(
+            urls,
+            fetch,
+            extract_details,
+            on_result,
+            concurrency,
+            pool,
+            parse_workers,
+            limiter=limiter,
+        )
+
+
+def describe_outcome(url, details, error):
+    """
+    Print how a URL went.
+
+    Returns:
+        dict: The failed-URL record, None on success
+    """
+    if error is None:
+        if details:
+            print(f"  ✓ Extracted: {details['title'][:50]}...")
+            return None
+        print("  ✗ Failed to extract details")
+        return {"url": url, "error": "Extraction failed"}
+    if isinstance(error, httpx.TimeoutException):
+        print("  ✗ Timeout error - skipping")
+        return {"url": url, "error": "Timeout"}
+    if isinstance(error, httpx.HTTPStatusError):
+        print(f"  ✗ HTTP {error.response.status_code} error - skipping")
+        return {"url": url, "error": f"HTTP {error.response.status_code}"}
+    print(f"  ✗ Error: {str(error)[:100]} - skipping")
+    return {"url": url, "error": str(error)[:200]}
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Scrape YouTube video pages")
+    add_client_arguments(parser)
+    add_pipeline_arguments(parser, DEFAULT_CONCURRENCY)
+    args = parser.parse_args()
+
     start_ts = datetime.now(UTC).isoformat()
     print(f"Starting at {start_ts}")
 
@@ -143,7 +209,8 @@ def main():
         if "url" not in urls_df.columns:
             raise ValueError("CSV file must contain a 'url' column")
         urls = urls_df["url"].tolist()
-        urls = list(set(urls))
+        # Drop repeats but keep the file order, so runs are reproducible
+        urls = list(dict.fromkeys(urls))
     except FileNotFoundError:
         print("Error: urls.csv file not found")
         print(
@@ -181,40 +248,24 @@ def main():
         "description",
     ]
 
-    results = []
-    failed_urls = []
+    results_by_index = {}
+    failed_by_index = {}
     save_interval = 10  # Save progress every N URLs
 
-    for idx, url in enumerate(urls, 1):
-        print(f"[{idx}/{len(urls)}] Fetching: {url}")
-
-        try:
-            page_source = fetch_page_source(url)
-            details = extract_details(page_source)
-
-            if details:
-                details["url"] = url
-                results.append(details)
-                print(f"  ✓ Extracted: {details['title'][:50]}...")
-            else:
-                print("  ✗ Failed to extract details")
-                failed_urls.append({"url": url, "error": "Extraction failed"})
-
-        except httpx.TimeoutException:
-            print("  ✗ Timeout error - skipping")
-            failed_urls.append({"url": url, "error": "Timeout"})
-        except httpx.HTTPStatusError as e:
-            print(f"  ✗ HTTP {e.response.status_code} error - skipping")
-            failed_urls.append(
-                {"url": url, "error": f"HTTP {e.response.status_code}"}
-            )
-        except Exception as e:
-            print(f"  ✗ Error: {str(e)[:100]} - skipping")
-            failed_urls.append({"url": url, "error": str(e)[:200]})
+    def handle(idx, url, details, error, done):
+        print(f"[{done}/{len(urls)}] Fetched: {url}")
+        failed = describe_outcome(url, details, error)
+        if failed is None:
+            details["url"] = url
+            results_by_index[idx] = details
+        else:
+            failed_by_index[idx] = failed
 
         # Periodic saving to prevent data loss
-        if results and idx % save_interval == 0:
-            temp_df = pd.DataFrame(results)
+        if results_by_index and done % save_interval == 0:
+            temp_df = pd.DataFrame(
+                [results_by_index[i] for i in sorted(results_by_index)]
+            )
             temp_df = (
                 temp_df[column_order]
                 if all(col in temp_df.columns for col in column_order)
@@ -226,12 +277,32 @@ def main():
             os.makedirs(os.path.dirname(output_file), exist_ok=True)
             temp_df.to_csv(output_file, index=False)
             print(
-                f"  💾 Progress saved ({len(results)} videos to {output_file})"
+                f"  💾 Progress saved ({len(temp_df)} videos to {output_file})"
+            )
+
+    # The limiter paces requests per host instead of a fixed sleep
+    limiter = HostRateLimiter(args.rate)
+    client_options = dict(
+        http2=args.http2, max_connections=args.max_connections
+    )
+    with start_parse_pool(args.parse_workers) as pool:
+        stats = asyncio.run(
+            scrape_urls(
+                urls,
+                args.concurrency,
+                limiter,
+                handle,
+                pool,
+                args.parse_workers,
+                **client_options,
             )
+        )
+    print("\nPipeline:")
+    print(stats.summary())
 
-        # Small delay to avoid rate limiting
-        if idx < len(urls):
-            time.sleep(1)
+    # Input order, however the fetches finished
+    results = [results_by_index[i] for i in sorted(results_by_index)]
+    failed_urls = [failed_by_index[i] for i in sorted(failed_by_index)]
 
     # Save successful results
     if results:
@@ -1,135 +1,151 @@
-import json
+import argparse
+import asyncio
 import os
-import re
-import time
 from datetime import UTC, datetime
-from typing import Dict, List
+from typing import Dict, List, Optional
 from urllib.parse import quote_plus
 
+import httpx
 import pandas as pd
-from common import fetch_page_source
+
+from common import (
+    DEFAULT_CONCURRENCY,
+    HostRateLimiter,
+    add_client_arguments,
+    afetch_page_source,
+    create_async_client,
+    fetch_page_source,
+)
+from field_paths import Field, compile_path, compile_schema
+from page_pipeline import (
+    add_pipeline_arguments,
+    fetch_and_parse,
+    start_parse_pool,
+)
+from yt_extract import extract_json
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# Every videoRenderer of the search results
+SEARCH_VIDEO_RENDERERS = compile_path(
+    "contents.twoColumnSearchResultsRenderer.primaryContents"
+    ".sectionListRenderer.contents[*].itemSectionRenderer.contents[*]"
+    ".videoRenderer"
+)
+
+# Output columns and where they are in a videoRenderer
+SEARCH_VIDEO_SCHEMA = compile_schema(
+    {
+        "video_id": "videoId",
+        # Set by extract_video_data_from_search
+        "url": None,
+        "title": "title.runs[0].text",
+        "channel_name": "ownerText.runs[0].text",
+        "view_count": (
+            "viewCountText.simpleText",
+            "viewCountText.runs[0].text",
+        ),
+        "published_time": "publishedTimeText.simpleText",
+        "length": "lengthText.simpleText",
+        "thumbnail_url": "thumbnail.thumbnails[-1].url",
+        "description_snippet": Field(
+            "detailedMetadataSnippets[0].snippetText.runs[*].text",
+            convert="".join,
+        ),
+        # Badges such as LIVE or NEW
+        "badges": Field(
+            "badges[*].metadataBadgeRenderer.label", convert=", ".join
+        ),
+    }
+)
+
 
 def extract_video_data_from_search(page_source: str) -> List[Dict]:
     """Extract video URLs and metadata from YouTube search results page."""
-    initial_data_match = re.search(
-        r"var ytInitialData\s*=\s*({.+?});", page_source, re.DOTALL
-    )
-
-    if not initial_data_match:
+    try:
+        initial_data = extract_json(page_source, "ytInitialData", ("contents",))
+    except ValueError:
         return []
 
-    try:
-        initial_data = json.loads(initial_data_match.group(1))
-    except json.JSONDecodeError:
+    if not initial_data:
         return []
 
     videos = []
+    for renderer in SEARCH_VIDEO_RENDERERS(initial_data):
+        video = SEARCH_VIDEO_SCHEMA(renderer)
+        video_id = video["video_id"]
+        if not video_id:
+            continue
+        video["url"] = f"https://www.youtube.com/watch?v={video_id}"
+        videos.append(video)
 
-    # Navigate to search results
-    contents = (
-        initial_data.get("contents", {})
-        .get("twoColumnSearchResultsRenderer", {})
-        .get("primaryContents", {})
-        .get("sectionListRenderer", {})
-        .get("contents", [])
-    )
-
-    for content in contents:
-        item_section = content.get("itemSectionRenderer", {})
-        items = item_section.get("contents", [])
-
-        for item in items:
-            # Check for video renderer
-            video_renderer = item.get("videoRenderer")
-            if not video_renderer:
-                continue
-
-            video_id = video_renderer.get("videoId", "")
-            if not video_id:
-                continue
-
-            # Extract title
-            title_runs = video_renderer.get("title", {}).get("runs", [])
-            title = title_runs[0].get("text", "") if title_runs else ""
-
-            # Extract channel name
-            owner_text = video_renderer.get("ownerText", {}).get("runs", [])
-            channel_name = owner_text[0].get("text", "") if owner_text else ""
-
-            # Extract view count
-            view_count_text = video_renderer.get("viewCountText", {})
-            view_count = view_count_text.get("simpleText", "")
-            if not view_count:
-                runs = view_count_text.get("runs", [])
-                view_count = runs[0].get("text", "") if runs else ""
-
-            # Extract published time
-            published_time_text = video_renderer.get("publishedTimeText", {})
-            published_time = published_time_text.get("simpleText", "")
-
-            # Extract length
-            length_text = video_renderer.get("lengthText", {})
-            length = length_text.get("simpleText", "")
-
-            # Extract thumbnail
-            thumbnails = video_renderer.get("thumbnail", {}).get(
-                "thumbnails", []
-            )
-            thumbnail_url = thumbnails[-1].get("url", "") if thumbnails else ""
+    return videos
 
-            # Extract description snippet
-            description_snippet = video_renderer.get(
-                "detailedMetadataSnippets", []
-            )
-            description = ""
-            if description_snippet:
-                snippet_runs = (
-                    description_snippet[0]
-                    .get("snippetText", {})
-                    .get("runs", [])
-                )
-                description = "".join(
-                    [run.get("text", "") for run in snippet_runs]
-                )
-
-            # Extract badges (e.g., LIVE, NEW, etc.)
-            badges = video_renderer.get("badges", [])
-            badge_labels = []
-            for badge in badges:
-                label = badge.get("metadataBadgeRenderer", {}).get("label", "")
-                if label:
-                    badge_labels.append(label)
-
-            video_url = f"https://www.youtube.com/watch?v={video_id}"
-
-            videos.append(
-                {
-                    "video_id": video_id,
-                    "url": video_url,
-                    "title": title,
-                    "channel_name": channel_name,
-                    "view_count": view_count,
-                    "published_time": published_time,
-                    "length": length,
-                    "thumbnail_url": thumbnail_url,
-                    "description_snippet": description,
-                    "badges": ", ".join(badge_labels),
-                }
+
+def get_search_url(query: str) -> str:
+    encoded_query = quote_plus(query)
+    return f"https://www.youtube.com/results?search_query={encoded_query}"
+
+
+async def search_queries(
+    queries,
+    concurrency,
+    limiter,
+    on_result,
+    pool=None,
+    parse_workers=1,
+    **client_options,
+):
+    """
+    Fetch the search pages of `queries` and run
+    extract_video_data_from_search on them in `pool`.
+
+    `on_result(index, url, videos, error, done)` is called as each query
+    finishes, in completion order; `index` is the query's position in
+    `queries`.
+
+    Args:
+        queries: Search queries
+        concurrency: Maximum concurrent requests
+        limiter: HostRateLimiter pacing the requests
+        on_result: Callback for each finished query
+        pool: Parse process pool from start_parse_pool, None parses in
+            this process
+        parse_workers: Processes in `pool`
+        **client_options: Passed on to create_async_client
+
+    Returns:
+        PipelineStats: Fetch and parse stage utilization
+    """
+    async with create_async_client(**client_options) as client:
+
+        async def fetch(url):
+            return await afetch_page_source(
+                url, client, limiter=limiter, raw=True
             )
 
-    return videos
+        return await fetch_and_parse(
+            [get_search_url(query) for query in queries],
+            fetch,
+            extract_video_data_from_search,
+            on_result,
+            concurrency,
+            pool,
+            parse_workers,
+            limiter=limiter,
+        )
 
 
-def search_youtube(query: str) -> List[Dict]:
+def search_youtube(
+    query: str,
+    client: Optional[httpx.Client] = None,
+    limiter: Optional[HostRateLimiter] = None,
+) -> List[Dict]:
     """Search YouTube and return video metadata."""
-    encoded_query = quote_plus(query)
-    search_url = f"https://www.youtube.com/results?search_query={encoded_query}"
-
     try:
-        page_source = fetch_page_source(search_url)
+        page_source = fetch_page_source(
+            get_search_url(query), client=client, limiter=limiter
+        )
         videos = extract_video_data_from_search(page_source)
         return videos
     except Exception as e:
@@ -138,6 +154,12 @@ def search_youtube(query: str) -> List[Dict]:
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Search YouTube videos")
+    # One search every 2 seconds, as before
+    add_client_arguments(parser, rate=0.5)
+    add_pipeline_arguments(parser, DEFAULT_CONCURRENCY)
+    args = parser.parse_args()
+
     start_ts = datetime.now(UTC).isoformat()
     print(f"Starting at {start_ts}")
 
@@ -166,32 +188,49 @@ def main():
 
     print(f"Found {len(queries)} search queries to process\n")
 
-    all_results = []
-    failed_queries = []
-
-    for idx, query in enumerate(queries, 1):
-        print(f"[{idx}/{len(queries)}] Searching: {query}")
-
-        try:
-            videos = search_youtube(query)
-
-            if videos:
-                # Add search query to each result
-                for video in videos:
-                    video["search_query"] = query
-                all_results.extend(videos)
-                print(f"  ✓ Found {len(videos)} videos")
-            else:
-                print("  ⚠ No videos found")
-                failed_queries.append({"query": query, "error": "No results"})
-
-        except Exception as e:
-            print(f"  ✗ Error: {str(e)[:100]}")
-            failed_queries.append({"query": query, "error": str(e)[:200]})
-
-        # Delay to avoid rate limiting
-        if idx < len(queries):
-            time.sleep(2)
+    results_by_index = {}
+    failed_by_index = {}
+
+    def handle(idx, url, videos, error, done):
+        query = queries[idx]
+        print(f"[{done}/{len(queries)}] Searched: {query}")
+        if error is not None:
+            print(f"  ✗ Error: {str(error)[:100]}")
+            failed_by_index[idx] = {"query": query, "error": str(error)[:200]}
+        elif videos:
+            # Add search query to each result
+            for video in videos:
+                video["search_query"] = query
+            results_by_index[idx] = videos
+            print(f"  ✓ Found {len(videos)} videos")
+        else:
+            print("  ⚠ No videos found")
+            failed_by_index[idx] = {"query": query, "error": "No results"}
+
+    limiter = HostRateLimiter(args.rate)
+    with start_parse_pool(args.parse_workers) as pool:
+        stats = asyncio.run(
+            search_queries(
+                queries,
+                args.concurrency,
+                limiter,
+                handle,
+                pool,
+                args.parse_workers,
+                http2=args.http2,
+                max_connections=args.max_connections,
+            )
+        )
+    print("\nPipeline:")
+    print(stats.summary())
+
+    # Query order, however the searches finished
+    all_results = [
+        video
+        for idx in sorted(results_by_index)
+        for video in results_by_index[idx]
+    ]
+    failed_queries = [failed_by_index[i] for i in sorted(failed_by_index)]
 
     # Save results
     if all_results:
@@ -0,0 +1,98 @@
+"""
+Targeted extraction of the JSON objects YouTube embeds in its pages.
+
+Watch and search pages assign `ytInitialPlayerResponse` and
+`ytInitialData` in inline scripts, e.g. `var ytInitialData = {...};`.
+The assignment is located with `str.find` and the object is decoded from
+its opening brace with `JSONDecoder.raw_decode`. That decoder scans
+string literals and balanced braces in C and stops at the object's
+closing brace, so `};` inside a string cannot cut the object short and the
+rest of the page is never looked at.
+
+With `keys`, the object's top-level members are decoded one at a time and
+only the requested ones are kept, stopping as soon as all of them are
+found.
+"""
+
+import json
+import re
+from typing import Optional
+
+_WHITESPACE = re.compile(r"\s*")
+
+_decoder = json.JSONDecoder()
+
+
+def _assignment_markers(name):
+    return (f"var {name}", f'window["{name}"]', name)
+
+
+def find_object_start(page: str, name: str) -> Optional[int]:
+    """Index of the `{` that opens the object assigned to `name`, or None."""
+    for marker in _assignment_markers(name):
+        pos = page.find(marker)
+        while pos != -1:
+            end = _WHITESPACE.match(page, pos + len(marker)).end()
+            if page.startswith("=", end):
+                start = _WHITESPACE.match(page, end + 1).end()
+                if page.startswith("{", start):
+                    return start
+            pos = page.find(marker, pos + 1)
+    return None
+
+
+def iter_members(text: str, start: int):
+    """
+    Yield (key, value) for each member of the object opening at
+    `text[start]`, decoding one member at a time.
+    """
+    pos = _WHITESPACE.match(text, start + 1).end()
+    if text.startswith("}", pos):
+        return
+    while True:
+        key, pos = _decoder.raw_decode(text, pos)
+        if not isinstance(key, str):
+            raise ValueError(f"Expected an object key before {pos}")
+        pos = _WHITESPACE.match(text, pos).end()
+        if not text.startswith(":", pos):
+            raise ValueError(f"Expected ':' at {pos}")
+        pos = _WHITESPACE.match(text, pos + 1).end()
+        value, pos = _decoder.raw_decode(text, pos)
+        yield key, value
+        pos = _WHITESPACE.match(text, pos).end()
+        if text.startswith("}", pos):
+            return
+        if not text.startswith(",", pos):
+            raise ValueError(f"Expected ',' or '}}' at {pos}")
+        pos = _WHITESPACE.match(text, pos + 1).end()
+
+
+def extract_json(page: str, name: str, keys=None) -> Optional[dict]:
+    """
+    Decode the object a page assigns to `name`.
+
+    Args:
+        page: Page HTML
+        name: Variable name, e.g. "ytInitialPlayerResponse"
+        keys: Optional top-level keys to keep; decoding stops once all of
+            them are found
+
+    Returns:
+        dict: The object (only the `keys` present, when given), or None if
+            the page has no such assignment
+    """
+    start = find_object_start(page, name)
+    if start is None:
+        return None
+    if keys is None:
+        value, _ = _decoder.raw_decode(page, start)
+        return value
+
+    wanted = set(keys)
+    found = {}
+    for key, value in iter_members(page, start):
+        if key in wanted:
+            found[key] = value
+            if len(found) == len(wanted):
+                break
+    return found